@@ -0,0 +1,41 @@
+"""
+Script for resuming the course imports that were interrupted by a worker crash.
+"""
+from datetime import datetime, timedelta
+from optparse import make_option
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from pytz import UTC
+
+from contentstore.tasks import course_import_lock_key, import_course
+from course_action_state.managers import CourseImportUIStateManager
+from course_action_state.models import CourseImportState
+
+
+class Command(BaseCommand):
+    help = '''Resume the course imports that haven't made any progress recently'''
+
+    option_list = BaseCommand.option_list + (
+        make_option('--minutes',
+                    type='int',
+                    dest='minutes',
+                    default=60,
+                    help="resume the imports whose state hasn't changed for this many minutes (default 60)"),
+    )
+
+    def handle(self, *args, **options):
+        stalled_imports = CourseImportState.objects.find_all(
+            state=CourseImportUIStateManager.State.IN_PROGRESS,
+            stage__gt=CourseImportUIStateManager.Stage.UPLOADING,
+            updated_time__lt=datetime.now(UTC) - timedelta(minutes=options['minutes']),
+        )
+        for import_state in stalled_imports:
+            # The state isn't updated while the course content is imported, so
+            # a long import may look stalled; its task still holds the lock.
+            if cache.get(course_import_lock_key(import_state.course_key)) is not None:
+                continue
+            self.stdout.write(
+                u"Resuming the import of {} into {}\n".format(import_state.filename, import_state.course_key)
+            )
+            import_course.delay(unicode(import_state.course_key), import_state.updated_user_id, import_state.filename)
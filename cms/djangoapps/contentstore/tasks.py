@@ -3,15 +3,29 @@ This file contains celery tasks for contentstore views
 """
 
 from celery.task import task
+from contextlib import contextmanager
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousOperation
 import json
 import logging
+import os
+import shutil
+import socket
+import tarfile
+import threading
+from path import path
+from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.course_module import CourseFields
 
 from xmodule.modulestore.exceptions import DuplicateCourseError, ItemNotFoundError
-from course_action_state.models import CourseRerunState
+from course_action_state.managers import CourseImportUIStateManager
+from course_action_state.models import CourseRerunState, CourseImportState
 from contentstore.utils import initialize_permissions
+from extract_tar import safetar_extractall
 from opaque_keys.edx.keys import CourseKey
 
 
@@ -66,3 +80,145 @@ def deserialize_fields(json_fields):
     for field_name, value in fields.iteritems():
         fields[field_name] = getattr(CourseFields, field_name).from_json(value)
     return fields
+
+
+def course_import_dir(course_key):
+    """
+    Returns the directory in which archives to import into the course are
+    uploaded and unpacked.
+    """
+    return path(settings.GITHUB_REPO_ROOT) / "{0}-{1}-{2}".format(course_key.org, course_key.course, course_key.run)
+
+
+def find_course_xml_dir(directory):
+    """
+    Returns the path of the first directory under `directory` that contains
+    a course.xml file, or None if there isn't any.
+    """
+    for dirpath, _dirnames, filenames in os.walk(directory):
+        if "course.xml" in filenames:
+            return dirpath
+    return None
+
+
+# A running import holds its course's import lock, refreshing it every
+# COURSE_IMPORT_HEARTBEAT seconds. If the worker dies the lock expires, and
+# the import can be resumed by another task.
+COURSE_IMPORT_LOCK_TIMEOUT = 5 * 60
+COURSE_IMPORT_HEARTBEAT = 60
+
+
+def course_import_lock_key(course_key):
+    """
+    Returns the cache key of the lock held while importing into the course.
+    """
+    return u"course-import-lock-{}".format(course_key)
+
+
+@contextmanager
+def course_import_lock(course_key):
+    """
+    Context manager that takes the course's import lock for the duration of
+    the block, and yields whether it could. The lock is kept alive by a
+    heartbeat thread, so it is only lost if the worker process dies.
+    """
+    lock_key = course_import_lock_key(course_key)
+    owner = u"{}:{}".format(socket.gethostname(), os.getpid())
+    if not cache.add(lock_key, owner, COURSE_IMPORT_LOCK_TIMEOUT):
+        yield False
+        return
+
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(COURSE_IMPORT_HEARTBEAT):
+            cache.set(lock_key, owner, COURSE_IMPORT_LOCK_TIMEOUT)
+
+    heartbeat_thread = threading.Thread(target=heartbeat, name=u"import heartbeat {}".format(course_key))
+    heartbeat_thread.daemon = True
+    heartbeat_thread.start()
+    try:
+        yield True
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+        cache.delete(lock_key)
+
+
+@task()
+def import_course(course_key_string, user_id, filename):
+    """
+    Imports the uploaded archive `filename` into the course in a new celery task.
+
+    Each stage of the import is recorded in the course's CourseImportState. If
+    a worker dies during the import, running the task again resumes it: the
+    archive isn't unpacked again if that stage was completed. Only one task
+    at a time imports into a course; any other returns without doing anything.
+    """
+    course_key = CourseKey.from_string(course_key_string)
+    with course_import_lock(course_key) as locked:
+        if not locked:
+            logging.info(u"Course import %s: Already being imported by another task", course_key)
+            return "already running"
+        return _import_course(course_key, user_id, filename)
+
+
+def _import_course(course_key, user_id, filename):
+    """
+    Runs the remaining stages of the import of `filename` into the course,
+    while holding the course's import lock.
+    """
+    course_dir = course_import_dir(course_key)
+    stage = CourseImportState.objects.find_first(course_key=course_key).stage
+    if stage < CourseImportUIStateManager.Stage.UNPACKING or stage == CourseImportUIStateManager.Stage.SUCCEEDED:
+        # still uploading, failed, or already imported
+        return "not in progress"
+
+    try:
+        if stage == CourseImportUIStateManager.Stage.UNPACKING:
+            tar_file = tarfile.open(course_dir / filename)
+            try:
+                safetar_extractall(tar_file, (course_dir + '/').encode('utf-8'))
+            finally:
+                tar_file.close()
+            logging.info(u"Course import %s: Uploaded file extracted", course_key)
+
+        CourseImportState.objects.started_stage(course_key, CourseImportUIStateManager.Stage.VERIFYING)
+        dirpath = find_course_xml_dir(course_dir)
+        if not dirpath:
+            CourseImportState.objects.failed(course_key, message="Could not find the course.xml file in the package.")
+            return "missing course.xml"
+
+        CourseImportState.objects.started_stage(course_key, CourseImportUIStateManager.Stage.UPDATING)
+        import_from_xml(
+            modulestore(),
+            user_id,
+            settings.GITHUB_REPO_ROOT,
+            [os.path.relpath(dirpath, settings.GITHUB_REPO_ROOT)],
+            load_error_modules=False,
+            static_content_store=contentstore(),
+            target_course_id=course_key,
+        )
+        logging.info(u"Course import %s: Course import successful", course_key)
+
+        # update state: Succeeded
+        CourseImportState.objects.succeeded(course_key)
+        result = "succeeded"
+
+    except SuspiciousOperation as exc:
+        CourseImportState.objects.failed(course_key, message=u"Unsafe tar file. Aborting import. " + exc.args[0])
+        result = "unsafe tar file"
+
+    # catch all exceptions so we can update the state and properly cleanup the files.
+    except Exception as exc:  # pylint: disable=broad-except
+        # update state: Failed
+        CourseImportState.objects.failed(course_key)
+        logging.exception(u'Course Import Error')
+        result = "exception: " + unicode(exc)
+
+    # clean up the uploaded archive and the unpacked course however the import ended
+    finally:
+        if course_dir.isdir():
+            shutil.rmtree(course_dir)
+            logging.info(u"Course import %s: Temp data cleared", course_key)
+    return result
@@ -26,15 +26,18 @@ from xmodule.exceptions import SerializationError
 from xmodule.modulestore.django import modulestore
 from opaque_keys.edx.keys import CourseKey
 from xmodule.modulestore.xml_importer import import_from_xml
-from xmodule.modulestore.xml_exporter import export_to_xml
+from xmodule.modulestore.xml_exporter import export_to_xml, export_to_tar_stream
 
 from .access import has_course_access
 
+from course_action_state.managers import CourseActionStateItemNotFoundError, CourseImportUIStateManager
+from course_action_state.models import CourseImportState
 from extract_tar import safetar_extractall
 from student import auth
 from student.roles import CourseInstructorRole, CourseStaffRole, GlobalStaff
 from util.json_request import JsonResponse
 
+from contentstore.tasks import import_course
 from contentstore.utils import reverse_course_url, reverse_usage_url
 
 
@@ -108,6 +111,17 @@ def import_handler(request, course_key_string):
                 # stream out the uploaded files in chunks to disk
                 if int(content_range['start']) == 0:
                     mode = "wb+"
+                    if settings.FEATURES.get('ENABLE_ASYNC_COURSE_IMPORT', False):
+                        # The archive of an import in progress mustn't be overwritten
+                        if _import_in_progress(course_key):
+                            return JsonResponse(
+                                {
+                                    'ErrMsg': _('An import of this course is already in progress.'),
+                                    'Stage': -1
+                                },
+                                status=409
+                            )
+                        CourseImportState.objects.initiated(course_key, request.user, filename)
                 else:
                     mode = "ab+"
                     size = os.path.getsize(temp_filepath)
@@ -169,6 +183,28 @@ def import_handler(request, course_key_string):
                     status=400
                 )
 
+            if settings.FEATURES.get('ENABLE_ASYNC_COURSE_IMPORT', False):
+                # This was the last chunk: unpack and import it in a celery task,
+                # whose progress is reported by import_status_handler.
+                log.info("Course import {0}: Upload complete".format(course_key))
+                CourseImportState.objects.started_stage(course_key, CourseImportUIStateManager.Stage.UNPACKING)
+                try:
+                    import_course.delay(unicode(course_key), request.user.id, filename)
+                except Exception as exception:  # pylint: disable=broad-except
+                    # Don't leave an import in progress that no task will ever run
+                    log.exception("Course import {0}: Could not queue the import".format(course_key))
+                    CourseImportState.objects.failed(course_key)
+                    if course_dir.isdir():
+                        shutil.rmtree(course_dir)
+                    return JsonResponse(
+                        {
+                            'ErrMsg': str(exception),
+                            'Stage': -1
+                        },
+                        status=500
+                    )
+                return JsonResponse({'Status': 'Queued'})
+
             # try-finally block for proper clean up after receiving last chunk.
             try:
                 # This was the last chunk.
@@ -283,6 +319,17 @@ def import_handler(request, course_key_string):
         return HttpResponseNotFound()
 
 
+def _import_in_progress(course_key):
+    """
+    Returns whether an uploaded archive is being imported into the course by a celery task.
+    """
+    return CourseImportState.objects.find_all(
+        course_key=course_key,
+        state=CourseImportUIStateManager.State.IN_PROGRESS,
+        stage__gt=CourseImportUIStateManager.Stage.UPLOADING,
+    ).exists()
+
+
 def _save_request_status(request, key, status):
     """
     Save import status for a course in request session
@@ -315,6 +362,13 @@ def import_status_handler(request, course_key_string, filename=None):
     if not has_course_access(request.user, course_key):
         raise PermissionDenied()
 
+    if settings.FEATURES.get('ENABLE_ASYNC_COURSE_IMPORT', False):
+        try:
+            import_state = CourseImportState.objects.find_first(course_key=course_key, filename=filename)
+            return JsonResponse({"ImportStatus": import_state.stage})
+        except CourseActionStateItemNotFoundError:
+            pass
+
     try:
         session_status = request.session["import_status"]
         status = session_status[course_key_string + filename]
@@ -355,15 +409,13 @@ def export_handler(request, course_key_string):
     export_url = reverse_course_url('export_handler', course_key) + '?_accept=application/x-tgz'
     if 'application/x-tgz' in requested_format:
         name = course_module.url_name
-        export_file = NamedTemporaryFile(prefix=name + '.', suffix=".tar.gz")
-        root_dir = path(mkdtemp())
+        stream_export = settings.FEATURES.get('ENABLE_STREAMING_COURSE_EXPORT', False)
 
         try:
-            export_to_xml(modulestore(), contentstore(), course_module.id, root_dir, name)
-
-            logging.debug(u'tar file being generated at {0}'.format(export_file.name))
-            with tarfile.open(name=export_file.name, mode='w:gz') as tar_file:
-                tar_file.add(root_dir / name, arcname=name)
+            if stream_export:
+                export_stream = export_to_tar_stream(modulestore(), contentstore(), course_module.id, name)
+            else:
+                export_file = _export_to_temp_file(course_module, name)
         except SerializationError as exc:
             log.exception(u'There was an error exporting course %s', course_module.id)
             unit = None
@@ -401,8 +453,12 @@ def export_handler(request, course_key_string):
                 'course_home_url': reverse_course_url("course_handler", course_key),
                 'export_url': export_url
             })
-        finally:
-            shutil.rmtree(root_dir / name)
+
+        if stream_export:
+            # the assets are read and compressed as the response is sent
+            response = HttpResponse(export_stream, content_type='application/x-tgz')
+            response['Content-Disposition'] = 'attachment; filename=%s' % (name + '.tar.gz').encode('utf-8')
+            return response
 
         wrapper = FileWrapper(export_file)
         response = HttpResponse(wrapper, content_type='application/x-tgz')
@@ -419,3 +475,23 @@ def export_handler(request, course_key_string):
     else:
         # Only HTML or x-tgz request formats are supported (no JSON).
         return HttpResponse(status=406)
+
+
+def _export_to_temp_file(course_module, name):
+    """
+    Exports the course to a gzipped tar archive of the directory `name`, in a
+    temporary file, and returns the file.
+    """
+    export_file = NamedTemporaryFile(prefix=name + '.', suffix=".tar.gz")
+    root_dir = path(mkdtemp())
+
+    try:
+        export_to_xml(modulestore(), contentstore(), course_module.id, root_dir, name)
+
+        logging.debug(u'tar file being generated at {0}'.format(export_file.name))
+        with tarfile.open(name=export_file.name, mode='w:gz') as tar_file:
+            tar_file.add(root_dir / name, arcname=name)
+    finally:
+        shutil.rmtree(root_dir)
+
+    return export_file
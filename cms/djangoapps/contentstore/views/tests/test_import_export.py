@@ -9,15 +9,23 @@ import shutil
 import tarfile
 import tempfile
 from path import path
+from StringIO import StringIO
 from uuid import uuid4
 
 from django.test.utils import override_settings
 from django.conf import settings
+from django.core.cache import cache
+from mock import patch
 from contentstore.utils import reverse_course_url
 
+from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.tests.factories import ItemFactory
 
+from contentstore.tasks import course_import_dir, course_import_lock_key, import_course
 from contentstore.tests.utils import CourseTestCase
+from course_action_state.managers import CourseImportUIStateManager
+from course_action_state.models import CourseImportState
 from student import auth
 from student.roles import CourseInstructorRole, CourseStaffRole
 
@@ -146,6 +154,112 @@ class ImportTestCase(CourseTestCase):
         self.assertFalse(CourseInstructorRole(self.course.id).has_user(nonstaff_user))
         self.assertTrue(CourseStaffRole(self.course.id).has_user(nonstaff_user))
 
+    def _import_status(self, tarpath):
+        """
+        Returns the import status reported for the archive at `tarpath`.
+        """
+        resp_status = self.client.get(
+            reverse_course_url(
+                'import_status_handler',
+                self.course.id,
+                kwargs={'filename': os.path.split(tarpath)[1]}
+            )
+        )
+        return json.loads(resp_status.content)["ImportStatus"]
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_COURSE_IMPORT': True})
+    def test_async_import(self):
+        """
+        Check that the import is queued in a celery task, whose progress is
+        reported by `import_status`.
+        """
+        course = self.store.get_course(self.course.id)
+        display_name_before_import = course.display_name
+
+        with open(self.good_tar) as gtar:
+            args = {"name": self.good_tar, "course-data": [gtar]}
+            resp = self.client.post(self.url, args)
+        self.assertEquals(resp.status_code, 200)
+        self.assertEquals(json.loads(resp.content)["Status"], "Queued")
+
+        # celery tasks run eagerly in tests
+        import_state = CourseImportState.objects.find_first(course_key=self.course.id)
+        self.assertEquals(import_state.state, CourseImportUIStateManager.State.SUCCEEDED)
+        self.assertEquals(import_state.filename, os.path.split(self.good_tar)[1])
+        self.assertEquals(self._import_status(self.good_tar), CourseImportUIStateManager.Stage.SUCCEEDED)
+
+        course = self.store.get_course(self.course.id)
+        self.assertNotEqual(display_name_before_import, course.display_name)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_COURSE_IMPORT': True})
+    def test_async_import_no_coursexml(self):
+        """
+        Check that an import without a course.xml fails at the verifying stage.
+        """
+        with open(self.bad_tar) as btar:
+            resp = self.client.post(self.url, {"name": self.bad_tar, "course-data": [btar]})
+        self.assertEquals(resp.status_code, 200)
+
+        import_state = CourseImportState.objects.find_first(course_key=self.course.id)
+        self.assertEquals(import_state.state, CourseImportUIStateManager.State.FAILED)
+        self.assertEquals(self._import_status(self.bad_tar), -2)
+        # the uploaded archive was cleaned up
+        self.assertFalse(course_import_dir(self.course.id).exists())
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_COURSE_IMPORT': True})
+    def test_async_import_not_queued(self):
+        """
+        Check that an import that can't be queued is marked as failed, so that
+        later uploads into the course aren't refused.
+        """
+        with patch('contentstore.views.import_export.import_course.delay', side_effect=IOError("broker down")):
+            with open(self.good_tar) as gtar:
+                resp = self.client.post(self.url, {"name": self.good_tar, "course-data": [gtar]})
+        self.assertEquals(resp.status_code, 500)
+
+        import_state = CourseImportState.objects.find_first(course_key=self.course.id)
+        self.assertEquals(import_state.state, CourseImportUIStateManager.State.FAILED)
+        self.assertFalse(course_import_dir(self.course.id).exists())
+
+        with open(self.good_tar) as gtar:
+            resp = self.client.post(self.url, {"name": self.good_tar, "course-data": [gtar]})
+        self.assertEquals(resp.status_code, 200)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_COURSE_IMPORT': True})
+    def test_async_import_already_running(self):
+        """
+        Check that a resumed import task does nothing while another task holds
+        the course's import lock.
+        """
+        lock_key = course_import_lock_key(self.course.id)
+        cache.add(lock_key, "other worker")
+        try:
+            with open(self.good_tar) as gtar:
+                resp = self.client.post(self.url, {"name": self.good_tar, "course-data": [gtar]})
+            self.assertEquals(resp.status_code, 200)
+            import_state = CourseImportState.objects.find_first(course_key=self.course.id)
+            self.assertEquals(import_state.state, CourseImportUIStateManager.State.IN_PROGRESS)
+            self.assertEquals(import_state.stage, CourseImportUIStateManager.Stage.UNPACKING)
+        finally:
+            cache.delete(lock_key)
+
+        # once the lock is released, the import can be resumed
+        result = import_course.delay(unicode(self.course.id), self.user.id, os.path.split(self.good_tar)[1])
+        self.assertEquals(result.get(), "succeeded")
+        self.assertIsNone(cache.get(lock_key))
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_COURSE_IMPORT': True})
+    def test_async_import_in_progress(self):
+        """
+        Check that a new upload is refused while an import of the course is in progress.
+        """
+        CourseImportState.objects.initiated(self.course.id, self.user, "other.tar.gz")
+        CourseImportState.objects.started_stage(self.course.id, CourseImportUIStateManager.Stage.UPDATING)
+
+        with open(self.good_tar) as gtar:
+            resp = self.client.post(self.url, {"name": self.good_tar, "course-data": [gtar]})
+        self.assertEquals(resp.status_code, 409)
+
     ## Unsafe tar methods #####################################################
     # Each of these methods creates a tarfile with a single type of unsafe
     # content.
@@ -314,3 +428,35 @@ class ExportTestCase(CourseTestCase):
         self.assertIsNone(resp.get('Content-Disposition'))
         self.assertContains(resp, 'Unable to create xml for module')
         self.assertContains(resp, expectedText)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_STREAMING_COURSE_EXPORT': True})
+    def test_export_targz_streamed(self):
+        """
+        Get a streamed tar.gz file, holding the course's xml and assets.
+        """
+        asset_key = StaticContent.compute_location(self.course.id, 'images/streamed.txt')
+        contentstore().save(
+            StaticContent(asset_key, 'streamed.txt', 'text/plain', 'streamed asset', import_path='images/streamed.txt')
+        )
+
+        resp = self.client.get(self.url, HTTP_ACCEPT='application/x-tgz')
+        self._verify_export_succeeded(resp)
+
+        name = self.course.location.name
+        with tarfile.open(mode='r:gz', fileobj=StringIO(resp.content)) as tar_file:
+            names = tar_file.getnames()
+            self.assertIn(name + '/course.xml', names)
+            self.assertIn(name + '/policies/assets.json', names)
+            asset = tar_file.extractfile(name + '/static/images/streamed.txt')
+            self.assertEquals(asset.read(), 'streamed asset')
+            policy = json.load(tar_file.extractfile(name + '/policies/assets.json'))
+            self.assertEquals(policy['images_streamed.txt']['displayname'], 'streamed.txt')
+
+    @patch.dict(settings.FEATURES, {'ENABLE_STREAMING_COURSE_EXPORT': True})
+    def test_export_failure_streamed(self):
+        """
+        Export failures are reported before a streamed export starts.
+        """
+        fake_xblock = ItemFactory.create(parent_location=self.course.location, category='aawefawef')
+        self.store.publish(fake_xblock.location, self.user.id)
+        self._verify_export_failure(u'/container/i4x://MITx/999/course/Robot_Super_Course')
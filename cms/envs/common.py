@@ -31,7 +31,7 @@ import lms.envs.common
 # Although this module itself may not use these imported variables, other dependent modules may.
 from lms.envs.common import (
     USE_TZ, TECH_SUPPORT_EMAIL, PLATFORM_NAME, BUGS_EMAIL, DOC_STORE_CONFIG, ALL_LANGUAGES, WIKI_ENABLED, MODULESTORE,
-    update_module_store_settings, ASSET_IGNORE_REGEX
+    update_module_store_settings, ASSET_IGNORE_REGEX, CONTENTSERVER_DISK_CACHE
 )
 from path import path
 from warnings import simplefilter
@@ -107,6 +107,14 @@ FEATURES = {
 
     # Modulestore to use for new courses
     'DEFAULT_STORE_FOR_NEW_COURSE': None,
+
+    # Import uploaded courses in a celery task, rather than in the upload request.
+    # The workers must share GITHUB_REPO_ROOT with the Studio servers.
+    'ENABLE_ASYNC_COURSE_IMPORT': False,
+
+    # Stream course exports to the browser as they're compressed, rather than
+    # writing them to temporary files first.
+    'ENABLE_STREAMING_COURSE_EXPORT': False,
 }
 ENABLE_JASMINE = False
 
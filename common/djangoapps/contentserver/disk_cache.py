@@ -0,0 +1,118 @@
+"""
+A bounded cache of course assets on local disk.
+
+Assets too large for memcached used to be streamed out of GridFS on every
+request. `ContentDiskCache` keeps a copy of them on the local disk of the
+app server instead, named by the md5 hash of their content, so that they're
+read from Mongo once per server (and once per version of the asset).
+"""
+import errno
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+log = logging.getLogger(__name__)
+
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class ContentDiskCache(object):
+    """
+    Stores the data of `StaticContent` under `root`, as files named by the
+    content's digest, keeping the total size of the files under `max_bytes`.
+    Files are evicted in least recently used order, approximated by their
+    modification times, which are updated whenever a file is served.
+
+    Several processes can share the same `root`: files are written to a
+    temporary file first, and moved into place once complete.
+    """
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        try:
+            os.makedirs(os.path.join(self.root, 'tmp'))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+
+    def path_for(self, digest):
+        """
+        Returns the path of the file holding the content with `digest`.
+        """
+        return os.path.join(self.root, digest)
+
+    def get(self, content):
+        """
+        Returns the path of the cached copy of `content`, or None if it isn't cached.
+        """
+        digest = getattr(content, 'content_digest', None)
+        if digest is None or not DIGEST_PATTERN.match(digest):
+            return None
+        path = self.path_for(digest)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def add(self, content):
+        """
+        Copies the data of `content` (a `StaticContentStream`) to the cache,
+        and returns the path of the copy. Returns None if `content` can't be
+        cached.
+        """
+        digest = getattr(content, 'content_digest', None)
+        if digest is None or not DIGEST_PATTERN.match(digest) or content.length > self.max_bytes:
+            return None
+
+        self._make_room(content.length)
+        path = self.path_for(digest)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                for chunk in content.stream_data():
+                    temp_file.write(chunk)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            log.exception("Unable to cache %s on disk", content.location)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return None
+        return path
+
+    def _make_room(self, size):
+        """
+        Removes the least recently used files until `size` more bytes fit in the cache.
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.root):
+                if not DIGEST_PATTERN.match(name):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except OSError:
+                    # removed by another process
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total_bytes = sum(entry_size for __, entry_size, __ in entries) + size
+            for __, entry_size, name in sorted(entries):
+                if total_bytes <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, name))
+                except OSError:
+                    pass
+                total_bytes -= entry_size
+
+    def clear(self):
+        """
+        Removes all the cached files.
+        """
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'tmp'))
@@ -1,19 +1,117 @@
+import calendar
+import hashlib
+import os
+
+from django.conf import settings
 from django.http import (
     HttpResponse, HttpResponseNotModified, HttpResponseForbidden
 )
+from django.utils.http import http_date, parse_http_date_safe
 from student.models import CourseEnrollment
 
 from xmodule.contentstore.django import contentstore
-from xmodule.contentstore.content import StaticContent, XASSET_LOCATION_TAG
+from xmodule.contentstore.content import StaticContent, StaticContentStream, XASSET_LOCATION_TAG
 from xmodule.modulestore import InvalidLocationError
 from opaque_keys import InvalidKeyError
 from opaque_keys.edx.locator import AssetLocator
 from cache_toolbox.core import get_cached_content, set_cached_content
 from xmodule.exceptions import NotFoundError
 
+from contentserver.disk_cache import ContentDiskCache
+
 # TODO: Soon as we have a reasonable way to serialize/deserialize AssetKeys, we need
 # to change this file so instead of using course_id_partial, we're just using asset keys
 
+# Content smaller than this is cached in memcached, rather than on disk
+MAX_MEMCACHED_CONTENT_SIZE = 1048576
+
+_DISK_CACHE = None
+
+
+def get_disk_cache():
+    """
+    Returns the `ContentDiskCache` configured by settings.CONTENTSERVER_DISK_CACHE,
+    or None if there isn't one.
+    """
+    global _DISK_CACHE  # pylint: disable=global-statement
+    config = getattr(settings, 'CONTENTSERVER_DISK_CACHE', None)
+    if not config:
+        return None
+    if _DISK_CACHE is None or _DISK_CACHE.root != config['ROOT']:
+        _DISK_CACHE = ContentDiskCache(config['ROOT'], config['MAX_BYTES'])
+    return _DISK_CACHE
+
+
+def get_etag(content):
+    """
+    Returns the ETag of `content`: the hash of its data if it's known, and
+    otherwise a hash of its location and modification time.
+    """
+    digest = getattr(content, 'content_digest', None)
+    if digest is None:
+        digest = hashlib.md5(u'{}:{}'.format(content.location, content.last_modified_at).encode('utf-8')).hexdigest()
+    return '"{}"'.format(digest)
+
+
+def is_not_modified(request, etag, last_modified_at, last_modified_at_str):
+    """
+    Returns whether the client's copy of the content is current, according
+    to the request's If-None-Match header, or failing that, its
+    If-Modified-Since header.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        client_etags = [client_etag.strip() for client_etag in if_none_match.split(',')]
+        # weak comparison: the content is served with the same ETag, whatever its encoding
+        return '*' in client_etags or any(
+            (client_etag[2:] if client_etag.startswith('W/') else client_etag) == etag
+            for client_etag in client_etags
+        )
+
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        # clients may still send the timestamps that were served in a
+        # non standard format, which only compare as strings
+        if if_modified_since == last_modified_at_str:
+            return True
+        if_modified_since = parse_http_date_safe(if_modified_since)
+        if if_modified_since is not None:
+            return calendar.timegm(last_modified_at.utctimetuple()) <= if_modified_since
+    return False
+
+
+def open_cached_file(content, path):
+    """
+    Returns a `StaticContentStream` of `content` that reads its data from the
+    file at `path`.
+    """
+    return StaticContentStream(
+        content.location, content.name, content.content_type, open(path, 'rb'),
+        last_modified_at=content.last_modified_at, thumbnail_location=content.thumbnail_location,
+        import_path=content.import_path, length=content.length, locked=content.locked,
+        content_digest=content.content_digest
+    )
+
+
+def sendfile_response(path):
+    """
+    Returns a response that asks the web server to send the file at `path`,
+    if settings.CONTENTSERVER_DISK_CACHE configures a SENDFILE_HEADER (such
+    as X-Sendfile, or X-Accel-Redirect with a SENDFILE_URL_PREFIX that maps
+    to the cache's root). Returns None otherwise.
+    """
+    config = settings.CONTENTSERVER_DISK_CACHE
+    header = config.get('SENDFILE_HEADER')
+    if not header:
+        return None
+    url_prefix = config.get('SENDFILE_URL_PREFIX')
+    response = HttpResponse()
+    if url_prefix:
+        response[header] = url_prefix.rstrip('/') + '/' + os.path.basename(path)
+    else:
+        response[header] = path
+    return response
+
 
 class StaticContentServer(object):
     def process_request(self, request):
@@ -44,7 +142,7 @@ class StaticContentServer(object):
                 # since we fetched it from DB, let's cache it going forward, but only if it's < 1MB
                 # this is because I haven't been able to find a means to stream data out of memcached
                 if content.length is not None:
-                    if content.length < 1048576:
+                    if content.length < MAX_MEMCACHED_CONTENT_SIZE:
                         # since we've queried as a stream, let's read in the stream into memory to set in cache
                         content = content.copy_to_in_mem()
                         set_cached_content(content)
@@ -67,15 +165,27 @@ class StaticContentServer(object):
                         return HttpResponseForbidden('Unauthorized')
 
             # convert over the DB persistent last modified timestamp to a HTTP compatible
-            # timestamp, so we can simply compare the strings
+            # timestamp
             last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            etag = get_etag(content)
 
             # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
-                if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
-                if if_modified_since == last_modified_at_str:
-                    return HttpResponseNotModified()
+            # ETags or timestamps, if the client's copy is current then just return a 304 (Not Modified)
+            if is_not_modified(request, etag, content.last_modified_at, last_modified_at_str):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+            # Large content is served from a copy on local disk, if there's a disk cache
+            cached_path = None
+            disk_cache = get_disk_cache()
+            if disk_cache is not None and isinstance(content, StaticContentStream):
+                cached_path = disk_cache.get(content)
+                if cached_path is None:
+                    cached_path = disk_cache.add(content)
+                if cached_path is not None:
+                    content.close()
+                    content = open_cached_file(content, cached_path)
 
             # *** File streaming within a byte range ***
             # If a Range is provided, parse Range attribute of the request
@@ -84,10 +194,6 @@ class StaticContentServer(object):
             # Response -> Content-Range attribute structure: "Content-Range: bytes first-last/totalLength"
             response = None
             if request.META.get('HTTP_RANGE'):
-                # Data from cache (StaticContent) has no easy byte management, so we use the DB instead (StaticContentStream)
-                if type(content) == StaticContent:
-                    content = contentstore().find(loc, as_stream=True)
-
                 # Let's parse the Range header, bytes=first-[last]
                 range_header = request.META['HTTP_RANGE']
                 if '=' in range_header:
@@ -124,11 +230,17 @@ class StaticContentServer(object):
 
             else:
                 # No Range attribute
-                response = HttpResponse(content.stream_data())
+                if cached_path is not None:
+                    response = sendfile_response(cached_path)
+                if response is not None:
+                    content.close()
+                else:
+                    response = HttpResponse(content.stream_data())
                 response['Content-Length'] = content.length
 
             response['Accept-Ranges'] = 'bytes'
             response['Content-Type'] = content.content_type
-            response['Last-Modified'] = last_modified_at_str
+            response['Last-Modified'] = http_date(calendar.timegm(content.last_modified_at.utctimetuple()))
+            response['ETag'] = etag
 
             return response
@@ -2,15 +2,24 @@
 Tests for StaticContentServer
 """
 import copy
+import hashlib
 import logging
+import os
+import shutil
+from StringIO import StringIO
+from tempfile import mkdtemp
 from uuid import uuid4
 
 from django.conf import settings
+from django.test import TestCase
 from django.test.client import Client
 from django.test.utils import override_settings
+from mock import patch
 
 from student.models import CourseEnrollment
 
+from contentserver.disk_cache import ContentDiskCache
+from xmodule.contentstore.content import StaticContentStream
 from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.django import modulestore
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
@@ -189,3 +198,116 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
         )
 
         self.assertEqual(resp.status_code, 400)  # HTTP_400_BAD_REQUEST
+
+    def test_etag_not_modified(self):
+        """
+        Test that a request with the ETag of the asset gets a 304.
+        """
+        resp = self.client.get(self.url_unlocked)
+        etag = resp['ETag']
+        self.assertEqual(etag, '"{}"'.format(self.contentstore.get_attr(self.unlocked_asset, 'md5')))
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_if_modified_since(self):
+        """
+        Test that a request with a timestamp no older than the asset gets a 304.
+        """
+        resp = self.client.get(self.url_unlocked)
+        resp = self.client.get(self.url_unlocked, HTTP_IF_MODIFIED_SINCE=resp['Last-Modified'])
+        self.assertEqual(resp.status_code, 304)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEqual(resp.status_code, 200)
+
+    @patch('contentserver.middleware.MAX_MEMCACHED_CONTENT_SIZE', 0)
+    def test_disk_cache(self):
+        """
+        Test that assets too large for memcached are served from the disk cache.
+        """
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(CONTENTSERVER_DISK_CACHE={'ROOT': root, 'MAX_BYTES': 1024 * 1024}):
+            expected = self.client.get(self.url_unlocked).content
+            cached_path = os.path.join(root, self.contentstore.get_attr(self.unlocked_asset, 'md5'))
+            self.assertTrue(os.path.exists(cached_path))
+
+            with patch('contentserver.middleware.ContentDiskCache.add') as mock_add:
+                self.assertEqual(self.client.get(self.url_unlocked).content, expected)
+                resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=1-2')
+                self.assertEqual(resp.status_code, 206)
+                self.assertEqual(resp.content, expected[1:3])
+                self.assertFalse(mock_add.called)
+
+    @patch('contentserver.middleware.MAX_MEMCACHED_CONTENT_SIZE', 0)
+    def test_disk_cache_sendfile(self):
+        """
+        Test that cached assets are sent by the web server if it's configured to.
+        """
+        root = mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        config = {
+            'ROOT': root,
+            'MAX_BYTES': 1024 * 1024,
+            'SENDFILE_HEADER': 'X-Accel-Redirect',
+            'SENDFILE_URL_PREFIX': '/contentserver/',
+        }
+        with override_settings(CONTENTSERVER_DISK_CACHE=config):
+            resp = self.client.get(self.url_unlocked)
+        self.assertEqual(
+            resp['X-Accel-Redirect'],
+            '/contentserver/' + self.contentstore.get_attr(self.unlocked_asset, 'md5')
+        )
+        self.assertEqual(resp.content, '')
+        self.assertEqual(resp['Content-Length'], str(self.length_unlocked))
+
+
+class ContentDiskCacheTest(TestCase):
+    """
+    Tests of ContentDiskCache
+    """
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.course_key = SlashSeparatedCourseKey('edX', 'disk_cache', '2014')
+
+    def make_content(self, data):
+        """
+        Returns a StaticContentStream of `data`.
+        """
+        return StaticContentStream(
+            self.course_key.make_asset_key('asset', 'file'), 'file', 'text/plain', StringIO(data),
+            length=len(data), content_digest=hashlib.md5(data).hexdigest()
+        )
+
+    def test_add_and_get(self):
+        cache = ContentDiskCache(self.root, 1024)
+        content = self.make_content('data')
+        self.assertIsNone(cache.get(content))
+        path = cache.add(content)
+        self.assertEqual(cache.get(content), path)
+        with open(path) as cached_file:
+            self.assertEqual(cached_file.read(), 'data')
+
+    def test_evicts_least_recently_used(self):
+        cache = ContentDiskCache(self.root, 25)
+        contents = [self.make_content(str(index) * 10) for index in range(3)]
+        for index, content in enumerate(contents[:2]):
+            path = cache.add(content)
+            os.utime(path, (index, index))
+
+        # use the first content, so the second one is the least recently used
+        cache.get(contents[0])
+        cache.add(contents[2])
+        self.assertIsNotNone(cache.get(contents[0]))
+        self.assertIsNone(cache.get(contents[1]))
+        self.assertIsNotNone(cache.get(contents[2]))
+
+    def test_too_large(self):
+        cache = ContentDiskCache(self.root, 2)
+        self.assertIsNone(cache.add(self.make_content('data')))
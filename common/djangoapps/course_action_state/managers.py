@@ -147,6 +147,78 @@ class CourseRerunUIStateManager(CourseActionUIStateManager):
         )
 
 
+class CourseImportUIStateManager(CourseActionUIStateManager):
+    """
+    A concrete model Manager for the Import Action.
+    """
+    ACTION = "import"
+
+    class State(object):
+        """
+        An Enum class for maintaining the list of possible states for Imports.
+        """
+        IN_PROGRESS = "in_progress"
+        FAILED = "failed"
+        SUCCEEDED = "succeeded"
+
+    class Stage(object):
+        """
+        An Enum class for the stages of an import, as reported to the import page.
+        A failed import reports the negated stage that it failed in.
+        """
+        UPLOADING = 0
+        UNPACKING = 1
+        VERIFYING = 2
+        UPDATING = 3
+        SUCCEEDED = 4
+
+    def initiated(self, course_key, user, filename):
+        """
+        To be called when the archive `filename` has been uploaded to be imported into the given course.
+        """
+        self.update_state(
+            course_key=course_key,
+            new_state=self.State.IN_PROGRESS,
+            user=user,
+            allow_not_found=True,
+            filename=filename,
+            stage=self.Stage.UPLOADING,
+        )
+
+    def started_stage(self, course_key, stage):
+        """
+        To be called when an existing import for the given course starts the given stage.
+        """
+        self.update_state(
+            course_key=course_key,
+            new_state=self.State.IN_PROGRESS,
+            stage=stage,
+        )
+
+    def succeeded(self, course_key):
+        """
+        To be called when an existing import for the given course has successfully completed.
+        """
+        self.update_state(
+            course_key=course_key,
+            new_state=self.State.SUCCEEDED,
+            stage=self.Stage.SUCCEEDED,
+        )
+
+    def failed(self, course_key, message=None):
+        """
+        To be called within an exception handler when an existing import for the given course has failed
+        in its current stage.
+        """
+        import_state = self.find_first(course_key=course_key)
+        self.update_state(
+            course_key=course_key,
+            new_state=self.State.FAILED,
+            message=message if message is not None else traceback.format_exc(),
+            stage=-abs(import_state.stage),
+        )
+
+
 class CourseActionStateItemNotFoundError(Exception):
     """An exception class for errors specific to Course Action states."""
     pass
@@ -12,7 +12,9 @@ file and check it in at the same time as your model changes. To do that,
 from django.contrib.auth.models import User
 from django.db import models
 from xmodule_django.models import CourseKeyField
-from course_action_state.managers import CourseActionStateManager, CourseRerunUIStateManager
+from course_action_state.managers import (
+    CourseActionStateManager, CourseRerunUIStateManager, CourseImportUIStateManager
+)
 
 
 class CourseActionState(models.Model):
@@ -115,3 +117,25 @@ class CourseRerunState(CourseActionUIState):
     # MANAGERS
     # Override the abstract class' manager with a Rerun-specific manager that inherits from the base class' manager.
     objects = CourseRerunUIStateManager()
+
+
+class CourseImportState(CourseActionUIState):
+    """
+    A concrete django model for maintaining state specifically for the Action Course Imports.
+    """
+    class Meta:
+        """
+        Set the course_key field to be unique for the import action: only a single import
+        can be in progress for a course.
+        """
+        unique_together = ("course_key", "action")
+
+    # FIELDS
+    # Name of the uploaded archive that is being imported
+    filename = models.CharField(max_length=255, default="", blank=True)
+
+    # Stage of the import in progress, or the negated stage the import failed in
+    stage = models.IntegerField(default=0)
+
+    # MANAGERS
+    objects = CourseImportUIStateManager()
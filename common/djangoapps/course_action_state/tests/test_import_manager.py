@@ -0,0 +1,76 @@
+"""
+Tests specific to the CourseImportState Model and Manager.
+"""
+
+from django.test import TestCase
+from opaque_keys.edx.locations import CourseLocator
+from course_action_state.models import CourseImportState
+from course_action_state.managers import CourseImportUIStateManager
+from student.tests.factories import UserFactory
+
+
+class TestCourseImportStateManager(TestCase):
+    """
+    Test class for testing the CourseImportUIStateManager.
+    """
+    def setUp(self):
+        self.course_key = CourseLocator("test_org", "test_course_num", "test_run")
+        self.created_user = UserFactory()
+        self.filename = "course.tar.gz"
+
+    def initiate_import(self):
+        CourseImportState.objects.initiated(
+            course_key=self.course_key,
+            user=self.created_user,
+            filename=self.filename,
+        )
+
+    def verify_import_state(self, state, stage):
+        """
+        Verifies the state and stage of the import into self.course_key.
+        """
+        found_import = CourseImportState.objects.find_first(course_key=self.course_key)
+        self.assertEqual(found_import.state, state)
+        self.assertEqual(found_import.stage, stage)
+        self.assertEqual(found_import.filename, self.filename)
+        return found_import
+
+    def test_import_initiated(self):
+        self.initiate_import()
+        self.verify_import_state(CourseImportUIStateManager.State.IN_PROGRESS, CourseImportUIStateManager.Stage.UPLOADING)
+
+    def test_import_succeeded(self):
+        self.initiate_import()
+        CourseImportState.objects.started_stage(self.course_key, CourseImportUIStateManager.Stage.UPDATING)
+        self.verify_import_state(CourseImportUIStateManager.State.IN_PROGRESS, CourseImportUIStateManager.Stage.UPDATING)
+
+        CourseImportState.objects.succeeded(course_key=self.course_key)
+        self.verify_import_state(CourseImportUIStateManager.State.SUCCEEDED, CourseImportUIStateManager.Stage.SUCCEEDED)
+
+    def test_import_failed(self):
+        self.initiate_import()
+        CourseImportState.objects.started_stage(self.course_key, CourseImportUIStateManager.Stage.VERIFYING)
+
+        exception = Exception("failure in import")
+        try:
+            raise exception
+        except Exception:
+            CourseImportState.objects.failed(course_key=self.course_key)
+
+        found_import = self.verify_import_state(
+            CourseImportUIStateManager.State.FAILED, -CourseImportUIStateManager.Stage.VERIFYING
+        )
+        self.assertIn(exception.message, found_import.message)
+
+    def test_import_reinitiated(self):
+        self.initiate_import()
+        CourseImportState.objects.failed(course_key=self.course_key, message="failed")
+
+        # a new upload reuses the course's import state
+        self.filename = "other.tar.gz"
+        self.initiate_import()
+        found_import = self.verify_import_state(
+            CourseImportUIStateManager.State.IN_PROGRESS, CourseImportUIStateManager.Stage.UPLOADING
+        )
+        self.assertEqual(found_import.message, "")
+        self.assertEqual(CourseImportState.objects.find_all(course_key=self.course_key).count(), 1)
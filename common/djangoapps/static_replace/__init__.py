@@ -1,5 +1,7 @@
 import logging
 import re
+import threading
+from collections import OrderedDict
 
 from staticfiles.storage import staticfiles_storage
 from staticfiles import finders
@@ -28,6 +30,33 @@ def _url_replace_regex(prefix):
         """.format(prefix=prefix)
 
 
+# Compiled url replacement regexes, by prefix
+_URL_REPLACE_REGEXES = {}
+MAX_URL_REPLACE_REGEXES = 100
+
+
+def _compiled_url_replace_regex(prefix):
+    """
+    Return the compiled `_url_replace_regex` for `prefix`.
+    """
+    regex = _URL_REPLACE_REGEXES.get(prefix)
+    if regex is None:
+        if len(_URL_REPLACE_REGEXES) >= MAX_URL_REPLACE_REGEXES:
+            _URL_REPLACE_REGEXES.clear()
+        regex = _URL_REPLACE_REGEXES[prefix] = re.compile(_url_replace_regex(prefix))
+    return regex
+
+
+def _static_url_prefix(data_directory, static_asset_path):
+    """
+    The regex matching the prefix of static urls that haven't been replaced yet.
+    """
+    return u'(?:{static_url}|/static/)(?!{data_dir})'.format(
+        static_url=settings.STATIC_URL,
+        data_dir=static_asset_path or data_directory
+    )
+
+
 def try_staticfiles_lookup(path):
     """
     Try to lookup a path in staticfiles_storage.  If it fails, return
@@ -69,7 +98,7 @@ def replace_jump_to_id_urls(text, course_id, jump_to_id_base_url):
         rest = match.group('rest')
         return "".join([quote, jump_to_id_base_url + rest, quote])
 
-    return re.sub(_url_replace_regex('/jump_to_id/'), replace_jump_to_id_url, text)
+    return _compiled_url_replace_regex('/jump_to_id/').sub(replace_jump_to_id_url, text)
 
 
 def replace_course_urls(text, course_key):
@@ -89,7 +118,7 @@ def replace_course_urls(text, course_key):
         rest = match.group('rest')
         return "".join([quote, '/courses/' + course_id + '/', rest, quote])
 
-    return re.sub(_url_replace_regex('/course/'), replace_course_url, text)
+    return _compiled_url_replace_regex('/course/').sub(replace_course_url, text)
 
 
 def replace_static_urls(text, data_directory, course_id=None, static_asset_path=''):
@@ -118,48 +147,186 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
         # In debug mode, if we can find the url as is,
         if settings.DEBUG and finders.find(rest, True):
             return original
-        # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) \
-                and course_id \
-                and modulestore().get_modulestore_type(course_id) != ModuleStoreEnum.Type.xml:
-            # first look in the static file pipeline and see if we are trying to reference
-            # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
-
-            exists_in_staticfiles_storage = False
-            try:
-                exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-
-            if exists_in_staticfiles_storage:
-                url = staticfiles_storage.url(rest)
-            else:
-                # if not, then assume it's courseware specific content and then look in the
-                # Mongo-backed database
-                url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
-        # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
-        else:
-            course_path = "/".join((static_asset_path or data_directory, rest))
-
-            try:
-                if staticfiles_storage.exists(rest):
-                    url = staticfiles_storage.url(rest)
-                else:
-                    url = staticfiles_storage.url(course_path)
-            # And if that fails, assume that it's course content, and add manually data directory
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-                url = "".join([prefix, course_path])
 
+        url = _static_url(prefix, rest, data_directory, course_id, static_asset_path)
         return "".join([quote, url, quote])
 
-    return re.sub(
-        _url_replace_regex(u'(?:{static_url}|/static/)(?!{data_dir})'.format(
-            static_url=settings.STATIC_URL,
-            data_dir=static_asset_path or data_directory
-        )),
+    return _compiled_url_replace_regex(_static_url_prefix(data_directory, static_asset_path)).sub(
         replace_static_url,
         text
     )
+
+
+def _static_url(prefix, rest, data_directory, course_id, static_asset_path):
+    """
+    Return the url that the static url `prefix` + `rest` should be replaced
+    with. See `replace_static_urls`.
+    """
+    # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
+    if (not static_asset_path) \
+            and course_id \
+            and modulestore().get_modulestore_type(course_id) != ModuleStoreEnum.Type.xml:
+        # first look in the static file pipeline and see if we are trying to reference
+        # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
+
+        exists_in_staticfiles_storage = False
+        try:
+            exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+
+        if exists_in_staticfiles_storage:
+            url = staticfiles_storage.url(rest)
+        else:
+            # if not, then assume it's courseware specific content and then look in the
+            # Mongo-backed database
+            url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
+    # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
+    else:
+        course_path = "/".join((static_asset_path or data_directory, rest))
+
+        try:
+            if staticfiles_storage.exists(rest):
+                url = staticfiles_storage.url(rest)
+            else:
+                url = staticfiles_storage.url(course_path)
+        # And if that fails, assume that it's course content, and add manually data directory
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+            url = "".join([prefix, course_path])
+
+    return url
+
+
+class UrlRewriter(object):
+    """
+    Rewrites the urls in the html of the blocks of a course, as
+    `replace_static_urls`, `replace_course_urls` and `replace_jump_to_id_urls`
+    do, but in a single pass over the html.
+
+    The rewriting regexes are compiled once, and the urls that static urls
+    are replaced with are remembered (in a bounded LRU, by path), so that
+    staticfiles_storage is only consulted the first time an asset is seen.
+    Use `get_url_rewriter` to share rewriters between requests.
+    """
+    MAX_CACHED_URLS = 1000
+
+    def __init__(self, data_directory, course_id=None, static_asset_path='', jump_to_id_base_url=None):
+        self.data_directory = data_directory
+        self.course_id = course_id
+        self.static_asset_path = static_asset_path
+        self.jump_to_id_base_url = jump_to_id_base_url
+
+        static_prefix = _static_url_prefix(data_directory, static_asset_path)
+        prefixes = [static_prefix]
+        if course_id is not None:
+            prefixes.append('/course/')
+            if jump_to_id_base_url is not None:
+                prefixes.append('/jump_to_id/')
+        self.static_regex = _compiled_url_replace_regex(static_prefix)
+        self.regex = _compiled_url_replace_regex(u'|'.join(prefixes))
+
+        self._static_urls = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _modulestore_type(self):
+        """
+        The type of the modulestore serving the course, which decides where
+        its static urls point to.
+        """
+        if self.static_asset_path or not self.course_id:
+            return None
+        return modulestore().get_modulestore_type(self.course_id)
+
+    def _static_url(self, prefix, rest, modulestore_type):
+        """
+        Return the url that the static url `prefix` + `rest` should be
+        replaced with, remembering it for the next time it's needed.
+        """
+        key = (prefix, rest, modulestore_type)
+        with self._lock:
+            url = self._static_urls.pop(key, None)
+            if url is not None:
+                self._static_urls[key] = url
+                return url
+
+        url = _static_url(prefix, rest, self.data_directory, self.course_id, self.static_asset_path)
+        with self._lock:
+            self._static_urls[key] = url
+            while len(self._static_urls) > self.MAX_CACHED_URLS:
+                self._static_urls.popitem(last=False)
+        return url
+
+    def _replacer(self):
+        """
+        Returns a function that replaces a url matched by one of the
+        rewriter's regexes, according to its prefix.
+        """
+        modulestore_types = []
+
+        def replace_url(match):
+            """
+            Replace the url matched by `match`.
+            """
+            quote = match.group('quote')
+            prefix = match.group('prefix')
+            rest = match.group('rest')
+
+            if prefix == '/course/':
+                return "".join([quote, '/courses/' + self.course_id.to_deprecated_string() + '/', rest, quote])
+            elif prefix == '/jump_to_id/':
+                return "".join([quote, self.jump_to_id_base_url + rest, quote])
+
+            # Don't mess with things that end in '?raw'
+            if rest.endswith('?raw'):
+                return match.group(0)
+
+            # In debug mode, if we can find the url as is, leave it alone.
+            # Assets may change while debugging, so don't remember urls then.
+            if settings.DEBUG:
+                if finders.find(rest, True):
+                    return match.group(0)
+                url = _static_url(prefix, rest, self.data_directory, self.course_id, self.static_asset_path)
+            else:
+                if not modulestore_types:
+                    modulestore_types.append(self._modulestore_type())
+                url = self._static_url(prefix, rest, modulestore_types[0])
+            return "".join([quote, url, quote])
+
+        return replace_url
+
+    def replace_static_urls(self, text):
+        """
+        Replace the static urls in `text`, as `replace_static_urls` does.
+        """
+        return self.static_regex.sub(self._replacer(), text)
+
+    def replace_urls(self, text):
+        """
+        Replace the static urls in `text`, and its course and jump_to_id urls
+        if the rewriter has a course_id (and a jump_to_id_base_url).
+        """
+        return self.regex.sub(self._replacer(), text)
+
+
+_URL_REWRITERS = OrderedDict()
+_URL_REWRITERS_LOCK = threading.Lock()
+MAX_URL_REWRITERS = 100
+
+
+def get_url_rewriter(data_directory, course_id=None, static_asset_path='', jump_to_id_base_url=None):
+    """
+    Return the `UrlRewriter` for the arguments, reusing the rewriters of the
+    most recently rendered courses.
+    """
+    key = (data_directory, course_id, static_asset_path, jump_to_id_base_url)
+    with _URL_REWRITERS_LOCK:
+        rewriter = _URL_REWRITERS.pop(key, None)
+        if rewriter is None:
+            rewriter = UrlRewriter(data_directory, course_id, static_asset_path, jump_to_id_base_url)
+        _URL_REWRITERS[key] = rewriter
+        while len(_URL_REWRITERS) > MAX_URL_REWRITERS:
+            _URL_REWRITERS.popitem(last=False)
+    return rewriter
@@ -1,8 +1,8 @@
 import re
 
 from nose.tools import assert_equals, assert_true, assert_false  # pylint: disable=E0611
-from static_replace import (replace_static_urls, replace_course_urls,
-                            _url_replace_regex)
+from static_replace import (replace_static_urls, replace_course_urls, replace_jump_to_id_urls,
+                            _url_replace_regex, UrlRewriter, get_url_rewriter)
 from mock import patch, Mock
 
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
@@ -125,3 +125,44 @@ def test_regex():
     for s in no:
         print 'Should not match: {0!r}'.format(s)
         assert_false(re.match(regex, s))
+
+
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_url_rewriter(mock_modulestore, mock_storage):
+    """
+    Make sure that UrlRewriter replaces urls like the separate replacement functions do
+    """
+    mock_storage.exists.return_value = False
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+
+    text = '<a href="/static/file.png">"/course/info"</a><a href=\'/jump_to_id/block\'>"/static/foo.png?raw"</a>'
+    expected = replace_jump_to_id_urls(
+        replace_course_urls(replace_static_urls(text, DATA_DIRECTORY, COURSE_KEY), COURSE_KEY),
+        COURSE_KEY,
+        '/courses/org/course/run/jump_to_id/'
+    )
+    rewriter = UrlRewriter(DATA_DIRECTORY, COURSE_KEY, jump_to_id_base_url='/courses/org/course/run/jump_to_id/')
+    assert_equals(expected, rewriter.replace_urls(text))
+    assert_equals(replace_static_urls(text, DATA_DIRECTORY, COURSE_KEY), rewriter.replace_static_urls(text))
+
+
+@patch('static_replace.StaticContent')
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_url_rewriter_remembers_urls(mock_modulestore, mock_storage, mock_static_content):
+    mock_storage.exists.return_value = False
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+    mock_static_content.convert_legacy_static_url_with_course_id.return_value = "/c4x/mock_url"
+
+    rewriter = UrlRewriter(DATA_DIRECTORY, COURSE_KEY)
+    for __ in range(3):
+        assert_equals('"/c4x/mock_url"', rewriter.replace_urls(STATIC_SOURCE))
+    mock_static_content.convert_legacy_static_url_with_course_id.assert_called_once_with('file.png', COURSE_KEY)
+    assert_equals(mock_storage.exists.call_count, 1)
+
+
+def test_get_url_rewriter():
+    rewriter = get_url_rewriter(DATA_DIRECTORY, COURSE_KEY)
+    assert_true(rewriter is get_url_rewriter(DATA_DIRECTORY, COURSE_KEY))
+    assert_false(rewriter is get_url_rewriter(DATA_DIRECTORY, COURSE_KEY, jump_to_id_base_url='/jump_to_id/'))
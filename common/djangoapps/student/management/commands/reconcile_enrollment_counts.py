@@ -0,0 +1,66 @@
+"""
+Recount the active enrollments of courses, and fix the stored
+CourseEnrollmentCounts that don't match.
+"""
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
+
+from student.models import CourseEnrollment, CourseEnrollmentCount
+
+
+class Command(BaseCommand):
+
+    help = """
+    Recounts the active enrollments in each mode of courses, and corrects
+    the CourseEnrollmentCounts that don't match.
+
+    Example:
+
+        Reconcile the enrollment counts of some/course/id:
+
+          $ ... reconcile_enrollment_counts -c some/course/id
+
+        Reconcile the enrollment counts of all courses:
+
+          $ ... reconcile_enrollment_counts
+
+    """
+
+    option_list = BaseCommand.option_list + (
+        make_option('-c', '--course',
+                    metavar='COURSE_ID',
+                    dest='course_id',
+                    default=False,
+                    help="course id to reconcile, if not specified all courses are reconciled"),
+    )
+
+    def handle(self, *args, **options):
+        if options['course_id']:
+            try:
+                course_keys = [CourseKey.from_string(options['course_id'])]
+            except InvalidKeyError:
+                course_keys = [SlashSeparatedCourseKey.from_deprecated_string(options['course_id'])]
+        else:
+            course_keys = set(
+                CourseEnrollment.objects.values_list('course_id', flat=True).distinct()
+            ) | set(
+                CourseEnrollmentCount.objects.values_list('course_id', flat=True).distinct()
+            )
+            course_keys = [
+                SlashSeparatedCourseKey.from_deprecated_string(course_id) if isinstance(course_id, basestring)
+                else course_id
+                for course_id in course_keys
+            ]
+
+        for course_key in sorted(course_keys):
+            corrections = CourseEnrollmentCount.reconcile(course_key)
+            for mode, (stored, actual) in sorted(corrections.iteritems()):
+                self.stdout.write(
+                    u"{course_id}: corrected count of {mode} enrollments from {stored} to {actual}\n".format(
+                        course_id=course_key.to_deprecated_string(), mode=mode, stored=stored, actual=actual
+                    )
+                )
@@ -14,20 +14,26 @@ from datetime import datetime, timedelta
 import hashlib
 import json
 import logging
+import random
 from pytz import UTC
+import threading
 import uuid
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from dogapi import dog_stats_api
 from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
 import pytz
 
+from celery.signals import task_postrun
 from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
 from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.signals import user_logged_in, user_logged_out
-from django.db import models, IntegrityError
-from django.db.models import Count
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F, Sum
 from django.dispatch import receiver, Signal
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.translation import ugettext_noop
@@ -75,6 +81,212 @@ class AnonymousUserId(models.Model):
     unique_together = (user, course_id)
 
 
+def _anonymous_id_digest(user_id, course_id):
+    """
+    Return the anonymous id of the user with id `user_id` in `course_id`.
+    """
+    # include the secret key as a salt, and to make the ids unique across different LMS installs.
+    hasher = hashlib.md5()
+    hasher.update(settings.SECRET_KEY)
+    hasher.update(unicode(user_id))
+    if course_id:
+        hasher.update(course_id.to_deprecated_string())
+    return hasher.hexdigest()
+
+
+def _log_anonymous_id_mismatch(user_id, course_id, stored, digest):
+    """
+    Log that the stored anonymous id of a (user, course) pair isn't the one computed for it.
+    """
+    log.error(
+        "Stored anonymous user id {stored!r} for user {user!r} "
+        "in course {course!r} doesn't match computed id {digest!r}".format(
+            user=user_id,
+            course=course_id,
+            stored=stored,
+            digest=digest
+        )
+    )
+
+
+def _store_anonymous_id(user_id, course_id, digest):
+    """
+    Store the AnonymousUserId of a single (user, course) pair, unless it already exists.
+
+    Returns whether it already existed, i.e. was stored by an earlier transaction.
+    """
+    try:
+        anonymous_user_id, created = AnonymousUserId.objects.get_or_create(
+            defaults={'anonymous_user_id': digest},
+            user_id=user_id,
+            course_id=course_id
+        )
+        if anonymous_user_id.anonymous_user_id != digest:
+            _log_anonymous_id_mismatch(user_id, course_id, anonymous_user_id.anonymous_user_id, digest)
+    except IntegrityError:
+        # Another thread has already created this entry, so
+        # continue
+        return False
+    return not created
+
+
+def _store_anonymous_ids(rows):
+    """
+    Store the AnonymousUserIds of the (user_id, course_id, digest) `rows`
+    that don't exist yet, with a query to find the existing ones and a bulk
+    insert of the missing ones per course, rather than a `get_or_create` per row.
+
+    Returns the digests of the rows that already existed.
+    """
+    existing = []
+    digests_by_course = defaultdict(dict)
+    for user_id, course_id, digest in rows:
+        digests_by_course[course_id][user_id] = digest
+
+    for course_id, digests in digests_by_course.iteritems():
+        user_ids = digests.keys()
+        for start in xrange(0, len(user_ids), AnonymousUserIdRegistry.QUERY_BATCH_SIZE):
+            batch = user_ids[start:start + AnonymousUserIdRegistry.QUERY_BATCH_SIZE]
+            stored_ids = AnonymousUserId.objects.filter(
+                course_id=course_id, user_id__in=batch
+            ).values_list('user_id', 'anonymous_user_id')
+
+            missing = dict((user_id, digests[user_id]) for user_id in batch)
+            for user_id, stored in stored_ids:
+                if missing.pop(user_id, stored) != stored:
+                    _log_anonymous_id_mismatch(user_id, course_id, stored, digests[user_id])
+                existing.append(digests[user_id])
+            if not missing:
+                continue
+
+            try:
+                AnonymousUserId.objects.bulk_create([
+                    AnonymousUserId(user_id=user_id, course_id=course_id, anonymous_user_id=digest)
+                    for user_id, digest in missing.iteritems()
+                ])
+            except IntegrityError:
+                # Some of the rows were created concurrently, so fall back
+                # to storing the rows one at a time
+                for user_id, digest in missing.iteritems():
+                    if _store_anonymous_id(user_id, course_id, digest):
+                        existing.append(digest)
+    return existing
+
+
+class AnonymousUserIdRegistry(object):
+    """
+    Keeps track of the anonymous ids known to be stored as AnonymousUserIds,
+    so that they don't have to be checked for in the database on every use.
+
+    Ids that aren't known to be stored are stored right away, in the current
+    transaction, so that they can be looked up as soon as they have been
+    handed out. An id is only remembered as stored once it has been found in
+    the database, i.e. stored by a committed transaction, so a rolled back
+    transaction can't leave it remembered but missing.
+
+    Stored ids are remembered in a bounded, process-wide LRU, and in the
+    django cache so that other processes don't have to check the database for
+    them either.
+    """
+    CACHE_KEY_PREFIX = 'student.anonymous_user_id.stored'
+    CACHE_TIMEOUT = 24 * 60 * 60
+    QUERY_BATCH_SIZE = 500
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._stored = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _cache_key(cls, digest):
+        """
+        Return the django cache key recording that `digest` is stored.
+        """
+        return '{}.{}'.format(cls.CACHE_KEY_PREFIX, digest)
+
+    def is_stored(self, digest):
+        """
+        Return whether the AnonymousUserId with `digest` is known to be stored.
+        """
+        with self._lock:
+            if digest in self._stored:
+                self._stored[digest] = self._stored.pop(digest)
+                return True
+        if cache.get(self._cache_key(digest)):
+            self._remember([digest], in_cache=False)
+            return True
+        return False
+
+    def _remember(self, digests, in_cache=True):
+        """
+        Record that the AnonymousUserIds with `digests` are stored.
+        """
+        with self._lock:
+            for digest in digests:
+                self._stored.pop(digest, None)
+                self._stored[digest] = True
+            while len(self._stored) > self.max_size:
+                self._stored.popitem(last=False)
+        if in_cache and digests:
+            cache.set_many(
+                dict((self._cache_key(digest), True) for digest in digests),
+                self.CACHE_TIMEOUT
+            )
+
+    def register(self, user_id, course_id, digest):
+        """
+        Store the AnonymousUserId of (`user_id`, `course_id`), unless it's
+        known to be stored already.
+        """
+        if self.is_stored(digest):
+            return
+        if _store_anonymous_id(user_id, course_id, digest):
+            self._remember([digest])
+
+    def register_many(self, rows):
+        """
+        Store the AnonymousUserIds of the (user_id, course_id, digest) `rows`,
+        skipping those known to be stored already.
+        """
+        rows = [row for row in rows if not self.is_stored(row[2])]
+        self._remember(_store_anonymous_ids(rows))
+
+
+ANONYMOUS_USER_ID_REGISTRY = AnonymousUserIdRegistry()
+
+
+_PENDING_CACHE_INVALIDATIONS = threading.local()
+
+
+def invalidate_cache_key_after_commit(key):
+    """
+    Delete `key` from the django cache now, and again once the current
+    request or celery task finishes, after its transaction is committed or
+    rolled back.
+
+    Model signals fire inside the transaction, so until it's committed a
+    concurrent reader can cache the data from before the change again, and
+    a rollback can leave cached data that was never committed.
+    """
+    cache.delete(key)
+    if transaction.is_managed():
+        if not hasattr(_PENDING_CACHE_INVALIDATIONS, 'keys'):
+            _PENDING_CACHE_INVALIDATIONS.keys = set()
+        _PENDING_CACHE_INVALIDATIONS.keys.add(key)
+
+
+@receiver(request_finished)
+@receiver(task_postrun)
+def flush_cache_invalidations(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Delete the cache keys invalidated during a request or celery task again.
+    """
+    keys = getattr(_PENDING_CACHE_INVALIDATIONS, 'keys', None)
+    if keys:
+        _PENDING_CACHE_INVALIDATIONS.keys = set()
+        cache.delete_many(list(keys))
+
+
 def anonymous_id_for_user(user, course_id, save=True):
     """
     Return a unique id for a (user, course) pair, suitable for inserting
@@ -93,13 +305,7 @@ def anonymous_id_for_user(user, course_id, save=True):
     if cached_id is not None:
         return cached_id
 
-    # include the secret key as a salt, and to make the ids unique across different LMS installs.
-    hasher = hashlib.md5()
-    hasher.update(settings.SECRET_KEY)
-    hasher.update(unicode(user.id))
-    if course_id:
-        hasher.update(course_id.to_deprecated_string())
-    digest = hasher.hexdigest()
+    digest = _anonymous_id_digest(user.id, course_id)
 
     if not hasattr(user, '_anonymous_id'):
         user._anonymous_id = {}  # pylint: disable=protected-access
@@ -109,30 +315,39 @@ def anonymous_id_for_user(user, course_id, save=True):
     if save is False:
         return digest
 
-    try:
-        anonymous_user_id, __ = AnonymousUserId.objects.get_or_create(
-            defaults={'anonymous_user_id': digest},
-            user=user,
-            course_id=course_id
-        )
-        if anonymous_user_id.anonymous_user_id != digest:
-            log.error(
-                "Stored anonymous user id {stored!r} for user {user!r} "
-                "in course {course!r} doesn't match computed id {digest!r}".format(
-                    user=user,
-                    course=course_id,
-                    stored=anonymous_user_id.anonymous_user_id,
-                    digest=digest
-                )
-            )
-    except IntegrityError:
-        # Another thread has already created this entry, so
-        # continue
-        pass
+    if settings.FEATURES.get('ENABLE_ANONYMOUS_USER_ID_REGISTRY'):
+        ANONYMOUS_USER_ID_REGISTRY.register(user.id, course_id, digest)
+    else:
+        _store_anonymous_id(user.id, course_id, digest)
 
     return digest
 
 
+def anonymous_ids_for_users(users, course_id, save=True):
+    """
+    Return a dict mapping the id of every user in `users` to their unique id
+    for `course_id`, as returned by `anonymous_id_for_user`.
+
+    The AnonymousUserIds of all the users are stored with a few bulk queries,
+    rather than with queries for each user.
+
+    Keyword arguments:
+    save -- Whether the ids should be saved in AnonymousUserId objects.
+    """
+    anonymous_ids = {}
+    for user in users:
+        anonymous_ids[user.id] = anonymous_id_for_user(user, course_id, save=False)
+
+    if save:
+        rows = [(user_id, course_id, digest) for user_id, digest in anonymous_ids.iteritems()]
+        if settings.FEATURES.get('ENABLE_ANONYMOUS_USER_ID_REGISTRY'):
+            ANONYMOUS_USER_ID_REGISTRY.register_many(rows)
+        else:
+            _store_anonymous_ids(rows)
+
+    return anonymous_ids
+
+
 def user_by_anonymous_id(uid):
     """
     Return user by anonymous_user_id using AnonymousUserId lookup table.
@@ -622,6 +837,55 @@ class CourseEnrollment(models.Model):
             "[CourseEnrollment] {}: {} ({}); active: ({})"
         ).format(self.user, self.course_id, self.created, self.is_active)
 
+    def _count_key(self):
+        """
+        The (course_id, mode) of the CourseEnrollmentCount this enrollment
+        counts towards, or None if it's inactive.
+        """
+        return (self.course_id, self.mode) if self.is_active else None
+
+    def _saved_count_key(self):
+        """
+        The (course_id, mode) of the CourseEnrollmentCount the saved row of
+        this enrollment counts towards, or None if it's inactive or not saved.
+        The row is locked until the end of the transaction, so that concurrent
+        saves of the enrollment see each other's changes.
+        """
+        if self.pk is None:
+            return None
+        saved = list(
+            CourseEnrollment.objects.select_for_update().filter(pk=self.pk).values_list('is_active', 'mode')
+        )
+        if not saved:
+            return None
+        is_active, mode = saved[0]
+        return (self.course_id, mode) if is_active else None
+
+    def save(self, *args, **kwargs):
+        """
+        Saves the enrollment, and updates the CourseEnrollmentCounts of the
+        course in the same transaction.
+
+        If the enrollment's is_active or mode changed since it was loaded, the
+        counts are updated from the state of the enrollment's row in the
+        database, rather than the state this object was loaded in, so that
+        saving two copies of the same enrollment (e.g. from two concurrent
+        enroll requests) only counts it once. Saves that don't change them
+        don't read or lock the row.
+        """
+        count_key = self._count_key()
+        if self.pk is not None and count_key == getattr(self, '_loaded_count_key', None):
+            super(CourseEnrollment, self).save(*args, **kwargs)
+            return
+        counted_as = self._saved_count_key()
+        super(CourseEnrollment, self).save(*args, **kwargs)
+        self._loaded_count_key = count_key
+        if count_key != counted_as:
+            if counted_as is not None:
+                CourseEnrollmentCount.increment(*counted_as, delta=-1)
+            if count_key is not None:
+                CourseEnrollmentCount.increment(*count_key, delta=1)
+
     @classmethod
     def get_or_create_enrollment(cls, user, course_key):
         """
@@ -670,9 +934,11 @@ class CourseEnrollment(models.Model):
 
         'course_id' is the course_id to return enrollments
         """
-        enrollment_number = CourseEnrollment.objects.filter(course_id=course_id, is_active=1).count()
+        enrollment_number = CourseEnrollmentCount.objects.filter(
+            course_id=course_id
+        ).aggregate(total=Sum('count'))['total']
 
-        return enrollment_number
+        return enrollment_number or 0
 
     @classmethod
     def is_course_full(cls, course):
@@ -799,6 +1065,7 @@ class CourseEnrollment(models.Model):
         """
         enrollment = cls.get_or_create_enrollment(user, course_key)
         enrollment.update_enrollment(is_active=True, mode=mode)
+        cls._clear_cached_enrollment_states(user)
         return enrollment
 
     @classmethod
@@ -854,6 +1121,7 @@ class CourseEnrollment(models.Model):
         try:
             record = CourseEnrollment.objects.get(user=user, course_id=course_id)
             record.update_enrollment(is_active=False)
+            cls._clear_cached_enrollment_states(user)
 
         except cls.DoesNotExist:
             err_msg = u"Tried to unenroll student {} from {} but they were not enrolled"
@@ -888,6 +1156,12 @@ class CourseEnrollment(models.Model):
 
         `course_id` is our usual course_id string (e.g. "edX/Test101/2013_Fall)
         """
+        if cls._cache_enrollment_states():
+            __, __, is_active = cls._cached_enrollment_states(user).get(
+                cls._enrollment_state_key(course_key), (None, None, False)
+            )
+            return is_active
+
         try:
             record = CourseEnrollment.objects.get(user=user, course_id=course_key)
             return record.is_active
@@ -913,6 +1187,12 @@ class CourseEnrollment(models.Model):
         assert not course_id_partial.run  # None or empty string
         course_key = SlashSeparatedCourseKey(course_id_partial.org, course_id_partial.course, '')
         querystring = unicode(course_key.to_deprecated_string())
+        if cls._cache_enrollment_states():
+            return any(
+                is_active and state_key.startswith(querystring)
+                for state_key, (__, __, is_active) in cls._cached_enrollment_states(user).iteritems()
+            )
+
         try:
             return CourseEnrollment.objects.filter(
                 user=user,
@@ -934,6 +1214,12 @@ class CourseEnrollment(models.Model):
             and is_active is whether the enrollment is active.
         Returns (None, None) if the courseenrollment record does not exist.
         """
+        if cls._cache_enrollment_states():
+            __, mode, is_active = cls._cached_enrollment_states(user).get(
+                cls._enrollment_state_key(course_id), (None, None, None)
+            )
+            return (mode, is_active)
+
         try:
             record = CourseEnrollment.objects.get(user=user, course_id=course_id)
             return (record.mode, record.is_active)
@@ -944,6 +1230,82 @@ class CourseEnrollment(models.Model):
     def enrollments_for_user(cls, user):
         return CourseEnrollment.objects.filter(user=user, is_active=1)
 
+    @classmethod
+    def enrollment_states_for_user(cls, user):
+        """
+        Returns a dict mapping the course_id of every course the user has an
+        enrollment record for (active or not) to (mode, is_active), as
+        returned by `enrollment_mode_for_user`, with a single query.
+        """
+        if cls._cache_enrollment_states():
+            states = cls._cached_enrollment_states(user).itervalues()
+        else:
+            states = cls._query_enrollment_states(user)
+        return dict((course_id, (mode, is_active)) for course_id, mode, is_active in states)
+
+    @classmethod
+    def _cache_enrollment_states(cls):
+        """
+        Whether enrollment states are cached, on User objects and in the django cache.
+        """
+        return settings.FEATURES.get('CACHE_COURSE_ENROLLMENTS', False)
+
+    @staticmethod
+    def _enrollment_state_key(course_key):
+        """
+        The key of the enrollment state of `course_key`: the course id as it's
+        stored, without the branch and version that queries ignore.
+        """
+        if hasattr(course_key, 'version_agnostic') and hasattr(course_key, 'for_branch'):
+            course_key = course_key.for_branch(None).version_agnostic()
+        return unicode(course_key)
+
+    @classmethod
+    def _query_enrollment_states(cls, user):
+        """
+        Returns a list of (course_id, mode, is_active) for all of the user's enrollment records.
+        """
+        if user.id is None:
+            return []
+        # values_list doesn't convert the stored course ids to CourseKeys
+        course_id_field = cls._meta.get_field('course_id')
+        return [
+            (course_id_field.to_python(course_id), mode, is_active)
+            for course_id, mode, is_active in cls.objects.filter(user=user).values_list('course_id', 'mode', 'is_active')
+        ]
+
+    @classmethod
+    def _cached_enrollment_states(cls, user):
+        """
+        Returns a dict mapping the `_enrollment_state_key` of the courses of
+        all of the user's enrollment records to (course_id, mode, is_active).
+
+        The states are cached on the user object for the rest of the request,
+        and in the django cache until the user's enrollments change.
+        """
+        # pylint: disable=protected-access
+        if not hasattr(user, '_course_enrollment_states'):
+            states = None
+            if user.id is not None:
+                states = cache.get(course_enrollment_states_cache_key(user.id))
+            if states is None:
+                states = dict(
+                    (cls._enrollment_state_key(course_id), (course_id, mode, is_active))
+                    for course_id, mode, is_active in cls._query_enrollment_states(user)
+                )
+                if user.id is not None:
+                    cache.set(course_enrollment_states_cache_key(user.id), states, COURSE_ENROLLMENT_STATES_CACHE_TIMEOUT)
+            user._course_enrollment_states = states
+        return user._course_enrollment_states
+
+    @classmethod
+    def _clear_cached_enrollment_states(cls, user):
+        """
+        Drops the enrollment states cached on the user object.
+        """
+        if hasattr(user, '_course_enrollment_states'):
+            del user._course_enrollment_states  # pylint: disable=protected-access
+
     @classmethod
     def users_enrolled_in(cls, course_id):
         """Return a queryset of User for every user enrolled in the course."""
@@ -958,13 +1320,17 @@ class CourseEnrollment(models.Model):
         Returns a dictionary that stores the total enrollment count for a course, as well as the
         enrollment count for each individual mode.
         """
-        # Unfortunately, Django's "group by"-style queries look super-awkward
-        query = use_read_replica_if_available(cls.objects.filter(course_id=course_id, is_active=True).values('mode').order_by().annotate(Count('mode')))
+        query = use_read_replica_if_available(
+            CourseEnrollmentCount.objects.filter(course_id=course_id).values('mode').order_by().annotate(
+                total=Sum('count')
+            )
+        )
         total = 0
         enroll_dict = defaultdict(int)
         for item in query:
-            enroll_dict[item['mode']] = item['mode__count']
-            total += item['mode__count']
+            if item['total'] > 0:
+                enroll_dict[item['mode']] = item['total']
+                total += item['total']
         enroll_dict['total'] = total
         return enroll_dict
 
@@ -1019,6 +1385,139 @@ class CourseEnrollment(models.Model):
             return True
 
 
+@receiver(post_init, sender=CourseEnrollment)
+def remember_loaded_count_key(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Record what a loaded enrollment is counted as, so that saving it without
+    changing is_active or mode doesn't need to update the counts.
+    """
+    if instance.pk is not None:
+        instance._loaded_count_key = instance._count_key()  # pylint: disable=protected-access
+
+
+@receiver(pre_delete, sender=CourseEnrollment)
+def lock_deleted_enrollment(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Lock the row of an enrollment that's about to be deleted, and record what
+    it was counted as, for `uncount_deleted_enrollment`.
+    """
+    instance._deleted_count_key = instance._saved_count_key()  # pylint: disable=protected-access
+
+
+@receiver(post_delete, sender=CourseEnrollment)
+def uncount_deleted_enrollment(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Remove a deleted enrollment from the CourseEnrollmentCounts of its course.
+    """
+    count_key = getattr(instance, '_deleted_count_key', None)
+    if count_key is not None:
+        CourseEnrollmentCount.increment(*count_key, delta=-1)
+
+
+class CourseEnrollmentCount(models.Model):
+    """
+    The number of active enrollments in each mode of a course.
+
+    Counts are updated as CourseEnrollments are saved or deleted, so that
+    counting the enrollments of a course doesn't need to count the
+    CourseEnrollment rows of the course. Updates made without saving
+    CourseEnrollment objects (e.g. with `QuerySet.update`) aren't counted;
+    the reconcile_enrollment_counts management command recounts them.
+
+    Each count is spread over up to NUM_SHARDS rows, which are summed when
+    it's read. An update locks one randomly chosen shard until the end of
+    its transaction, so concurrent enrollments in the same course rarely
+    wait for each other.
+    """
+    NUM_SHARDS = 10
+
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    mode = models.CharField(max_length=100)
+    shard = models.PositiveSmallIntegerField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:  # pylint: disable=missing-docstring
+        unique_together = (('course_id', 'mode', 'shard'),)
+
+    def __unicode__(self):
+        return u"[CourseEnrollmentCount] {}: {} {} (shard {})".format(
+            self.course_id, self.count, self.mode, self.shard
+        )
+
+    @classmethod
+    def increment(cls, course_id, mode, delta=1):
+        """
+        Adds `delta` to the count of enrollments in `mode` in `course_id`.
+        """
+        shard = random.randrange(cls.NUM_SHARDS)
+        counter = cls.objects.filter(course_id=course_id, mode=mode, shard=shard)
+        if counter.update(count=F('count') + delta):
+            return
+        try:
+            cls.objects.create(course_id=course_id, mode=mode, shard=shard, count=delta)
+        except IntegrityError:
+            # Another thread has created the shard since, so update it
+            counter.update(count=F('count') + delta)
+
+    @classmethod
+    def reconcile(cls, course_id):
+        """
+        Recounts the active enrollments of `course_id`. Returns a dict of the
+        (stored, actual) counts by mode, for the modes whose counts were wrong.
+        """
+        # Unfortunately, Django's "group by"-style queries look super-awkward
+        actual_counts = dict(
+            (item['mode'], item['mode__count'])
+            for item in CourseEnrollment.objects.filter(
+                course_id=course_id, is_active=True
+            ).values('mode').order_by().annotate(Count('mode'))
+        )
+        stored_counts = dict(
+            (item['mode'], item['total'])
+            for item in cls.objects.filter(
+                course_id=course_id
+            ).values('mode').order_by().annotate(total=Sum('count'))
+        )
+
+        corrections = {}
+        for mode in set(actual_counts) | set(stored_counts):
+            actual = actual_counts.get(mode, 0)
+            stored = stored_counts.get(mode)
+            if stored == actual or (stored is None and actual == 0):
+                continue
+            corrections[mode] = (stored or 0, actual)
+            # Collapse the count into its first shard
+            cls.objects.filter(course_id=course_id, mode=mode).exclude(shard=0).delete()
+            updated = cls.objects.filter(course_id=course_id, mode=mode, shard=0).update(count=actual)
+            if not updated:
+                cls.objects.create(course_id=course_id, mode=mode, shard=0, count=actual)
+        return corrections
+
+
+COURSE_ENROLLMENT_STATES_CACHE_TIMEOUT = 60 * 60
+
+
+def course_enrollment_states_cache_key(user_id):
+    """
+    The django cache key of the enrollment states of the user with id `user_id`,
+    as cached by `CourseEnrollment._cached_enrollment_states`
+    """
+    return u'student.course_enrollment_states.{}'.format(user_id)
+
+
+@receiver(post_save, sender=CourseEnrollment)
+@receiver(post_delete, sender=CourseEnrollment)
+def invalidate_cached_enrollment_states(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drop the cached enrollment states of the user whose enrollment changed.
+    """
+    invalidate_cache_key_after_commit(course_enrollment_states_cache_key(instance.user_id))
+    # The enrollment's user may also be the object the states were cached on
+    user = getattr(instance, '_user_cache', None)
+    if user is not None:
+        CourseEnrollment._clear_cached_enrollment_states(user)  # pylint: disable=protected-access
+
+
 class CourseEnrollmentAllowed(models.Model):
     """
     Table of users (specified by email address strings) who are allowed to enroll in a specified course.
@@ -1086,6 +1585,23 @@ class CourseAccessRole(models.Model):
         return "[CourseAccessRole] user: {}   role: {}   org: {}   course: {}".format(self.user.username, self.role, self.org, self.course_id)
 
 
+def course_access_roles_cache_key(user_id):
+    """
+    The django cache key of the CourseAccessRoles of the user with id `user_id`,
+    as cached by student.roles.RoleCache
+    """
+    return u'student.course_access_roles.{}'.format(user_id)
+
+
+@receiver(post_save, sender=CourseAccessRole)
+@receiver(post_delete, sender=CourseAccessRole)
+def invalidate_cached_course_access_roles(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Drop the cached CourseAccessRoles of the user whose roles changed.
+    """
+    invalidate_cache_key_after_commit(course_access_roles_cache_key(instance.user_id))
+
+
 class CourseAccessRoleAdmin(admin.ModelAdmin):
     raw_id_fields = ("user",)
 
@@ -4,30 +4,50 @@ adding users, removing users, and listing members
 """
 
 from abc import ABCMeta, abstractmethod
+from collections import defaultdict
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from student.models import CourseAccessRole
+from django.core.cache import cache
+from student.models import CourseAccessRole, course_access_roles_cache_key
 from xmodule_django.models import CourseKeyField
 
 
 class RoleCache(object):
     """
     A cache of the CourseAccessRoles held by a particular user
+
+    With the CACHE_COURSE_ACCESS_ROLES feature flag, the roles are also
+    cached across requests in the django cache; changes to a user's
+    CourseAccessRoles drop them from it.
     """
+    CACHE_TIMEOUT = 5 * 60
+
     def __init__(self, user):
-        self._roles = set(
-            CourseAccessRole.objects.filter(user=user).all()
-        )
+        roles = None
+        use_cache = settings.FEATURES.get('CACHE_COURSE_ACCESS_ROLES', False)
+        if use_cache:
+            roles = cache.get(course_access_roles_cache_key(user.id))
+        if roles is None:
+            roles = [
+                (access_role.role, access_role.org, access_role.course_id)
+                for access_role in CourseAccessRole.objects.filter(user=user)
+            ]
+            if use_cache:
+                cache.set(course_access_roles_cache_key(user.id), roles, self.CACHE_TIMEOUT)
+
+        # The course_ids of the roles, by role and org
+        self._roles = defaultdict(list)
+        for role, org, course_id in roles:
+            self._roles[(role, org)].append(course_id)
 
     def has_role(self, role, course_id, org):
         """
         Return whether this RoleCache contains a role with the specified role, course_id, and org
         """
         return any(
-            access_role.role == role and
-            access_role.course_id == course_id and
-            access_role.org == org
-            for access_role in self._roles
+            role_course_id == course_id
+            for role_course_id in self._roles.get((role, org), ())
         )
 
 
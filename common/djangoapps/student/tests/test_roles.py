@@ -2,9 +2,14 @@
 Tests of student.roles
 """
 import ddt
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
 from django.test import TestCase
+from mock import patch
 
 from courseware.tests.factories import UserFactory, StaffFactory, InstructorFactory
+from student.models import course_access_roles_cache_key
 from student.tests.factories import AnonymousUserFactory
 
 from student.roles import (
@@ -191,3 +196,30 @@ class RoleCacheTestCase(TestCase):
     def test_empty_cache(self, role, target):
         cache = RoleCache(self.user)
         self.assertFalse(cache.has_role(*target))
+
+    @patch.dict(settings.FEATURES, {'CACHE_COURSE_ACCESS_ROLES': True})
+    def test_cached_across_requests(self):
+        cache.clear()
+        CourseStaffRole(self.IN_KEY).add_users(self.user)
+        RoleCache(self.user)
+
+        with self.assertNumQueries(0):
+            self.assertTrue(RoleCache(self.user).has_role('staff', self.IN_KEY, 'edX'))
+
+        # Changing the user's roles drops the cached ones
+        CourseStaffRole(self.IN_KEY).remove_users(self.user)
+        self.assertFalse(RoleCache(self.user).has_role('staff', self.IN_KEY, 'edX'))
+        CourseInstructorRole(self.IN_KEY).add_users(self.user)
+        self.assertTrue(RoleCache(self.user).has_role('instructor', self.IN_KEY, 'edX'))
+
+    @patch.dict(settings.FEATURES, {'CACHE_COURSE_ACCESS_ROLES': True})
+    def test_cached_roles_invalidated_after_request(self):
+        cache.clear()
+        CourseStaffRole(self.IN_KEY).add_users(self.user)
+
+        # Roles cached by a concurrent request before the change was committed
+        # are dropped again when the request ends
+        cache.set(course_access_roles_cache_key(self.user.id), [], 60)
+        self.assertFalse(RoleCache(self.user).has_role('staff', self.IN_KEY, 'edX'))
+        request_finished.send(sender=self.__class__)
+        self.assertTrue(RoleCache(self.user).has_role('staff', self.IN_KEY, 'edX'))
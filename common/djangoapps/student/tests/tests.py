@@ -14,6 +14,8 @@ from django.test import TestCase
 from django.test.utils import override_settings
 from django.test.client import RequestFactory, Client
 from django.contrib.auth.models import User, AnonymousUser
+from django.core.cache import cache
+from django.core.signals import request_finished
 from django.core.urlresolvers import reverse
 from django.contrib.sessions.middleware import SessionMiddleware
 
@@ -24,7 +26,10 @@ from opaque_keys.edx.locations import SlashSeparatedCourseKey
 
 from mock import Mock, patch
 
-from student.models import anonymous_id_for_user, user_by_anonymous_id, CourseEnrollment, unique_id_for_user
+from student.models import (
+    anonymous_id_for_user, anonymous_ids_for_users, user_by_anonymous_id, CourseEnrollment, unique_id_for_user,
+    AnonymousUserId, AnonymousUserIdRegistry, CourseEnrollmentCount, course_enrollment_states_cache_key
+)
 from student.views import (process_survey_link, _cert_info,
                            change_enrollment, complete_course_mode_info)
 from student.tests.factories import UserFactory, CourseModeFactory
@@ -360,6 +365,52 @@ class EnrollInCourseTest(TestCase):
         self.mock_tracker = patcher.start()
         self.addCleanup(patcher.stop)
 
+    @patch.dict(settings.FEATURES, {'CACHE_COURSE_ENROLLMENTS': True})
+    def test_cached_enrollment_states(self):
+        cache.clear()
+        user = User.objects.create_user("joe", "joe@joe.com", "password")
+        course_id = SlashSeparatedCourseKey("edX", "Test101", "2013")
+        course_id_partial = SlashSeparatedCourseKey("edX", "Test101", None)
+        other_course_id = SlashSeparatedCourseKey("edX", "Test102", "2013")
+
+        CourseEnrollment.enroll(user, course_id, mode="verified")
+        CourseEnrollment.enroll(user, other_course_id)
+        CourseEnrollment.unenroll(user, other_course_id)
+        self.assertTrue(CourseEnrollment.is_enrolled(user, course_id))
+
+        # Later checks are answered from the states cached on the user,
+        # or from the django cache for another user object
+        for same_user in (user, User.objects.get(id=user.id)):
+            with self.assertNumQueries(0):
+                self.assertTrue(CourseEnrollment.is_enrolled(same_user, course_id))
+                self.assertFalse(CourseEnrollment.is_enrolled(same_user, other_course_id))
+                self.assertTrue(CourseEnrollment.is_enrolled_by_partial(same_user, course_id_partial))
+                self.assertEqual(CourseEnrollment.enrollment_mode_for_user(same_user, course_id), ("verified", True))
+                self.assertEqual(
+                    CourseEnrollment.enrollment_states_for_user(same_user),
+                    {course_id: ("verified", True), other_course_id: ("honor", False)}
+                )
+
+        # Changes to enrollments are seen right away
+        CourseEnrollment.unenroll(user, course_id)
+        self.assertFalse(CourseEnrollment.is_enrolled(user, course_id))
+        self.assertFalse(CourseEnrollment.is_enrolled(User.objects.get(id=user.id), course_id))
+
+    @patch.dict(settings.FEATURES, {'CACHE_COURSE_ENROLLMENTS': True})
+    def test_cached_enrollment_states_invalidated_after_request(self):
+        cache.clear()
+        user = User.objects.create_user("joe", "joe@joe.com", "password")
+        course_id = SlashSeparatedCourseKey("edX", "Test101", "2013")
+        self.assertFalse(CourseEnrollment.is_enrolled(user, course_id))
+
+        # A concurrent request may cache the states from before the
+        # enrollment is committed; they're dropped again when the request ends
+        CourseEnrollment.enroll(user, course_id)
+        cache.set(course_enrollment_states_cache_key(user.id), {}, 60)
+        self.assertFalse(CourseEnrollment.is_enrolled(User.objects.get(id=user.id), course_id))
+        request_finished.send(sender=self.__class__)
+        self.assertTrue(CourseEnrollment.is_enrolled(User.objects.get(id=user.id), course_id))
+
     @unittest.skipUnless(settings.ROOT_URLCONF == 'lms.urls', 'Test only valid in lms')
     def test_enrollment(self):
         user = User.objects.create_user("joe", "joe@joe.com", "password")
@@ -582,6 +633,101 @@ class EnrollInCourseTest(TestCase):
         self.assert_enrollment_mode_change_event_was_emitted(user, course_id, "honor")
 
 
+class CourseEnrollmentCountTest(TestCase):
+    """Tests of the denormalized counts of course enrollments"""
+
+    def setUp(self):
+        self.course_id = SlashSeparatedCourseKey("edX", "Test101", "2013")
+        self.users = [UserFactory.create() for __ in range(3)]
+
+    def assert_counts(self, expected):
+        counts = CourseEnrollment.enrollment_counts(self.course_id)
+        self.assertEqual(dict(counts), dict(expected, total=sum(expected.values())))
+        self.assertEqual(CourseEnrollment.num_enrolled_in(self.course_id), sum(expected.values()))
+
+    def test_counts_follow_enrollments(self):
+        self.assert_counts({})
+
+        for user in self.users:
+            CourseEnrollment.enroll(user, self.course_id)
+        self.assert_counts({'honor': 3})
+
+        CourseEnrollment.enroll(self.users[0], self.course_id, "verified")
+        self.assert_counts({'honor': 2, 'verified': 1})
+
+        CourseEnrollment.unenroll(self.users[1], self.course_id)
+        self.assert_counts({'honor': 1, 'verified': 1})
+
+        # Unenrolling again doesn't count twice
+        CourseEnrollment.unenroll(self.users[1], self.course_id)
+        self.assert_counts({'honor': 1, 'verified': 1})
+
+        CourseEnrollment.objects.get(user=self.users[0], course_id=self.course_id).delete()
+        self.assert_counts({'honor': 1})
+
+        CourseEnrollment.enroll(self.users[1], self.course_id, "verified")
+        self.assert_counts({'honor': 1, 'verified': 1})
+
+    def test_stale_copies_counted_once(self):
+        CourseEnrollment.get_or_create_enrollment(self.users[0], self.course_id)
+        self.assert_counts({})
+
+        # Two concurrent requests load the same inactive enrollment
+        first = CourseEnrollment.objects.get(user=self.users[0], course_id=self.course_id)
+        second = CourseEnrollment.objects.get(user=self.users[0], course_id=self.course_id)
+        first.update_enrollment(is_active=True)
+        second.update_enrollment(is_active=True)
+        self.assert_counts({'honor': 1})
+
+        first.update_enrollment(is_active=False)
+        second.update_enrollment(mode="verified", is_active=False)
+        self.assert_counts({})
+
+        # Deleting a stale copy of an enrollment uncounts what's in the database
+        third = CourseEnrollment.objects.get(user=self.users[0], course_id=self.course_id)
+        CourseEnrollment.enroll(self.users[0], self.course_id)
+        self.assert_counts({'honor': 1})
+        third.delete()
+        self.assert_counts({})
+
+    def test_unchanged_save_not_counted(self):
+        CourseEnrollment.enroll(self.users[0], self.course_id)
+        enrollment = CourseEnrollment.objects.get(user=self.users[0], course_id=self.course_id)
+        with patch.object(CourseEnrollment, '_saved_count_key') as mock_saved_count_key:
+            with patch.object(CourseEnrollmentCount, 'increment') as mock_increment:
+                enrollment.save()
+        self.assertFalse(mock_saved_count_key.called)
+        self.assertFalse(mock_increment.called)
+
+        enrollment.update_enrollment(mode="verified")
+        self.assert_counts({'verified': 1})
+
+    def test_counts_summed_over_shards(self):
+        for shard, user in enumerate(self.users):
+            with patch('student.models.random.randrange', return_value=shard):
+                CourseEnrollment.enroll(user, self.course_id)
+        self.assertEqual(CourseEnrollmentCount.objects.filter(course_id=self.course_id).count(), 3)
+        self.assert_counts({'honor': 3})
+
+        with patch('student.models.random.randrange', return_value=0):
+            CourseEnrollment.unenroll(self.users[2], self.course_id)
+        self.assert_counts({'honor': 2})
+        self.assertEqual(CourseEnrollmentCount.reconcile(self.course_id), {})
+
+    def test_reconcile(self):
+        for user in self.users:
+            CourseEnrollment.enroll(user, self.course_id)
+        # Updates that bypass CourseEnrollment.save aren't counted
+        CourseEnrollment.objects.filter(user=self.users[0]).update(mode="verified")
+        CourseEnrollment.objects.filter(user=self.users[1]).update(is_active=False)
+        self.assert_counts({'honor': 3})
+
+        corrections = CourseEnrollmentCount.reconcile(self.course_id)
+        self.assertEqual(corrections, {'honor': (3, 1), 'verified': (0, 1)})
+        self.assert_counts({'honor': 1, 'verified': 1})
+        self.assertEqual(CourseEnrollmentCount.reconcile(self.course_id), {})
+
+
 @override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
 @unittest.skipUnless(settings.ROOT_URLCONF == 'lms.urls', 'Test only valid in lms')
 class ChangeEnrollmentViewTest(ModuleStoreTestCase):
@@ -736,3 +882,65 @@ class AnonymousLookupTable(TestCase):
         real_user = user_by_anonymous_id(anonymous_id)
         self.assertEqual(self.user, real_user)
         self.assertEqual(anonymous_id, anonymous_id_for_user(self.user, self.course.id, save=False))
+
+    def test_bulk_anonymous_ids(self):
+        users = [self.user, UserFactory()]
+        anonymous_ids = anonymous_ids_for_users(users, self.course.id)
+        self.assertEqual(
+            anonymous_ids,
+            dict((user.id, anonymous_id_for_user(user, self.course.id, save=False)) for user in users)
+        )
+        for user in users:
+            self.assertEqual(user, user_by_anonymous_id(anonymous_ids[user.id]))
+
+        # Storing the ids again doesn't create any new rows
+        anonymous_ids_for_users(User.objects.filter(id__in=anonymous_ids.keys()), self.course.id)
+        self.assertEqual(AnonymousUserId.objects.filter(course_id=self.course.id).count(), 2)
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+@patch.dict(settings.FEATURES, {'ENABLE_ANONYMOUS_USER_ID_REGISTRY': True})
+class AnonymousUserIdRegistryTest(TestCase):
+    """
+    Tests for storing anonymous user ids through an `AnonymousUserIdRegistry`
+    """
+    def setUp(self):
+        self.course_id = SlashSeparatedCourseKey("edX", "anonymous", "2014")
+        self.user = UserFactory()
+        self.registry = AnonymousUserIdRegistry()
+        cache.clear()
+        patcher = patch('student.models.ANONYMOUS_USER_ID_REGISTRY', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stored_before_handed_out(self):
+        anonymous_id = anonymous_id_for_user(self.user, self.course_id)
+        self.assertTrue(AnonymousUserId.objects.filter(anonymous_user_id=anonymous_id).exists())
+        self.assertEqual(self.user, user_by_anonymous_id(anonymous_id))
+
+    def test_new_ids_not_remembered(self):
+        # An id stored by the current transaction may still be rolled back
+        anonymous_id = anonymous_id_for_user(self.user, self.course_id)
+        self.assertFalse(self.registry.is_stored(anonymous_id))
+
+        user = User.objects.get(id=self.user.id)
+        anonymous_id_for_user(user, self.course_id)
+        self.assertTrue(self.registry.is_stored(anonymous_id))
+
+    def test_stored_ids_not_queried(self):
+        anonymous_id_for_user(self.user, self.course_id)
+        anonymous_id_for_user(User.objects.get(id=self.user.id), self.course_id)
+
+        # A fresh User object doesn't have the id memoized
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            anonymous_id_for_user(user, self.course_id)
+
+    def test_stored_ids_are_bounded(self):
+        registry = AnonymousUserIdRegistry(max_size=2)
+        users = [UserFactory() for __ in range(3)]
+        rows = [(user.id, self.course_id, user.username) for user in users]
+        registry.register_many(rows)
+        # Ids are remembered once they're found stored
+        registry.register_many(rows)
+        self.assertEqual(len(registry._stored), 2)  # pylint: disable=protected-access
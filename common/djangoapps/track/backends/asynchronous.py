@@ -0,0 +1,205 @@
+"""
+Event tracker backend that sends events to another backend asynchronously.
+
+Wrap a backend with `AsyncBackend` to take its sends out of the request
+thread::
+
+  TRACKING_BACKENDS = {
+      'mongo': {
+          'ENGINE': 'track.backends.asynchronous.AsyncBackend',
+          'OPTIONS': {
+              'backend': {
+                  'ENGINE': 'track.backends.mongodb.MongoBackend',
+                  'OPTIONS': { ... }
+              },
+              'max_queue_size': 10000,
+              'batch_size': 100,
+              'flush_interval': 1.0,
+          }
+      }
+  }
+
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import logging
+import os
+import Queue
+import threading
+import time
+
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger(__name__)
+
+# Only ever taken by a forked process replacing the state it inherited, so
+# it can't be held by another thread when a process forks.
+_AFTER_FORK_LOCK = threading.Lock()
+
+
+class AsyncBackend(BaseBackend):
+    """
+    Event tracker backend that queues events in memory, and sends them to
+    the wrapped backend in batches from a background thread.
+
+    The queue is bounded: when the wrapped backend can't keep up, new
+    events are dropped (and counted) rather than slowing down requests.
+    Queued events are sent when the process exits.
+
+    """
+
+    def __init__(self, backend, max_queue_size=10000, batch_size=100, flush_interval=1.0, **kwargs):
+        """
+        :Parameters:
+
+          - `backend`: configuration of the wrapped backend, with an
+            `ENGINE` and `OPTIONS`, as in settings.TRACKING_BACKENDS
+          - `max_queue_size`: maximum number of events waiting to be sent
+          - `batch_size`: maximum number of events sent at once
+          - `flush_interval`: maximum number of seconds that an event waits
+            for others to be batched with
+
+        """
+        super(AsyncBackend, self).__init__(**kwargs)
+
+        # Imported here, as the tracker module initializes the backends when imported
+        from track.tracker import _instantiate_backend_from_name  # pylint: disable=protected-access
+        self.backend = _instantiate_backend_from_name(backend['ENGINE'], backend.get('OPTIONS', {}))
+
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self._reset()
+
+        atexit.register(self.close)
+
+    def _reset(self):
+        """
+        Create the queue, locks and counters of the backend, for the current
+        process.
+
+        """
+        self.queue = Queue.Queue(self.max_queue_size)
+
+        self.sent_count = 0
+        self.dropped_count = 0
+        self.failed_count = 0
+
+        self._send_lock = threading.Lock()
+        self._worker_lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._stopping = threading.Event()
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        """
+        Replace the state inherited from the parent process after a fork.
+
+        The parent's queue and locks may have been held by one of its threads
+        at the time of the fork, which would then never release them in the
+        child, and the events it had queued are its own to send.
+
+        """
+        if self._pid == os.getpid():
+            return
+        with _AFTER_FORK_LOCK:
+            if self._pid != os.getpid():
+                self._reset()
+
+    def send(self, event):
+        """Queue the event to be sent by the background thread."""
+        self._check_pid()
+        self._ensure_worker()
+        try:
+            self.queue.put_nowait(event)
+        except Queue.Full:
+            self.dropped_count += 1
+            dog_stats_api.increment('track.backends.async.dropped')
+
+    def _ensure_worker(self):
+        """
+        Start the background thread, unless it's already running in this
+        process. Threads don't survive forking, so forked workers each start
+        their own, after `_check_pid` has replaced the inherited state.
+
+        """
+        if self._worker is not None and self._worker_pid == os.getpid():
+            return
+
+        with self._worker_lock:
+            if self._worker is None or self._worker_pid != os.getpid():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name='track.backends.async')
+                self._worker.daemon = True
+                self._worker_pid = os.getpid()
+                self._worker.start()
+
+    def _run(self):
+        """Send batches of events until the backend is closed."""
+        while not self._stopping.is_set():
+            batch = self._next_batch(block=True)
+            if batch:
+                self._send_batch(batch)
+
+    def _next_batch(self, block):
+        """
+        Take the next batch of events from the queue. If `block` is true,
+        wait up to `flush_interval` for the first event, and then up to
+        `flush_interval` more for the rest of the batch.
+
+        """
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if block and remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except Queue.Empty:
+                if batch or not block or self._stopping.is_set():
+                    break
+                deadline = time.time() + self.flush_interval
+        return batch
+
+    def _send_batch(self, batch):
+        """Send `batch` to the wrapped backend."""
+        with self._send_lock:
+            try:
+                with dog_stats_api.timer('track.backends.async.send_many'):
+                    self.backend.send_many(batch)
+                self.sent_count += len(batch)
+            except Exception:  # pylint: disable=broad-except
+                self.failed_count += len(batch)
+                dog_stats_api.increment('track.backends.async.failed', len(batch))
+                log.exception('Error sending %d events to the event tracker backend', len(batch))
+
+    def flush(self):
+        """Send all the queued events now, from the calling thread."""
+        self._check_pid()
+        while True:
+            batch = self._next_batch(block=False)
+            if not batch:
+                break
+            self._send_batch(batch)
+
+    def close(self, timeout=5):
+        """
+        Stop the background thread, waiting up to `timeout` seconds for it
+        to finish its current batch, and send the events still queued.
+
+        """
+        self._check_pid()
+        self._stopping.set()
+        worker = self._worker
+        if worker is not None and worker.is_alive() and self._worker_pid == os.getpid():
+            worker.join(timeout)
+        self._worker = None
+        self.flush()
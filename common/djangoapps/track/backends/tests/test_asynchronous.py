@@ -0,0 +1,90 @@
+from __future__ import absolute_import
+
+import os
+import threading
+
+from django.test import TestCase
+from mock import patch
+
+from track.backends import BaseBackend
+from track.backends.asynchronous import AsyncBackend
+
+
+class RecordingBackend(BaseBackend):
+    """Backend that records the batches of events it's sent."""
+    def __init__(self, **options):
+        super(RecordingBackend, self).__init__(**options)
+        self.batches = []
+        self.sent = threading.Event()
+
+    def send(self, event):
+        self.send_many([event])
+
+    def send_many(self, events):
+        self.batches.append(list(events))
+        self.sent.set()
+
+
+class TestAsyncBackend(TestCase):
+    def make_backend(self, **options):
+        backend = AsyncBackend(
+            backend={'ENGINE': 'track.backends.tests.test_asynchronous.RecordingBackend'},
+            **options
+        )
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_events_sent_in_background(self):
+        backend = self.make_backend(flush_interval=0.01)
+        backend.send({'test': 1})
+
+        self.assertTrue(backend.backend.sent.wait(5))
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+        self.assertEqual(backend.sent_count, 1)
+
+    def test_events_sent_in_batches(self):
+        backend = self.make_backend(batch_size=2)
+        backend._ensure_worker = lambda: None  # pylint: disable=protected-access
+        for index in range(5):
+            backend.send({'test': index})
+
+        backend.flush()
+        self.assertEqual(
+            backend.backend.batches,
+            [[{'test': 0}, {'test': 1}], [{'test': 2}, {'test': 3}], [{'test': 4}]]
+        )
+
+    def test_full_queue_drops_events(self):
+        backend = self.make_backend(max_queue_size=2)
+        backend._ensure_worker = lambda: None  # pylint: disable=protected-access
+        for index in range(3):
+            backend.send({'test': index})
+
+        self.assertEqual(backend.dropped_count, 1)
+        backend.flush()
+        self.assertEqual(backend.backend.batches, [[{'test': 0}, {'test': 1}]])
+
+    def test_close_sends_queued_events(self):
+        backend = self.make_backend()
+        backend._ensure_worker = lambda: None  # pylint: disable=protected-access
+        backend.send({'test': 1})
+
+        backend.close()
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+
+    def test_forked_process_replaces_inherited_state(self):
+        backend = self.make_backend()
+        backend._ensure_worker = lambda: None  # pylint: disable=protected-access
+        backend.send({'test': 1})
+        parent_queue = backend.queue
+        parent_send_lock = backend._send_lock  # pylint: disable=protected-access
+        parent_send_lock.acquire()
+        self.addCleanup(parent_send_lock.release)
+
+        with patch('track.backends.asynchronous.os.getpid', return_value=os.getpid() + 1):
+            # A lock held in the parent doesn't block the child, which only
+            # sends its own events
+            backend.send({'test': 2})
+            self.assertIsNot(backend.queue, parent_queue)
+            backend.flush()
+        self.assertEqual(backend.backend.batches, [[{'test': 2}]])
@@ -153,6 +153,17 @@ def replace_static_urls(data_dir, block, view, frag, context, course_id=None, st
     ))
 
 
+def rewrite_urls(url_rewriter, block, view, frag, context):  # pylint: disable=unused-argument
+    """
+    Substitutes the urls of the fragment with the supplied
+    static_replace.UrlRewriter, which replaces the /static/... urls, and the
+    /course/... and /jump_to_id/... urls of its course in a single pass. This
+    is the same as applying the replace_static_urls, replace_course_urls and
+    replace_jump_to_id_urls wrappers in turn.
+    """
+    return wrap_fragment(frag, url_rewriter.replace_urls(frag.content))
+
+
 def grade_histogram(module_id):
     '''
     Print out a histogram of grades on a given problem in staff member debug info.
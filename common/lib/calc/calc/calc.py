@@ -7,10 +7,12 @@ Uses pyparsing to parse. Main function as of now is evaluator().
 import math
 import operator
 import numbers
+import threading
 import numpy
 import scipy.constants
 import functions
 
+from collections import OrderedDict
 from pyparsing import (
     Word, Literal, CaselessLiteral, ZeroOrMore, MatchFirst, Optional, Forward,
     Group, ParseResults, stringEnd, Suppress, Combine, alphas, nums, alphanums
@@ -224,38 +226,262 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
      python numbers.
     -Unary functions are passed as a dictionary from string to function.
     """
-    # No need to go further.
-    if math_expr.strip() == "":
-        return float('nan')
+    return compile_expression(math_expr, case_sensitive).evaluate(variables, functions)
 
-    # Parse the tree.
-    math_interpreter = ParseAugmenter(math_expr, case_sensitive)
-    math_interpreter.parse_algebra()
 
-    # Get our variables together.
-    all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
+# Functions of `functions` that can be applied to numpy arrays elementwise.
+# (`arccot` branches on the sign of its input, so it can't.)
+ARRAY_FUNCTIONS = frozenset([
+    functions.sec, functions.csc, functions.cot,
+    functions.arcsec, functions.arccsc,
+    functions.sech, functions.csch, functions.coth,
+    functions.arcsech, functions.arccsch, functions.arccoth,
+])
 
-    # ...and check them
-    math_interpreter.check_variables(all_variables, all_functions)
 
-    # Create a recursion to evaluate the tree.
-    if case_sensitive:
-        casify = lambda x: x
-    else:
-        casify = lambda x: x.lower()  # Lowercase for case insens.
-
-    evaluate_actions = {
-        'number': eval_number,
-        'variable': lambda x: all_variables[casify(x[0])],
-        'function': lambda x: all_functions[casify(x[0])](x[1]),
-        'atom': eval_atom,
-        'power': eval_power,
-        'parallel': eval_parallel,
-        'product': eval_product,
-        'sum': eval_sum
+def compile_actions(casify, vectorized=False):
+    """
+    Return the actions that `ParseAugmenter.reduce_tree` uses to compile a
+    parse tree into a function of `(all_variables, all_functions)`.
+
+    The compiled functions compute the same thing as the `eval_*` actions,
+    but the operators are sorted out once, at compile time. If `vectorized`,
+    the variables may be numpy arrays of values, and the compiled function
+    returns the array of the results for each of them.
+    """
+    def constant(value):
+        """Compile a node that always has `value`."""
+        return lambda all_variables, all_functions: value
+
+    def operands(parse_result):
+        """The compiled child nodes of a node, without its operator strings."""
+        return [kid for kid in parse_result if callable(kid)]
+
+    def operations(parse_result, operators):
+        """
+        Pair the compiled child nodes of a node with the operator preceding
+        them, or with `None` if there isn't any.
+        """
+        result = []
+        current_op = None
+        for token in parse_result:
+            if callable(token):
+                result.append((operators.get(current_op), token))
+                current_op = None
+            else:
+                current_op = token
+        return result
+
+    def compile_number(parse_result):
+        return constant(eval_number(parse_result))
+
+    def compile_variable(parse_result):
+        name = casify(parse_result[0])
+        return lambda all_variables, all_functions: all_variables[name]
+
+    def compile_function(parse_result):
+        name = casify(parse_result[0])
+        argument = parse_result[1]
+
+        def function(all_variables, all_functions):
+            func = all_functions[name]
+            value = argument(all_variables, all_functions)
+            if (vectorized and isinstance(value, numpy.ndarray) and
+                    not isinstance(func, numpy.ufunc) and func not in ARRAY_FUNCTIONS):
+                return numpy.array([func(item) for item in value])
+            return func(value)
+        return function
+
+    def compile_atom(parse_result):
+        return operands(parse_result)[0]
+
+    def compile_power(parse_result):
+        # Exponentiate right to left, as `eval_power` does.
+        kids = list(reversed(operands(parse_result)))
+        if len(kids) == 1:
+            return kids[0]
+
+        def power(all_variables, all_functions):
+            values = [kid(all_variables, all_functions) for kid in kids]
+            return reduce(lambda a, b: b ** a, values)
+        return power
+
+    def compile_parallel(parse_result):
+        kids = operands(parse_result)
+        if len(kids) == 1:
+            return kids[0]
+
+        def parallel(all_variables, all_functions):
+            values = [kid(all_variables, all_functions) for kid in kids]
+            if not vectorized:
+                return eval_parallel(values)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                result = 1. / sum(1. / numpy.asarray(value) for value in values)
+            has_zero = reduce(numpy.logical_or, [numpy.asarray(value) == 0 for value in values])
+            return numpy.where(has_zero, float('nan'), result)
+        return parallel
+
+    def compile_product(parse_result):
+        kids = operations(parse_result, {None: operator.mul, '*': operator.mul, '/': operator.truediv})
+
+        def product(all_variables, all_functions):
+            prod = 1.0
+            for current_op, kid in kids:
+                prod = current_op(prod, kid(all_variables, all_functions))
+            return prod
+        return product
+
+    def compile_sum(parse_result):
+        kids = operations(parse_result, {None: operator.add, '+': operator.add, '-': operator.sub})
+
+        def total(all_variables, all_functions):
+            result = 0.0
+            for current_op, kid in kids:
+                result = current_op(result, kid(all_variables, all_functions))
+            return result
+        return total
+
+    return {
+        'number': compile_number,
+        'variable': compile_variable,
+        'function': compile_function,
+        'atom': compile_atom,
+        'power': compile_power,
+        'parallel': compile_parallel,
+        'product': compile_product,
+        'sum': compile_sum,
     }
 
-    return math_interpreter.reduce_tree(evaluate_actions)
+
+class CompiledExpression(object):
+    """
+    A math expression, parsed once, that can then be evaluated for many
+    different variables.
+
+    Use `compile_expression` to get the compiled expression of a string, so
+    that expressions that are evaluated repeatedly are only parsed once.
+    """
+    def __init__(self, math_expr, case_sensitive=False):
+        """
+        Parse and compile `math_expr`. Raises a `pyparsing.ParseException` if
+        it isn't a valid expression.
+        """
+        self.math_expr = math_expr
+        self.case_sensitive = case_sensitive
+        if case_sensitive:
+            self.casify = lambda x: x
+        else:
+            self.casify = lambda x: x.lower()  # Lowercase for case insens.
+
+        self.parser = None
+        self.function = None
+        self._vectorized_function = None
+        if math_expr.strip() != "":
+            self.parser = ParseAugmenter(math_expr, case_sensitive)
+            self.parser.parse_algebra()
+            self.function = self.parser.reduce_tree(compile_actions(self.casify))
+
+    def evaluate(self, variables, functions):
+        """
+        Evaluate the expression for `variables` and `functions`, like
+        `evaluator`.
+        """
+        # No need to go further.
+        if self.parser is None:
+            return float('nan')
+
+        # Get our variables together, and check them.
+        all_variables, all_functions = add_defaults(variables, functions, self.case_sensitive)
+        self.parser.check_variables(all_variables, all_functions)
+
+        return self.function(all_variables, all_functions)
+
+    def evaluate_many(self, variables_list, functions):
+        """
+        Evaluate the expression for each of the dictionaries of variables in
+        `variables_list`, and return the list of results.
+
+        When every dictionary has the same numeric variables, the expression is
+        evaluated once, on numpy arrays of all of their values. If that fails,
+        or gives any non-finite result, the samples are evaluated one by one so
+        that the results (and errors) are exactly those of `evaluate`.
+        """
+        if self.parser is None:
+            return [float('nan')] * len(variables_list)
+
+        arrays = self._variable_arrays(variables_list)
+        if arrays is not None:
+            all_variables, all_functions = add_defaults(arrays, functions, self.case_sensitive)
+            self.parser.check_variables(all_variables, all_functions)
+
+            if self._vectorized_function is None:
+                self._vectorized_function = self.parser.reduce_tree(
+                    compile_actions(self.casify, vectorized=True)
+                )
+            try:
+                with numpy.errstate(all='ignore'):
+                    results = numpy.asarray(self._vectorized_function(all_variables, all_functions))
+                if results.shape != (len(variables_list),):
+                    results = numpy.repeat(results.reshape(-1)[:1], len(variables_list))
+                if numpy.all(numpy.isfinite(results)):
+                    return list(results)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+        return [self.evaluate(variables, functions) for variables in variables_list]
+
+    @staticmethod
+    def _variable_arrays(variables_list):
+        """
+        Return a dict of the numpy arrays of the values of each variable in
+        `variables_list`, or None if the dictionaries don't all have the same
+        numeric variables.
+        """
+        if not variables_list:
+            return None
+        names = set(variables_list[0])
+        if any(set(variables) != names for variables in variables_list):
+            return None
+
+        arrays = {}
+        for name in names:
+            values = [variables[name] for variables in variables_list]
+            if not all(isinstance(value, numbers.Number) for value in values):
+                return None
+            array = numpy.array(values)
+            if array.dtype.kind not in 'fc':
+                # Integer arrays don't exponentiate or overflow like Python ints
+                array = array.astype(float)
+            arrays[name] = array
+        return arrays
+
+
+# Number of compiled expressions kept by `compile_expression`.
+MAX_COMPILED_EXPRESSIONS = 1000
+
+_COMPILED_EXPRESSIONS = OrderedDict()
+_COMPILED_EXPRESSIONS_LOCK = threading.Lock()
+
+
+def compile_expression(math_expr, case_sensitive=False):
+    """
+    Return the `CompiledExpression` of `math_expr`, reusing the most recently
+    compiled expressions rather than parsing them again.
+    """
+    key = (math_expr, case_sensitive)
+    with _COMPILED_EXPRESSIONS_LOCK:
+        expression = _COMPILED_EXPRESSIONS.pop(key, None)
+        if expression is not None:
+            _COMPILED_EXPRESSIONS[key] = expression
+            return expression
+
+    # Parse outside of the lock; parsing failures aren't cached.
+    expression = CompiledExpression(math_expr, case_sensitive)
+    with _COMPILED_EXPRESSIONS_LOCK:
+        _COMPILED_EXPRESSIONS[key] = expression
+        while len(_COMPILED_EXPRESSIONS) > MAX_COMPILED_EXPRESSIONS:
+            _COMPILED_EXPRESSIONS.popitem(last=False)
+    return expression
 
 
 class ParseAugmenter(object):
@@ -558,3 +558,62 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Run tests for calc.compile_expression, and the evaluation of compiled
+    expressions for many samples at once.
+    """
+
+    def test_expressions_compiled_once(self):
+        """
+        Compiling the same expression twice should reuse the first compilation
+        """
+        expression = calc.compile_expression('x^2 + 1')
+        self.assertIs(expression, calc.compile_expression('x^2 + 1'))
+        self.assertIsNot(expression, calc.compile_expression('x^2 + 1', case_sensitive=True))
+        self.assertEqual(expression.evaluate({'x': 3.0}, {}), 10.0)
+        self.assertEqual(expression.evaluate({'X': 2.0}, {}), 5.0)
+
+    def test_parse_errors_not_cached(self):
+        """
+        Invalid expressions should raise every time they're compiled
+        """
+        for _ in range(2):
+            with self.assertRaises(ParseException):
+                calc.compile_expression('1+.')
+
+    def test_evaluate_many(self):
+        """
+        Evaluating for many samples should give the results of evaluating
+        each of them
+        """
+        samples = [{'x': value, 'y': value / 2} for value in (0.5, 1.0, 2.5, 7.0)]
+        functions = {'f': lambda x: x * 2}
+        for expr in ('x^y^2', '-x + 2*y - 3', 'x || y', 'sin(x)/cos(y)', 'f(x)*y', 'fact(3)*x', 'x/2k', 'pi'):
+            expected = [calc.evaluator(sample, functions, expr) for sample in samples]
+            results = calc.compile_expression(expr).evaluate_many(samples, functions)
+            self.assertEqual(len(results), len(samples))
+            for result, expected_result in zip(results, expected):
+                self.assertAlmostEqual(result, expected_result, places=12)
+
+    def test_evaluate_many_errors(self):
+        """
+        Samples that can't be evaluated should raise the errors of
+        evaluating them one at a time
+        """
+        samples = [{'x': -1.0}, {'x': 0.0}, {'x': 1.0}]
+        with self.assertRaises(ZeroDivisionError):
+            calc.compile_expression('1/x').evaluate_many(samples, {})
+        with self.assertRaises(ValueError):
+            calc.compile_expression('fact(x)').evaluate_many(samples, {})
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'y'):
+            calc.compile_expression('x+y').evaluate_many(samples, {})
+
+        # ...and samples that evaluate to NaN should still do so
+        samples = [{'x': 3.0}, {'x': 0.0}, {'x': 1.0}]
+        results = calc.compile_expression('x || 1').evaluate_many(samples, {})
+        self.assertEqual(results[0], 0.75)
+        self.assertTrue(numpy.isnan(results[1]))
+        self.assertEqual(results[2], 0.5)
@@ -248,9 +248,11 @@ class BulkOperationsMixin(object):
         if bulk_ops_record.active:
             return
 
-        self._end_outermost_bulk_operation(bulk_ops_record, course_key)
-
-        self._clear_bulk_ops_record(course_key)
+        try:
+            self._end_outermost_bulk_operation(bulk_ops_record, course_key)
+        finally:
+            # don't leave the state of a failed bulk operation to the next one on the course
+            self._clear_bulk_ops_record(course_key)
 
     def _is_in_bulk_operation(self, course_key, ignore_case=False):
         """
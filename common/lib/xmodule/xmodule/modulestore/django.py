@@ -42,6 +42,26 @@ def load_function(path):
     return getattr(import_module(module_path), name)
 
 
+# The django cache shared by the split modulestores' structure caches, created once so that
+# modulestores configured with the same settings share a StructureCache (see shared_structure_cache)
+_SPLIT_STRUCTURE_CACHE = None
+_SPLIT_STRUCTURE_CACHE_LOCK = threading.Lock()
+
+
+def _split_structure_cache():
+    """
+    Returns the 'split_structures' django cache, or None if it isn't configured
+    """
+    global _SPLIT_STRUCTURE_CACHE  # pylint: disable=global-statement
+    with _SPLIT_STRUCTURE_CACHE_LOCK:
+        if _SPLIT_STRUCTURE_CACHE is None:
+            try:
+                _SPLIT_STRUCTURE_CACHE = get_cache('split_structures')
+            except InvalidCacheBackendError:
+                return None
+        return _SPLIT_STRUCTURE_CACHE
+
+
 def create_modulestore_instance(engine, content_store, doc_store_config, options, i18n_service=None, fs_service=None):
     """
     This will return a new instance of a modulestore given an engine and options
@@ -66,9 +86,12 @@ def create_modulestore_instance(engine, content_store, doc_store_config, options
     except InvalidCacheBackendError:
         metadata_inheritance_cache = get_cache('default')
 
+    split_structure_cache = _split_structure_cache()
+
     return class_(
         contentstore=content_store,
         metadata_inheritance_cache_subsystem=metadata_inheritance_cache,
+        structure_cache_subsystem=split_structure_cache,
         request_cache=request_cache,
         xblock_mixins=getattr(settings, 'XBLOCK_MIXINS', ()),
         xblock_select=getattr(settings, 'XBLOCK_SELECT_FUNCTION', None),
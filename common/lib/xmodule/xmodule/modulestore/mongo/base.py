@@ -12,10 +12,10 @@ structure:
 }
 """
 
+import itertools
 import pymongo
 import sys
 import logging
-import copy
 import re
 from uuid import uuid4
 
@@ -53,6 +53,9 @@ SORT_REVISION_FAVOR_DRAFT = ('_id.revision', pymongo.DESCENDING)
 # sort order that returns PUBLISHED items first
 SORT_REVISION_FAVOR_PUBLISHED = ('_id.revision', pymongo.ASCENDING)
 
+# Seconds for which the metadata inheritance tree of a course can be locked while it's computed
+METADATA_INHERITANCE_LOCK_TIMEOUT = 60
+
 BLOCK_TYPES_WITH_CHILDREN = list(set(
     name for name, class_ in XBlock.load_classes() if getattr(class_, 'has_children', False)
 ))
@@ -137,6 +140,85 @@ class MongoKeyValueStore(InheritanceKeyValueStore):
             return False
 
 
+class MetadataInheritanceTree(object):
+    """
+    The inheritable metadata of a course's containers, for computing the metadata
+    that each block in the course inherits.
+
+    Every container's own inheritable metadata is stored once, along with the parent
+    of every block, rather than a copy of the merged metadata per block. This keeps
+    the cached tree small, and lets the tree be updated for a single edited container
+    without recomputing it for the whole course.
+
+    Blocks are identified by their (published) location urls.
+    """
+    def __init__(self, root=None):
+        self.root = root
+        # container url -> its own inheritable metadata
+        self.metadata = {}
+        # block url -> the url of its parent container
+        self.parents = {}
+        # container url -> set of the urls of its children
+        self.children = {}
+        # container url -> the merged metadata of the container and its ancestors
+        self._resolved = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_resolved'] = {}
+        return state
+
+    def set_container(self, url, metadata, children):
+        """
+        Set the inheritable metadata and the children of the container at url
+        """
+        children = set(children)
+        for child in self.children.get(url, set()) - children:
+            if self.parents.get(child) == url:
+                del self.parents[child]
+        for child in children:
+            self.parents[child] = url
+        self.metadata[url] = metadata
+        self.children[url] = children
+        self._resolved = {}
+
+    def _resolve(self, url):
+        """
+        Return the merged metadata of the container at url and its ancestors, or
+        None if the container isn't in the course tree.
+        """
+        chain = []
+        current = url
+        while current not in self._resolved and current != self.root:
+            if current not in self.parents or current in chain:
+                return None
+            chain.append(current)
+            current = self.parents[current]
+
+        if current not in self._resolved:
+            self._resolved[current] = self.metadata.get(current, {})
+        merged = self._resolved[current]
+        for container in reversed(chain):
+            if merged is not None:
+                merged = dict(merged)
+                merged.update(self.metadata.get(container, {}))
+            self._resolved[container] = merged
+        return merged
+
+    def get(self, url, default=None):
+        """
+        Return the metadata that the block at url inherits, or default if it isn't in the
+        course tree. For containers, this includes their own inheritable metadata.
+        """
+        if url not in self.parents:
+            return default
+        if url in self.metadata:
+            inherited = self._resolve(url)
+        else:
+            inherited = self._resolve(self.parents[url])
+        return default if inherited is None else inherited
+
+
 class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
     """
     A system that has a cache of module json that it will use to load modules
@@ -411,9 +493,28 @@ class MongoBulkOpsMixin(BulkOperationsMixin):
         Refresh the meta-data inheritance cache now since it was temporarily disabled.
         """
         if bulk_ops_record.dirty:
+            self._update_course_subtree_edited_on(course_id)
             self.refresh_cached_metadata_inheritance_tree(course_id)
             bulk_ops_record.dirty = False  # brand spanking clean now
 
+    def _update_course_subtree_edited_on(self, course_id):
+        """
+        Writes inside bulk operations don't update the subtree edit info of
+        their ancestors, so update the course's once the bulk operation is over,
+        so that its `subtree_edited_on` changes whenever any of its content does.
+        """
+        course_id = self.fill_in_run(course_id.for_branch(None))
+        if course_id.run is None:
+            return
+        try:
+            self._update_single_item(
+                course_id.make_usage_key('course', course_id.run),
+                {'edit_info.subtree_edited_on': datetime.now(UTC)}
+            )
+        except ItemNotFoundError:
+            # the course was deleted by the bulk operation
+            pass
+
     def _is_in_bulk_operation(self, course_id, ignore_case=False):
         """
         Returns whether a bulk operation is in progress for the given course.
@@ -549,16 +650,8 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             ('_id.course', course_id.course),
             ('_id.category', {'$in': BLOCK_TYPES_WITH_CHILDREN})
         ])
-        # we just want the Location, children, and inheritable metadata
-        record_filter = {'_id': 1, 'definition.children': 1}
-
-        # just get the inheritable metadata since that is all we need for the computation
-        # this minimizes both data pushed over the wire
-        for field_name in InheritanceMixin.fields:
-            record_filter['metadata.{0}'.format(field_name)] = 1
-
         # call out to the DB
-        resultset = self.collection.find(query, record_filter)
+        resultset = self.collection.find(query, self._inheritance_record_filter())
 
         # it's ok to keep these as deprecated strings b/c the overall cache is indexed by course_key and this
         # is a dictionary relative to that course
@@ -583,49 +676,153 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             if location.category == 'course':
                 root = location_url
 
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
+        tree = MetadataInheritanceTree(root)
+        for location_url, result in results_by_url.iteritems():
+            tree.set_container(
+                location_url, result.get('metadata', {}), result.get('definition', {}).get('children', [])
+            )
+        return tree
+
+    def _inheritance_record_filter(self):
+        """
+        Returns the fields of the records of containers needed to compute the metadata inheritance tree
+        """
+        # we just want the Location, children, and inheritable metadata
+        record_filter = {'_id': 1, 'definition.children': 1}
 
-        def _compute_inherited_metadata(url):
+        # just get the inheritable metadata since that is all we need for the computation
+        # this minimizes both data pushed over the wire
+        for field_name in InheritanceMixin.fields:
+            record_filter['metadata.{0}'.format(field_name)] = 1
+        return record_filter
+
+    def _update_metadata_inheritance_tree(self, course_id, location):
+        """
+        Update the cached metadata inheritance tree of the course for an edit of the block at
+        location, without recomputing the rest of the tree. Returns the updated tree, or None
+        if there is no cached tree to update, or it can't be updated right now.
+        """
+        # edits to leaves don't change what any block inherits
+        if location.category not in BLOCK_TYPES_WITH_CHILDREN:
+            tree = self._find_cached_metadata_inheritance_tree(course_id)
+            return tree if isinstance(tree, MetadataInheritanceTree) else None
+
+        def update_tree():
             """
-            Helper method for computing inherited metadata for a specific location url
+            Returns the cached tree with the container at location re-read from the db.
             """
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
+            tree = self._find_cached_metadata_inheritance_tree(course_id, shared_only=True)
+            if not isinstance(tree, MetadataInheritanceTree):
+                return None
+
+            # the children of both the draft and published versions of a container are in the tree
+            resultset = self.collection.find(
+                {'_id': {'$in': [
+                    location.replace(revision=revision).to_deprecated_son()
+                    for revision in (MongoRevisionKey.published, MongoRevisionKey.draft)
+                ]}},
+                self._inheritance_record_filter()
+            )
+            metadata = None
+            children = []
+            for result in resultset:
+                if metadata is None:
+                    metadata = result.get('metadata', {})
+                children.extend(result.get('definition', {}).get('children', []))
+            if metadata is None:
+                return None
+
+            location_url = unicode(as_published(location))
+            tree.set_container(location_url, metadata, children)
+            if location.category == 'course':
+                tree.root = location_url
+            return tree
+
+        return self._write_metadata_inheritance_tree(course_id, update_tree, is_edit=True, can_wait=False)
+
+    def _write_metadata_inheritance_tree(self, course_id, compute_tree, is_edit, can_wait=True):
+        """
+        Computes the metadata inheritance tree of the course by calling compute_tree, and caches it.
+        Returns the tree, or None if compute_tree returned None.
+
+        Computing the tree and writing it to the caching subsystem happen under a lock, so that
+        concurrent edits can't overwrite the tree with ones that miss each other's changes. An edit
+        that finds the lock taken invalidates the cached tree instead, and the holder of the lock
+        doesn't keep the tree it wrote if any edit did so meanwhile, as the tree may miss it. If
+        can_wait is False, the tree isn't computed when the lock is taken, and None is returned.
+        """
+        cache = self.metadata_inheritance_cache_subsystem
+        if cache is None:
+            tree = compute_tree()
+        else:
+            cache_key = unicode(course_id)
+            lock_key = u'{}.lock'.format(cache_key)
+            stale_key = u'{}.stale'.format(cache_key)
+            if cache.add(lock_key, True, METADATA_INHERITANCE_LOCK_TIMEOUT):
+                try:
+                    tree = compute_tree()
+                    if tree is not None:
+                        cache.set(cache_key, tree)
+                        if cache.get(stale_key):
+                            cache.delete(stale_key)
+                            cache.delete(cache_key)
+                finally:
+                    cache.delete(lock_key)
+            else:
+                if is_edit:
+                    # the stale marker has to be set before deleting the tree, see above
+                    cache.set(stale_key, True, METADATA_INHERITANCE_LOCK_TIMEOUT)
+                    cache.delete(cache_key)
+                if not can_wait:
+                    return None
+                # don't write the tree to the caching subsystem without the lock
+                tree = compute_tree()
+
+        if tree is not None:
+            self._cache_metadata_inheritance_tree(course_id, tree)
+        return tree
 
-        if root is not None:
-            _compute_inherited_metadata(root)
+    def _find_cached_metadata_inheritance_tree(self, course_id, shared_only=False):
+        """
+        Returns the metadata inheritance tree of the course from the request cache or the caching
+        subsystem, or None if it isn't cached. If shared_only is True, and there is a caching
+        subsystem, the request cache isn't looked at.
+        """
+        use_request_cache = not (shared_only and self.metadata_inheritance_cache_subsystem is not None)
 
-        return metadata_to_inherit
+        # see if we are first in the request cache (if present)
+        if use_request_cache and self.request_cache is not None and \
+                unicode(course_id) in self.request_cache.data.get('metadata_inheritance', {}):
+            return self.request_cache.data['metadata_inheritance'][unicode(course_id)]
+
+        # then look in any caching subsystem (e.g. memcached)
+        if self.metadata_inheritance_cache_subsystem is not None:
+            return self.metadata_inheritance_cache_subsystem.get(unicode(course_id), None)
+        return None
+
+    def _cache_metadata_inheritance_tree(self, course_id, tree):
+        """
+        Writes out the metadata inheritance tree of the course to the request cache. Trees are written
+        to the caching subsystem by `_write_metadata_inheritance_tree`.
+        """
+        if self.request_cache is not None:
+            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
+            # defined
+            if 'metadata_inheritance' not in self.request_cache.data:
+                self.request_cache.data['metadata_inheritance'] = {}
+            self.request_cache.data['metadata_inheritance'][unicode(course_id)] = tree
 
     def _get_cached_metadata_inheritance_tree(self, course_id, force_refresh=False):
         '''
-        Compute the metadata inheritance for the course.
+        Compute the metadata inheritance for the course. force_refresh is used when the course
+        was edited, to recompute the tree.
         '''
         tree = {}
 
         course_id = self.fill_in_run(course_id)
         if not force_refresh:
-            # see if we are first in the request cache (if present)
-            if self.request_cache is not None and unicode(course_id) in self.request_cache.data.get('metadata_inheritance', {}):
-                return self.request_cache.data['metadata_inheritance'][unicode(course_id)]
-
-            # then look in any caching subsystem (e.g. memcached)
-            if self.metadata_inheritance_cache_subsystem is not None:
-                tree = self.metadata_inheritance_cache_subsystem.get(unicode(course_id), {})
-            else:
+            tree = self._find_cached_metadata_inheritance_tree(course_id)
+            if not tree and self.metadata_inheritance_cache_subsystem is None:
                 logging.warning(
                     'Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is \
                     OK in localdev and testing environment. Not OK in production.'
@@ -633,36 +830,34 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
 
         if not tree:
             # if not in subsystem, or we are on force refresh, then we have to compute
-            tree = self._compute_metadata_inheritance_tree(course_id)
-
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
-            if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(unicode(course_id), tree)
-
-        # now populate a request_cache, if available. NOTE, we are outside of the
-        # scope of the above if: statement so that after a memcache hit, it'll get
-        # put into the request_cache
-        if self.request_cache is not None:
-            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
-            # defined
-            if 'metadata_inheritance' not in self.request_cache.data:
-                self.request_cache.data['metadata_inheritance'] = {}
-            self.request_cache.data['metadata_inheritance'][unicode(course_id)] = tree
+            tree = self._write_metadata_inheritance_tree(
+                course_id, lambda: self._compute_metadata_inheritance_tree(course_id), is_edit=force_refresh
+            )
+        else:
+            # after a memcache hit, it'll get put into the request_cache
+            self._cache_metadata_inheritance_tree(course_id, tree)
 
         return tree
 
-    def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None):
+    def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None, location=None):
         """
         Refresh the cached metadata inheritance tree for the org/course combination
         for location
 
+        If given the location of an edited block, only the part of the tree for that block is
+        updated, if the tree is cached; otherwise the tree is recomputed for the whole course.
+
         If given a runtime, it replaces the cached_metadata in that runtime. NOTE: failure to provide
         a runtime may mean that some objects report old values for inherited data.
         """
         course_id = course_id.for_branch(None)
         if not self._is_in_bulk_operation(course_id):
-            # below is done for side effects when runtime is None
-            cached_metadata = self._get_cached_metadata_inheritance_tree(course_id, force_refresh=True)
+            cached_metadata = None
+            if location is not None:
+                cached_metadata = self._update_metadata_inheritance_tree(self.fill_in_run(course_id), location)
+            if cached_metadata is None:
+                # below is done for side effects when runtime is None
+                cached_metadata = self._get_cached_metadata_inheritance_tree(course_id, force_refresh=True)
             if runtime:
                 runtime.cached_metadata = cached_metadata
 
@@ -685,18 +880,78 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
         }
         return list(self.collection.find(query))
 
+    def _cache_children_record_filter(self):
+        """
+        Returns the fields of the records of items that CachingDescriptorSystem.load_item reads
+        """
+        return {'_id': 1, 'definition': 1, 'metadata': 1, 'edit_info': 1}
+
+    def _query_course_for_cache_children(self, course_key):
+        """
+        Return a dictionary mapping the (published) Location of every item in the course to
+        the _id and children of the record _query_children_for_cache_children would return for it,
+        read in a single query
+        """
+        query = SON([
+            ('_id.tag', 'i4x'),
+            ('_id.org', course_key.org),
+            ('_id.course', course_key.course),
+            ('_id.revision', MongoRevisionKey.published),
+        ])
+        return {
+            Location._from_deprecated_son(item['_id'], course_key.run): item
+            for item in self.collection.find(query, {'_id': 1, 'definition.children': 1})
+        }
+
+    def _cache_course_descendants(self, course_key, items):
+        """
+        Returns the same as _cache_children(course_key, items, depth=None), but walking the course
+        tree from a single query for the children of every item in the course, then reading the
+        descendants in a second one, rather than making one query per level of the course tree.
+        """
+        course_tree = self._query_course_for_cache_children(course_key)
+
+        descendant_ids = []
+        children = [child for item in items for child in item.get('definition', {}).get('children', [])]
+        while children:
+            grandchildren = []
+            for child in children:
+                record = course_tree.pop(course_key.make_usage_key_from_deprecated_string(child), None)
+                if record is not None:
+                    # the stored _id may not keep its key order, which $in matching depends on
+                    descendant_ids.append(
+                        Location._from_deprecated_son(record['_id'], course_key.run).to_deprecated_son()
+                    )
+                    grandchildren.extend(record.get('definition', {}).get('children', []))
+            children = grandchildren
+
+        descendants = []
+        if descendant_ids:
+            descendants = self.collection.find(
+                {'_id': {'$in': descendant_ids}}, self._cache_children_record_filter()
+            )
+
+        data = {}
+        for item in itertools.chain(items, descendants):
+            self._clean_item_data(item)
+            data[Location._from_deprecated_son(item['location'], course_key.run)] = item
+        return data
+
     def _cache_children(self, course_key, items, depth=0):
         """
         Returns a dictionary mapping Location -> item data, populated with json data
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
         If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        This will make a number of queries that is linear in the depth, except when loading all
+        the descendants of a course, which are read in a single query.
         """
+        course_key = self.fill_in_run(course_key)
+        if depth is None and any(item['_id']['category'] == 'course' for item in items):
+            return self._cache_course_descendants(course_key, items)
 
         data = {}
         to_process = list(items)
-        course_key = self.fill_in_run(course_key)
         while to_process and depth is None or depth >= 0:
             children = []
             for item in to_process:
@@ -1223,7 +1478,9 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             xblock._edit_info = payload['edit_info']
 
             # recompute (and update) the metadata inheritance tree which is cached
-            self.refresh_cached_metadata_inheritance_tree(xblock.scope_ids.usage_id.course_key, xblock.runtime)
+            self.refresh_cached_metadata_inheritance_tree(
+                xblock.scope_ids.usage_id.course_key, xblock.runtime, location=xblock.scope_ids.usage_id
+            )
             # fire signal that we've written to DB
         except ItemNotFoundError:
             if not allow_not_found:
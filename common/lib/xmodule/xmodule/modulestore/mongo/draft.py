@@ -8,6 +8,7 @@ and otherwise returns i4x://org/course/cat/name).
 
 import pymongo
 import logging
+from bson.son import SON
 
 from opaque_keys.edx.locations import Location
 from xmodule.exceptions import InvalidVersionError
@@ -782,6 +783,35 @@ class DraftModuleStore(MongoModuleStore):
 
         return queried_children
 
+    def _query_course_for_cache_children(self, course_key):
+        """
+        Overrides the base method to replace the published version of items with their draft
+        version, if there is one, when drafts are preferred (as _query_children_for_cache_children does)
+        """
+        query = SON([
+            ('_id.tag', 'i4x'),
+            ('_id.org', course_key.org),
+            ('_id.course', course_key.course),
+        ])
+        drafts_preferred = self.get_branch_setting() == ModuleStoreEnum.Branch.draft_preferred
+
+        course_items = {}
+        drafts = []
+        for item in self.collection.find(query, {'_id': 1, 'definition.children': 1}):
+            location = Location._from_deprecated_son(item['_id'], course_key.run)
+            if location.revision == MongoRevisionKey.draft:
+                if drafts_preferred and location.category not in DIRECT_ONLY_CATEGORIES:
+                    drafts.append((as_published(location), item))
+            else:
+                course_items[location] = item
+
+        # only drafts of items which have a published version replace it
+        for published_location, draft in drafts:
+            if published_location in course_items:
+                course_items[published_location] = draft
+
+        return course_items
+
     def has_published_version(self, xblock):
         """
         Returns True if this xblock has an existing published version regardless of whether the
@@ -67,6 +67,8 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
         )
         self.default_class = default_class
         self.local_modules = {}
+        # (edited_on, edited_by) of the most recent edit of the subtree of each block, by BlockKey
+        self._subtree_edited_info = {}
 
     @contract(usage_key="BlockUsageLocator | BlockKey")
     def _load_item(self, usage_key, course_entry_override=None, **kwargs):
@@ -242,12 +244,10 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
         See :class: cms.lib.xblock.runtime.EditInfoRuntimeMixin
         """
         if not hasattr(xblock, '_subtree_edited_by'):
-            json_data = self.module_data[BlockKey.from_usage_key(xblock.location)]
-            if '_subtree_edited_by' not in json_data.setdefault('edit_info', {}):
-                self._compute_subtree_edited_internal(
-                    xblock.location.block_id, json_data, xblock.location.course_key
-                )
-            setattr(xblock, '_subtree_edited_by', json_data['edit_info']['_subtree_edited_by'])
+            __, edited_by = self._get_subtree_edited_info(
+                BlockKey.from_usage_key(xblock.location), xblock.location.course_key
+            )
+            setattr(xblock, '_subtree_edited_by', edited_by)
 
         return getattr(xblock, '_subtree_edited_by')
 
@@ -256,12 +256,10 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
         See :class: cms.lib.xblock.runtime.EditInfoRuntimeMixin
         """
         if not hasattr(xblock, '_subtree_edited_on'):
-            json_data = self.module_data[BlockKey.from_usage_key(xblock.location)]
-            if '_subtree_edited_on' not in json_data.setdefault('edit_info', {}):
-                self._compute_subtree_edited_internal(
-                    xblock.location.block_id, json_data, xblock.location.course_key
-                )
-            setattr(xblock, '_subtree_edited_on', json_data['edit_info']['_subtree_edited_on'])
+            edited_on, __ = self._get_subtree_edited_info(
+                BlockKey.from_usage_key(xblock.location), xblock.location.course_key
+            )
+            setattr(xblock, '_subtree_edited_on', edited_on)
 
         return getattr(xblock, '_subtree_edited_on')
 
@@ -283,20 +281,22 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
 
         return getattr(xblock, '_published_on', None)
 
-    def _compute_subtree_edited_internal(self, block_id, json_data, course_key):
+    def _get_subtree_edited_info(self, block_key, course_key):
         """
         Recurse the subtree finding the max edited_on date and its concomitant edited_by. Cache it
+        in this runtime rather than in the block's json, since the structure may be shared through
+        the structure cache.
         """
-        max_date = json_data['edit_info']['edited_on']
-        max_by = json_data['edit_info']['edited_by']
-
-        for child in json_data.get('fields', {}).get('children', []):
-            child_data = self.get_module_data(BlockKey(*child), course_key)
-            if '_subtree_edited_on' not in json_data.setdefault('edit_info', {}):
-                self._compute_subtree_edited_internal(child, child_data, course_key)
-            if child_data['edit_info']['_subtree_edited_on'] > max_date:
-                max_date = child_data['edit_info']['_subtree_edited_on']
-                max_by = child_data['edit_info']['_subtree_edited_by']
-
-        json_data['edit_info']['_subtree_edited_on'] = max_date
-        json_data['edit_info']['_subtree_edited_by'] = max_by
+        if block_key not in self._subtree_edited_info:
+            json_data = self.get_module_data(block_key, course_key)
+            max_date = json_data['edit_info']['edited_on']
+            max_by = json_data['edit_info']['edited_by']
+
+            for child in json_data.get('fields', {}).get('children', []):
+                child_date, child_by = self._get_subtree_edited_info(BlockKey(*child), course_key)
+                if child_date > max_date:
+                    max_date = child_date
+                    max_by = child_by
+
+            self._subtree_edited_info[block_key] = (max_date, max_by)
+        return self._subtree_edited_info[block_key]
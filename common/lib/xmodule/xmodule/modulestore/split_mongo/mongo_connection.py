@@ -1,15 +1,29 @@
 """
 Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
 """
+import cPickle
+import logging
 import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import contracts
 import pymongo
-from contracts import check
+from contracts import check, new_contract
 from xmodule.exceptions import HeartbeatFailure
 from xmodule.modulestore.split_mongo import BlockKey
 from datetime import tzinfo
 import datetime
 import pytz
 
+new_contract('BlockKey', BlockKey)
+
+log = logging.getLogger(__name__)
+
+# the maximum number of definitions inserted in one batch
+DEFINITION_INSERT_BATCH_SIZE = 1000
+
 
 def structure_from_mongo(structure):
     """
@@ -18,18 +32,22 @@ def structure_from_mongo(structure):
     Converts 'root' from [block_type, block_id] to BlockKey.
     Converts 'blocks.*.fields.children' from [[block_type, block_id]] to [BlockKey].
     N.B. Does not convert any other ReferenceFields (because we don't know which fields they are at this level).
+
+    The structure is only validated while contracts are enabled (they're disabled when running as a webserver).
     """
-    check('seq[2]', structure['root'])
-    check('list(dict)', structure['blocks'])
-    for block in structure['blocks']:
-        if 'children' in block['fields']:
-            check('list(list[2])', block['fields']['children'])
+    validate = not contracts.all_disabled()
+    if validate:
+        check('seq[2]', structure['root'])
+        check('list(dict)', structure['blocks'])
 
     structure['root'] = BlockKey(*structure['root'])
     new_blocks = {}
     for block in structure['blocks']:
-        if 'children' in block['fields']:
-            block['fields']['children'] = [BlockKey(*child) for child in block['fields']['children']]
+        fields = block['fields']
+        if 'children' in fields:
+            if validate:
+                check('list(list[2])', fields['children'])
+            fields['children'] = [BlockKey(*child) for child in fields['children']]
         new_blocks[BlockKey(block['block_type'], block.pop('block_id'))] = block
     structure['blocks'] = new_blocks
 
@@ -43,17 +61,20 @@ def structure_to_mongo(structure):
         and BlockKey.id as 'block_id'.
     Doesn't convert 'root', since namedtuple's can be inserted
         directly into mongo.
+
+    The structure is only validated while contracts are enabled (they're disabled when running as a webserver).
     """
-    check('BlockKey', structure['root'])
-    check('dict(BlockKey: dict)', structure['blocks'])
-    for block in structure['blocks'].itervalues():
-        if 'children' in block['fields']:
-            check('list(BlockKey)', block['fields']['children'])
+    validate = not contracts.all_disabled()
+    if validate:
+        check('BlockKey', structure['root'])
+        check('dict(BlockKey: dict)', structure['blocks'])
 
     new_structure = dict(structure)
     new_structure['blocks'] = []
 
     for block_key, block in structure['blocks'].iteritems():
+        if validate and 'children' in block['fields']:
+            check('list(BlockKey)', block['fields']['children'])
         new_block = dict(block)
         new_block.setdefault('block_type', block_key.type)
         new_block['block_id'] = block_key.id
@@ -62,16 +83,145 @@ def structure_to_mongo(structure):
     return new_structure
 
 
+class StructureCache(object):
+    """
+    A size-bounded LRU cache of decoded structures, keyed by structure `_id`.
+
+    Structures are never changed once they are written under an `_id` (edits create
+    a new version), so a decoded structure can be shared by every thread and request
+    in the process. Cached structures are returned as is, without copying, so callers
+    must treat them as read-only (`SplitMongoModuleStore.version_structure` copies a
+    structure before it is edited). The size of an entry, for the `max_bytes` bound,
+    is the size of the structure's pickle.
+
+    If a `cache_subsystem` (a django cache) is given, it is used as a second tier
+    that is shared between processes, holding compressed pickles of the structures.
+    """
+    KEY_PREFIX = 'split_structure'
+
+    def __init__(self, max_bytes, cache_subsystem=None):
+        self.max_bytes = max_bytes
+        self.cache_subsystem = cache_subsystem
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _serialize(structure):
+        """
+        Return the pickle of `structure`
+        """
+        return cPickle.dumps(structure, cPickle.HIGHEST_PROTOCOL)
+
+    def _subsystem_key(self, key):
+        """
+        Return the key `key` is stored under in the cache subsystem
+        """
+        return u'{}.{}'.format(self.KEY_PREFIX, key)
+
+    def _remember(self, key, structure, size):
+        """
+        Store `structure`, whose pickle is `size` bytes long, as the most recently
+        used entry, evicting the least recently used entries to stay within `max_bytes`.
+        """
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.total_bytes -= old_entry[1]
+            while self._entries and self.total_bytes + size > self.max_bytes:
+                __, (__, evicted_size) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+            self._entries[key] = (structure, size)
+            self.total_bytes += size
+
+    def get(self, key):
+        """
+        Return the structure cached under `key`, or None if it isn't cached.
+        The structure is shared, and mustn't be modified.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                # re-insert as the most recently used entry
+                self._entries[key] = entry
+                return entry[0]
+
+        if self.cache_subsystem is None:
+            return None
+        data = self.cache_subsystem.get(self._subsystem_key(key))
+        if data is None:
+            return None
+        data = zlib.decompress(data)
+        structure = cPickle.loads(data)
+        self._remember(key, structure, len(data))
+        return structure
+
+    def set(self, key, structure):
+        """
+        Cache `structure` under `key`. The structure mustn't be modified afterwards.
+        """
+        try:
+            data = self._serialize(structure)
+        except (cPickle.PicklingError, TypeError):
+            log.warning("Unable to cache structure %s", key, exc_info=True)
+            return
+        self._remember(key, structure, len(data))
+        if self.cache_subsystem is not None:
+            self.cache_subsystem.set(self._subsystem_key(key), zlib.compress(data, 1))
+
+    def delete(self, key):
+        """
+        Remove the structure cached under `key`, if any
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.total_bytes -= entry[1]
+        if self.cache_subsystem is not None:
+            self.cache_subsystem.delete(self._subsystem_key(key))
+
+    def clear(self):
+        """
+        Remove all structures from the in-process cache
+        """
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+_STRUCTURE_CACHES = {}
+_STRUCTURE_CACHES_LOCK = threading.Lock()
+
+
+def shared_structure_cache(max_bytes, cache_subsystem=None):
+    """
+    Return the process-wide StructureCache with the given `max_bytes` and
+    `cache_subsystem`, creating it on first use. Modulestores configured
+    with the same settings share a cache.
+    """
+    settings_key = (max_bytes, cache_subsystem)
+    with _STRUCTURE_CACHES_LOCK:
+        if settings_key not in _STRUCTURE_CACHES:
+            _STRUCTURE_CACHES[settings_key] = StructureCache(max_bytes, cache_subsystem)
+        return _STRUCTURE_CACHES[settings_key]
+
+
 class MongoConnection(object):
     """
     Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
     """
     def __init__(
-        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None, **kwargs
+        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None,
+        structure_cache=None, **kwargs
     ):
         """
         Create & open the connection, authenticate, and provide pointers to the collections
+
+        :param structure_cache: an optional StructureCache holding structures already read
         """
+        self.structure_cache = structure_cache
         self.database = pymongo.database.Database(
             pymongo.MongoClient(
                 host=host,
@@ -108,18 +258,45 @@ class MongoConnection(object):
 
     def get_structure(self, key):
         """
-        Get the structure from the persistence mechanism whose id is the given key
+        Get the structure from the persistence mechanism whose id is the given key.
+        Structures read through the structure cache are shared, and mustn't be modified.
         """
-        return structure_from_mongo(self.structures.find_one({'_id': key}))
+        if self.structure_cache is not None:
+            structure = self.structure_cache.get(key)
+            if structure is not None:
+                return structure
+
+        structure = structure_from_mongo(self.structures.find_one({'_id': key}))
+        if self.structure_cache is not None:
+            self.structure_cache.set(key, structure)
+        return structure
 
     def find_structures_by_id(self, ids):
         """
         Return all structures that specified in ``ids``.
+        Structures read through the structure cache are shared, and mustn't be modified.
 
         Arguments:
             ids (list): A list of structure ids
         """
-        return [structure_from_mongo(structure) for structure in self.structures.find({'_id': {'$in': ids}})]
+        if self.structure_cache is None:
+            return [structure_from_mongo(structure) for structure in self.structures.find({'_id': {'$in': ids}})]
+
+        structures = []
+        missing_ids = []
+        for structure_id in ids:
+            structure = self.structure_cache.get(structure_id)
+            if structure is None:
+                missing_ids.append(structure_id)
+            else:
+                structures.append(structure)
+
+        if missing_ids:
+            for structure in self.structures.find({'_id': {'$in': missing_ids}}):
+                structure = structure_from_mongo(structure)
+                self.structure_cache.set(structure['_id'], structure)
+                structures.append(structure)
+        return structures
 
     def find_structures_derived_from(self, ids):
         """
@@ -153,6 +330,8 @@ class MongoConnection(object):
         """
         Update the db record for structure, creating that record if it doesn't already exist
         """
+        if self.structure_cache is not None:
+            self.structure_cache.delete(structure['_id'])
         self.structures.update({'_id': structure['_id']}, structure_to_mongo(structure), upsert=True)
 
     def get_course_index(self, key, ignore_case=False):
@@ -244,6 +423,13 @@ class MongoConnection(object):
         """
         self.definitions.insert(definition)
 
+    def insert_definitions(self, definitions):
+        """
+        Create the definitions in the db, in order, in batches of DEFINITION_INSERT_BATCH_SIZE
+        """
+        for start in xrange(0, len(definitions), DEFINITION_INSERT_BATCH_SIZE):
+            self.definitions.insert(definitions[start:start + DEFINITION_INSERT_BATCH_SIZE])
+
     def ensure_indexes(self):
         """
         Ensure that all appropriate indexes are created that are needed by this modulestore, or raise
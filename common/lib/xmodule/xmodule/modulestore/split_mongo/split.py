@@ -52,6 +52,7 @@ Representation:
 """
 import copy
 import threading
+from collections import OrderedDict
 import datetime
 import logging
 from contracts import contract, new_contract
@@ -75,7 +76,7 @@ from xmodule.modulestore import (
 
 from ..exceptions import ItemNotFoundError
 from .caching_descriptor_system import CachingDescriptorSystem
-from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, BlockKey
+from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, BlockKey, shared_structure_cache
 from xmodule.error_module import ErrorDescriptor
 from _collections import defaultdict
 from types import NoneType
@@ -116,6 +117,8 @@ class SplitBulkWriteRecord(BulkOpsRecord):
         self.index = None
         self.structures = {}
         self.structures_in_db = set()
+        # the definitions created during the bulk operation, in the order they were created
+        self.definitions = OrderedDict()
 
     # TODO: This needs to track which branches have actually been modified/versioned,
     # so that copying one branch to another doesn't update the original branch.
@@ -151,12 +154,13 @@ class SplitBulkWriteRecord(BulkOpsRecord):
         self.structures[structure['_id']] = structure
 
     def __repr__(self):
-        return u"SplitBulkWriteRecord<{!r}, {!r}, {!r}, {!r}, {!r}>".format(
+        return u"SplitBulkWriteRecord<{!r}, {!r}, {!r}, {!r}, {!r}, {!r}>".format(
             self._active_count,
             self.initial_index,
             self.index,
             self.structures,
             self.structures_in_db,
+            self.definitions,
         )
 
 
@@ -221,15 +225,35 @@ class SplitBulkWriteMixin(BulkOperationsMixin):
         """
         End the active bulk write operation on course_key.
         """
-        # If the content is dirty, then update the database
-        for _id in bulk_write_record.structures.viewkeys() - bulk_write_record.structures_in_db:
-            self.db_connection.upsert_structure(bulk_write_record.structures[_id])
+        try:
+            # Insert the new definitions first, so that no structure in the database
+            # refers to a definition that isn't
+            if bulk_write_record.definitions:
+                self.db_connection.insert_definitions(bulk_write_record.definitions.values())
+
+            # If the content is dirty, then update the database
+            for _id in bulk_write_record.structures.viewkeys() - bulk_write_record.structures_in_db:
+                self.db_connection.upsert_structure(bulk_write_record.structures[_id])
+                self._unsaved_structure_ids.discard(_id)
+
+            if bulk_write_record.index is not None and bulk_write_record.index != bulk_write_record.initial_index:
+                if bulk_write_record.initial_index is None:
+                    self.db_connection.insert_course_index(bulk_write_record.index)
+                else:
+                    self.db_connection.update_course_index(bulk_write_record.index, from_index=bulk_write_record.initial_index)
+        finally:
+            self._forget_unsaved_structures(bulk_write_record)
 
-        if bulk_write_record.index is not None and bulk_write_record.index != bulk_write_record.initial_index:
-            if bulk_write_record.initial_index is None:
-                self.db_connection.insert_course_index(bulk_write_record.index)
-            else:
-                self.db_connection.update_course_index(bulk_write_record.index, from_index=bulk_write_record.initial_index)
+    def _forget_unsaved_structures(self, bulk_write_record):
+        """
+        Forget the unsaved structures of a bulk write operation that has ended (or aborted),
+        so that they aren't changed in place any more.
+        """
+        if any(True for __ in self._active_records):
+            # the other bulk operations of this thread may still change the structures they created
+            self._unsaved_structure_ids.difference_update(bulk_write_record.structures)
+        else:
+            self._unsaved_structure_ids.clear()
 
     def get_course_index(self, course_key, ignore_case=False):
         """
@@ -290,6 +314,58 @@ class SplitBulkWriteMixin(BulkOperationsMixin):
             bulk_write_record.structures[structure['_id']] = structure
         else:
             self.db_connection.upsert_structure(structure)
+            self._unsaved_structure_ids.discard(structure['_id'])
+
+    @property
+    def _unsaved_structure_ids(self):
+        """
+        The ids of the structures created by this thread that haven't been written to the db yet.
+        Only those can still be changed in place. They're forgotten when the bulk operations
+        they were created in end, whether or not they were written.
+        """
+        if not hasattr(self._active_bulk_ops, 'unsaved_structure_ids'):
+            self._active_bulk_ops.unsaved_structure_ids = set()
+        return self._active_bulk_ops.unsaved_structure_ids
+
+    def get_definition(self, definition_guid):
+        """
+        Retrieve a single definition by id, including the definitions created
+        by the active bulk operations (which haven't been inserted yet). Like
+        definitions read from the db, those are copies that can be modified.
+        """
+        for __, bulk_write_record in self._active_records:
+            if definition_guid in bulk_write_record.definitions:
+                return copy.deepcopy(bulk_write_record.definitions[definition_guid])
+        return self.db_connection.get_definition(definition_guid)
+
+    def get_definitions(self, ids):
+        """
+        Return all definitions that are specified in ``ids``, including the
+        definitions created by the active bulk operations.
+        """
+        definitions = []
+        ids = set(ids)
+        for __, bulk_write_record in self._active_records:
+            pending_ids = ids.intersection(bulk_write_record.definitions)
+            definitions.extend(
+                copy.deepcopy(bulk_write_record.definitions[definition_guid]) for definition_guid in pending_ids
+            )
+            ids -= pending_ids
+        if ids:
+            definitions.extend(self.db_connection.find_matching_definitions({'_id': {'$in': list(ids)}}))
+        return definitions
+
+    def insert_definition(self, course_key, definition):
+        """
+        Create a definition, respecting the current bulk operation status: if a
+        bulk operation is active, the definition is inserted (along with the
+        other new definitions) when it ends.
+        """
+        bulk_write_record = self._get_bulk_ops_record(course_key)
+        if bulk_write_record.active:
+            bulk_write_record.definitions[definition['_id']] = definition
+        else:
+            self.db_connection.insert_definition(definition)
 
     def version_structure(self, course_key, structure, user_id):
         """
@@ -311,6 +387,7 @@ class SplitBulkWriteMixin(BulkOperationsMixin):
         new_structure['edited_by'] = user_id
         new_structure['edited_on'] = datetime.datetime.now(UTC)
         new_structure['schema_version'] = self.SCHEMA_VERSION
+        self._unsaved_structure_ids.add(new_structure['_id'])
 
         # If we're in a bulk write, update the structure used there, and mark it as dirty
         if bulk_write_record.active:
@@ -452,19 +529,28 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
     # It won't recompute the value on operations such as update_course_index (e.g., to revert to a prev
     # version) but those functions will have an optional arg for setting these.
     SEARCH_TARGET_DICT = ['wiki_slug']
+    # the number of structures per thread for which to keep an index of the parents of their blocks
+    PARENT_INDEX_CACHE_SIZE = 10
 
     def __init__(self, contentstore, doc_store_config, fs_root, render_template,
                  default_class=None,
                  error_tracker=null_error_tracker,
                  i18n_service=None, fs_service=None,
-                 services=None, **kwargs):
+                 services=None, structure_cache_size=None, structure_cache_subsystem=None, **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param structure_cache_size: if set, the maximum number of bytes of structures to keep in the
+            process-wide structure cache. The cache is disabled if this is not set.
+        :param structure_cache_subsystem: an optional django cache to share cached structures between processes
         """
 
         super(SplitMongoModuleStore, self).__init__(contentstore, **kwargs)
 
-        self.db_connection = MongoConnection(**doc_store_config)
+        if structure_cache_size:
+            structure_cache = shared_structure_cache(structure_cache_size, structure_cache_subsystem)
+        else:
+            structure_cache = None
+        self.db_connection = MongoConnection(structure_cache=structure_cache, **doc_store_config)
         self.db = self.db_connection.database
 
         # Code review question: How should I expire entries?
@@ -529,22 +615,24 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
 
             if not lazy:
                 # Load all descendants by id
-                descendent_definitions = self.db_connection.find_matching_definitions({
-                    '_id': {'$in': [block['definition']
-                                    for block in new_module_data.itervalues()]}})
+                descendent_definitions = self.get_definitions(
+                    [block['definition'] for block in new_module_data.itervalues()]
+                )
                 # turn into a map
                 definitions = {definition['_id']: definition
                                for definition in descendent_definitions}
 
-                for block in new_module_data.itervalues():
+                for block_key, block in new_module_data.items():
                     if block['definition'] in definitions:
                         converted_fields = self.convert_references_to_keys(
                             course_key, system.load_block_type(block['block_type']),
                             definitions[block['definition']].get('fields'),
                             system.course_entry['structure']['blocks'],
                         )
-                        block['fields'].update(converted_fields)
-                        block['definition_loaded'] = True
+                        # copy the block, since the structure may be shared through the structure cache
+                        fields = dict(block['fields'])
+                        fields.update(converted_fields)
+                        new_module_data[block_key] = dict(block, fields=fields, definition_loaded=True)
 
             system.module_data.update(new_module_data)
             return system.module_data
@@ -602,8 +690,11 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
                 del self.thread_cache.course_cache[course_version_guid]
             except KeyError:
                 pass
+            if hasattr(self.thread_cache, 'parent_indexes'):
+                self.thread_cache.parent_indexes.pop(course_version_guid, None)
         else:
             self.thread_cache.course_cache = {}
+            self.thread_cache.parent_indexes = OrderedDict()
 
     def _lookup_course(self, course_key):
         '''
@@ -813,7 +904,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
                 self._block_matches(block_json.get('fields', {}), settings)
             ):
                 if content:
-                    definition_block = self.db_connection.get_definition(block_json['definition'])
+                    definition_block = self.get_definition(block_json['definition'])
                     return self._block_matches(definition_block.get('fields', {}), content)
                 else:
                     return True
@@ -930,7 +1021,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             'edited_on': when the change was made
         }
         """
-        definition = self.db_connection.get_definition(definition_locator.definition_id)
+        definition = self.get_definition(definition_locator.definition_id)
         if definition is None:
             return None
         return definition['edit_info']
@@ -1026,7 +1117,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         # TODO implement
         raise NotImplementedError()
 
-    def create_definition_from_data(self, new_def_data, category, user_id):
+    def create_definition_from_data(self, course_key, new_def_data, category, user_id):
         """
         Pull the definition fields out of descriptor and save to the db as a new definition
         w/o a predecessor and return the new id.
@@ -1047,11 +1138,11 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             },
             'schema_version': self.SCHEMA_VERSION,
         }
-        self.db_connection.insert_definition(document)
+        self.insert_definition(course_key, document)
         definition_locator = DefinitionLocator(category, new_id)
         return definition_locator
 
-    def update_definition_from_data(self, definition_locator, new_def_data, user_id):
+    def update_definition_from_data(self, course_key, definition_locator, new_def_data, user_id):
         """
         See if new_def_data differs from the persisted version. If so, update
         the persisted version and return the new id.
@@ -1068,7 +1159,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
 
         # if this looks in cache rather than fresh fetches, then it will probably not detect
         # actual change b/c the descriptor and cache probably point to the same objects
-        old_definition = self.db_connection.get_definition(definition_locator.definition_id)
+        old_definition = self.get_definition(definition_locator.definition_id)
         if old_definition is None:
             raise ItemNotFoundError(definition_locator)
 
@@ -1082,7 +1173,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             # previous version id
             old_definition['edit_info']['previous_version'] = definition_locator.definition_id
             old_definition['schema_version'] = self.SCHEMA_VERSION
-            self.db_connection.insert_definition(old_definition)
+            self.insert_definition(course_key, old_definition)
             return DefinitionLocator(old_definition['block_type'], old_definition['_id']), True
         else:
             return definition_locator, False
@@ -1170,9 +1261,11 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             new_def_data = partitioned_fields.get(Scope.content, {})
             # persist the definition if persisted != passed
             if (definition_locator is None or isinstance(definition_locator.definition_id, LocalId)):
-                definition_locator = self.create_definition_from_data(new_def_data, block_type, user_id)
+                definition_locator = self.create_definition_from_data(course_key, new_def_data, block_type, user_id)
             elif new_def_data is not None:
-                definition_locator, _ = self.update_definition_from_data(definition_locator, new_def_data, user_id)
+                definition_locator, _ = self.update_definition_from_data(
+                    course_key, definition_locator, new_def_data, user_id
+                )
 
             # copy the structure and modify the new one
             new_structure = self.version_structure(course_key, structure, user_id)
@@ -1365,7 +1458,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
                 },
                 'schema_version': self.SCHEMA_VERSION,
             }
-            self.db_connection.insert_definition(definition_entry)
+            self.insert_definition(locator, definition_entry)
 
             draft_structure = self._new_structure(
                 user_id,
@@ -1393,14 +1486,14 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             if block_fields is not None:
                 root_block['fields'].update(self._serialize_fields(root_category, block_fields))
             if definition_fields is not None:
-                definition = self.db_connection.get_definition(root_block['definition'])
+                definition = self.get_definition(root_block['definition'])
                 definition['fields'].update(definition_fields)
                 definition['edit_info']['previous_version'] = definition['_id']
                 definition['edit_info']['edited_by'] = user_id
                 definition['edit_info']['edited_on'] = datetime.datetime.now(UTC)
                 definition['_id'] = ObjectId()
                 definition['schema_version'] = self.SCHEMA_VERSION
-                self.db_connection.insert_definition(definition)
+                self.insert_definition(locator, definition)
                 root_block['definition'] = definition['_id']
                 root_block['edit_info']['edited_on'] = datetime.datetime.now(UTC)
                 root_block['edit_info']['edited_by'] = user_id
@@ -1493,7 +1586,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
                 definition_locator = DefinitionLocator(original_entry['block_type'], original_entry['definition'])
             if definition_fields:
                 definition_locator, is_updated = self.update_definition_from_data(
-                    definition_locator, definition_fields, user_id
+                    course_key, definition_locator, definition_fields, user_id
                 )
 
             # check metadata
@@ -1639,11 +1732,11 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         is_updated = False
         if xblock.definition_locator is None or isinstance(xblock.definition_locator.definition_id, LocalId):
             xblock.definition_locator = self.create_definition_from_data(
-                new_def_data, xblock.category, user_id)
+                xblock.location.course_key, new_def_data, xblock.category, user_id)
             is_updated = True
         elif new_def_data:
             xblock.definition_locator, is_updated = self.update_definition_from_data(
-                xblock.definition_locator, new_def_data, user_id)
+                xblock.location.course_key, xblock.definition_locator, new_def_data, user_id)
 
         if isinstance(xblock.scope_ids.usage_id.block_id, LocalId):
             # generate an id
@@ -1973,7 +2066,8 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
 
         :param course_locator: the course to clean
         """
-        original_structure = self._lookup_course(course_locator)['structure']
+        # copy the structure, since the one looked up may be shared through the structure cache
+        original_structure = copy.deepcopy(self._lookup_course(course_locator)['structure'])
         for block in original_structure['blocks'].itervalues():
             if 'fields' in block and 'children' in block['fields']:
                 block['fields']["children"] = [
@@ -2024,8 +2118,9 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
                 elif isinstance(field, ReferenceList):
                     output_fields[field_name] = [robust_usage_key(ele) for ele in value]
                 elif isinstance(field, ReferenceValueDict):
-                    for key, subvalue in value.iteritems():
-                        value[key] = robust_usage_key(subvalue)
+                    output_fields[field_name] = {
+                        key: robust_usage_key(subvalue) for key, subvalue in value.iteritems()
+                    }
         return output_fields
 
     def _get_index_if_valid(self, course_key, force=False):
@@ -2147,6 +2242,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         root_category, must also provide block_fields and definition_id
         """
         new_id = ObjectId()
+        self._unsaved_structure_ids.add(new_id)
         if root_block_key is not None:
             if block_fields is None:
                 block_fields = {}
@@ -2174,10 +2270,55 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         Given a structure, find block_key's parent in that structure. Note returns
         the encoded format for parent
         """
-        for parent_block_key, value in structure['blocks'].iteritems():
-            if block_key in value['fields'].get('children', []):
-                return parent_block_key
-        return None
+        parent_index, rebuilt = self._get_parent_index(structure)
+        parent_block_key = parent_index.get(block_key)
+        if rebuilt:
+            return parent_block_key
+        if parent_block_key is None:
+            # The root never has a parent, and structures that were saved are never changed in place,
+            # so their indexes list every parent
+            if block_key == structure['root'] or structure.get('_id') not in self._unsaved_structure_ids:
+                return None
+        elif self._is_parent_in_structure(parent_block_key, block_key, structure):
+            return parent_block_key
+        # The structure's children changed since the index was built (or block_key is new)
+        parent_index, __ = self._get_parent_index(structure, rebuild=True)
+        return parent_index.get(block_key)
+
+    @staticmethod
+    def _is_parent_in_structure(parent_block_key, block_key, structure):
+        """
+        Return whether parent_block_key is an existing block in structure with block_key as a child
+        """
+        if parent_block_key is None or parent_block_key not in structure['blocks']:
+            return False
+        return block_key in structure['blocks'][parent_block_key]['fields'].get('children', [])
+
+    def _get_parent_index(self, structure, rebuild=False):
+        """
+        Return a tuple of (the child->parent map for the blocks of structure, whether it was just built).
+
+        Indexes are kept per thread by structure version, for the last PARENT_INDEX_CACHE_SIZE structures
+        used. Structures can be changed in place within a bulk operation without changing their version,
+        so callers must verify what they find in an index that wasn't just built.
+        """
+        if not hasattr(self.thread_cache, 'parent_indexes'):
+            self.thread_cache.parent_indexes = OrderedDict()
+        parent_indexes = self.thread_cache.parent_indexes
+
+        structure_id = structure.get('_id')
+        parent_index = parent_indexes.pop(structure_id, None)
+        rebuilt = rebuild or parent_index is None
+        if rebuilt:
+            parent_index = {}
+            for parent_block_key, value in structure['blocks'].iteritems():
+                for child in value['fields'].get('children', []):
+                    parent_index.setdefault(child, parent_block_key)
+
+        parent_indexes[structure_id] = parent_index
+        while len(parent_indexes) > self.PARENT_INDEX_CACHE_SIZE:
+            parent_indexes.popitem(last=False)
+        return parent_index, rebuilt
 
     def _sync_children(self, source_parent, destination_parent, new_child):
         """
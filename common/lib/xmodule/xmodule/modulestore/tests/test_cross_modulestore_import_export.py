@@ -54,16 +54,40 @@ class MemoryCache(object):
         """
         return self._data.get(key, default)
 
-    def set(self, key, value):
+    def set(self, key, value, timeout=None):  # pylint: disable=unused-argument
         """
         Set a key in the cache.
 
         Args:
             key: The key to update.
             value: The value change the key to.
+            timeout: Ignored.
         """
         self._data[key] = value
 
+    def add(self, key, value, timeout=None):  # pylint: disable=unused-argument
+        """
+        Set a key in the cache, unless it's already set. Returns whether the key was set.
+
+        Args:
+            key: The key to set.
+            value: The value to set the key to.
+            timeout: Ignored.
+        """
+        if key in self._data:
+            return False
+        self._data[key] = value
+        return True
+
+    def delete(self, key):
+        """
+        Remove a key from the cache.
+
+        Args:
+            key: The key to remove.
+        """
+        self._data.pop(key, None)
+
 
 class MongoModulestoreBuilder(object):
     """
@@ -2,8 +2,10 @@
 # pylint: disable=W0212
 # pylint: disable=E0611
 from nose.tools import assert_equals, assert_raises, \
-    assert_not_equals, assert_false, assert_true, assert_greater, assert_is_instance, assert_is_none
+    assert_not_equals, assert_false, assert_true, assert_greater, assert_is_instance, assert_is_none, \
+    assert_is_not_none
 # pylint: enable=E0611
+from mock import patch
 from path import path
 import pymongo
 import logging
@@ -35,9 +37,10 @@ from nose.tools import assert_in
 from xmodule.exceptions import NotFoundError
 from git.test.lib.asserts import assert_not_none
 from xmodule.x_module import XModuleMixin
-from xmodule.modulestore.mongo.base import as_draft
+from xmodule.modulestore.mongo.base import as_draft, MetadataInheritanceTree
 from xmodule.modulestore.tests.mongo_connection import MONGO_PORT_NUM, MONGO_HOST
 from xmodule.modulestore.edit_info import EditInfoMixin
+from xmodule.modulestore.tests.test_cross_modulestore_import_export import MemoryCache
 
 log = logging.getLogger(__name__)
 
@@ -181,6 +184,58 @@ class TestMongoModuleStore(unittest.TestCase):
             assert_false(self.draft_store.has_course(mix_cased))
             assert_true(self.draft_store.has_course(mix_cased, ignore_case=True))
 
+    def test_get_course_all_descendants(self):
+        """
+        Loading all the descendants of a course in a single query caches the same items
+        as loading them one level at a time
+        """
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        course = self.draft_store.get_course(course_key, depth=None)
+        by_level = self.draft_store.get_course(course_key, depth=10)
+        assert_greater(len(course.runtime.module_data), 1)
+        assert_equals(set(course.runtime.module_data), set(by_level.runtime.module_data))
+
+    def test_get_course_all_descendants_projected(self):
+        """
+        Loading all the descendants of a course doesn't read whole records of items it doesn't cache
+        """
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        collection = self.draft_store.collection
+        with patch.object(collection, 'find', wraps=collection.find) as mock_find:
+            course = self.draft_store.get_course(course_key, depth=None)
+        assert_greater(len(course.runtime.module_data), 1)
+        for args, kwargs in mock_find.call_args_list:
+            assert_true(len(args) > 1 or 'fields' in kwargs, args)
+
+    def test_inheritance_tree_edit_while_locked(self):
+        """
+        An edit made while another process computes the metadata inheritance tree of the
+        course invalidates the cached tree, and the tree that process then writes
+        """
+        cache = MemoryCache()
+        self.draft_store.metadata_inheritance_cache_subsystem = cache
+        self.addCleanup(setattr, self.draft_store, 'metadata_inheritance_cache_subsystem', None)
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        tree = self.draft_store._get_cached_metadata_inheritance_tree(course_key)
+        assert_is_not_none(cache.get(unicode(course_key)))
+
+        # another process starts computing the tree
+        lock_key = u'{}.lock'.format(course_key)
+        cache.add(lock_key, True)
+        self.draft_store.refresh_cached_metadata_inheritance_tree(
+            course_key, location=Location('edX', 'toy', '2012_Fall', 'chapter', 'Overview')
+        )
+        assert_is_none(cache.get(unicode(course_key)))
+
+        # and writes a tree that may miss the edit
+        cache.delete(lock_key)
+        self.draft_store._write_metadata_inheritance_tree(course_key, lambda: tree, is_edit=False)
+        assert_is_none(cache.get(unicode(course_key)))
+
+        # trees computed after the edit are kept
+        self.draft_store._get_cached_metadata_inheritance_tree(course_key)
+        assert_is_not_none(cache.get(unicode(course_key)))
+
     def test_no_such_course(self):
         """
         Test get_course and has_course with ids which don't exist
@@ -698,3 +753,34 @@ class TestMongoKeyValueStore(object):
         for scope in (Scope.preferences, Scope.user_info, Scope.user_state, Scope.parent):
             with assert_raises(InvalidScopeError):
                 self.kvs.delete(KeyValueStore.Key(scope, None, None, 'foo'))
+
+
+class TestMetadataInheritanceTree(unittest.TestCase):
+    """
+    Tests for MetadataInheritanceTree.
+    """
+    def setUp(self):
+        self.tree = MetadataInheritanceTree('course')
+        self.tree.set_container('course', {'graded': False, 'due': 'course_due'}, ['chapter'])
+        self.tree.set_container('chapter', {'graded': True}, ['problem'])
+
+    def test_get(self):
+        self.assertEqual(self.tree.get('course', {}), {})
+        self.assertEqual(self.tree.get('chapter'), {'graded': True, 'due': 'course_due'})
+        self.assertEqual(self.tree.get('problem'), {'graded': True, 'due': 'course_due'})
+        self.assertIsNone(self.tree.get('nosuchblock'))
+
+    def test_update_container(self):
+        self.assertEqual(self.tree.get('problem')['due'], 'course_due')
+        self.tree.set_container('course', {'due': 'new_due'}, ['chapter'])
+        self.assertEqual(self.tree.get('problem'), {'graded': True, 'due': 'new_due'})
+
+    def test_remove_child(self):
+        self.tree.set_container('chapter', {'graded': True}, [])
+        self.assertEqual(self.tree.get('problem', {}), {})
+        self.assertEqual(self.tree.get('chapter'), {'graded': True, 'due': 'course_due'})
+
+    def test_detached_container(self):
+        tree = MetadataInheritanceTree('course')
+        tree.set_container('vertical', {'graded': True}, ['problem'])
+        self.assertEqual(tree.get('problem', {}), {})
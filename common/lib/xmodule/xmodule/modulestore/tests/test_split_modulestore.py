@@ -8,6 +8,7 @@ import unittest
 import uuid
 from contracts import contract
 from importlib import import_module
+from mock import patch
 from path import path
 
 from xmodule.course_module import CourseDescriptor
@@ -931,6 +932,43 @@ class SplitModuleItemTests(SplitModuleTest):
         parent = modulestore().get_parent_location(locator)
         self.assertIsNone(parent)
 
+    def test_get_parent_from_changed_structure(self):
+        """
+        The parent index of a structure follows changes made to it in place (as in bulk operations)
+        """
+        course_key = CourseLocator(org='testx', course='GreekHero', run="run", branch=BRANCH_NAME_DRAFT)
+        structure = modulestore()._lookup_course(course_key)['structure']  # pylint: disable=protected-access
+        chapter1 = BlockKey('chapter', 'chapter1')
+        chapter2 = BlockKey('chapter', 'chapter2')
+        root = structure['root']
+        self.assertEqual(modulestore()._get_parent_from_structure(chapter1, structure), root)
+
+        structure['blocks'][root]['fields']['children'].remove(chapter1)
+        structure['blocks'][chapter2]['fields'].setdefault('children', []).append(chapter1)
+        self.assertEqual(modulestore()._get_parent_from_structure(chapter1, structure), chapter2)
+
+        structure['blocks'][chapter2]['fields']['children'].remove(chapter1)
+        self.assertIsNone(modulestore()._get_parent_from_structure(chapter1, structure))
+        modulestore()._clear_cache(structure['_id'])
+
+    def test_get_parent_of_root_without_rebuilding(self):
+        """
+        Finding that the root, or an orphan of a saved structure, has no parent doesn't rebuild the parent index
+        """
+        course_key = CourseLocator(org='testx', course='GreekHero', run="run", branch=BRANCH_NAME_DRAFT)
+        structure = modulestore()._lookup_course(course_key)['structure']  # pylint: disable=protected-access
+        root = structure['root']
+        orphan = BlockKey('chapter', 'orphan')
+        modulestore()._get_parent_from_structure(root, structure)
+        with patch.object(
+            modulestore(), '_get_parent_index', wraps=modulestore()._get_parent_index
+        ) as mock_get_parent_index:
+            for __ in range(3):
+                self.assertIsNone(modulestore()._get_parent_from_structure(root, structure))
+                self.assertIsNone(modulestore()._get_parent_from_structure(orphan, structure))
+        self.assertFalse(any(call[1].get('rebuild') for call in mock_get_parent_index.call_args_list))
+        modulestore()._clear_cache(structure['_id'])
+
     def test_get_children(self):
         """
         Test the existing get_children method on xdescriptors
@@ -181,6 +181,74 @@ class TestBulkWriteMixinClosed(TestBulkWriteMixin):
         get_result = self.bulk.get_structure(self.course_key, version_result['_id'])
         self.assertEquals(version_result, get_result)
 
+    def test_unsaved_structures_forgotten_on_close(self):
+        self.conn.get_course_index.return_value = None
+        self.bulk._begin_bulk_operation(self.course_key)
+        self.bulk._begin_bulk_operation(self.course_key_b)
+        new_structure = self.bulk.version_structure(self.course_key, self.structure, 'user_id')
+        new_structure_b = self.bulk.version_structure(self.course_key_b, self.structure, 'user_id')
+        self.assertEqual(self.bulk._unsaved_structure_ids, {new_structure['_id'], new_structure_b['_id']})
+
+        self.bulk._end_bulk_operation(self.course_key)
+        self.assertEqual(self.bulk._unsaved_structure_ids, {new_structure_b['_id']})
+        self.bulk._end_bulk_operation(self.course_key_b)
+        self.assertEqual(self.bulk._unsaved_structure_ids, set())
+
+    def test_unsaved_structures_forgotten_on_abort(self):
+        self.conn.get_course_index.return_value = None
+        self.conn.upsert_structure.side_effect = IOError
+        with self.assertRaises(IOError):
+            with self.bulk.bulk_operations(self.course_key):
+                self.bulk.version_structure(self.course_key, self.structure, 'user_id')
+                raise ValueError
+        self.assertEqual(self.bulk._unsaved_structure_ids, set())
+        self.assertFalse(self.bulk._is_in_bulk_operation(self.course_key))
+        self.assertEqual(self.bulk._get_bulk_ops_record(self.course_key).structures, {})
+
+    def test_no_bulk_write_definition(self):
+        # Creating a definition when no bulk operation is active should just
+        # call through to the db_connection
+        definition = {'this': 'is', 'a': 'definition', '_id': ObjectId()}
+        self.bulk.insert_definition(self.course_key, definition)
+        self.assertConnCalls(call.insert_definition(definition))
+
+    def test_no_bulk_read_definition(self):
+        # Reading a definition when no bulk operation is active should just
+        # call through to the db_connection
+        definition_id = ObjectId()
+        result = self.bulk.get_definition(definition_id)
+        self.assertConnCalls(call.get_definition(definition_id))
+        self.assertEqual(result, self.conn.get_definition.return_value)
+
+    def test_read_definition_in_bulk(self):
+        self.bulk._begin_bulk_operation(self.course_key)
+        self.conn.reset_mock()
+        definition = {'this': 'is', 'a': 'definition', '_id': ObjectId()}
+        self.bulk.insert_definition(self.course_key, definition)
+        result = self.bulk.get_definition(definition['_id'])
+        self.assertConnCalls()
+        self.assertEqual(result, definition)
+        # modifying the result doesn't modify the definition to be inserted
+        result['this'] = 'was'
+        self.assertEqual(self.bulk.get_definition(definition['_id'])['this'], 'is')
+
+    def test_write_definitions_in_order_on_close(self):
+        self.conn.get_course_index.return_value = None
+        self.bulk._begin_bulk_operation(self.course_key)
+        self.conn.reset_mock()
+        definitions = [{'definition': index, '_id': ObjectId()} for index in range(3)]
+        for definition in definitions:
+            self.bulk.insert_definition(self.course_key, definition)
+        self.bulk.update_structure(self.course_key, self.structure)
+        self.assertConnCalls()
+        self.bulk._end_bulk_operation(self.course_key)
+        # the definitions are inserted before the structure which refers to them
+        self.assertConnCalls(
+            call.insert_definitions(definitions),
+            call.upsert_structure(self.structure),
+        )
+
+
 class TestBulkWriteMixinClosedAfterPrevTransaction(TestBulkWriteMixinClosed, TestBulkWriteMixinPreviousTransaction):
     """
     Test that operations on with a closed transaction aren't affected by a previously executed transaction
@@ -307,6 +375,41 @@ class TestBulkWriteMixinFindMethods(TestBulkWriteMixin):
             else:
                 self.assertNotIn(db_structure(_id), results)
 
+    @ddt.data(
+        ([], [], []),
+        ([1, 2, 3], [1, 2], [1, 2]),
+        ([1, 2, 3], [1], [1, 2]),
+        ([1, 2, 3], [], [1, 2]),
+    )
+    @ddt.unpack
+    def test_get_definitions(self, search_ids, active_ids, db_ids):
+        db_definition = lambda _id: {'db': 'definition', '_id': _id}
+        active_definition = lambda _id: {'active': 'definition', '_id': _id}
+
+        db_definitions = [db_definition(_id) for _id in db_ids if _id not in active_ids]
+        for n, _id in enumerate(active_ids):
+            course_key = CourseLocator('org', 'course', 'run{}'.format(n))
+            self.bulk._begin_bulk_operation(course_key)
+            self.bulk.insert_definition(course_key, active_definition(_id))
+
+        self.conn.find_matching_definitions.return_value = db_definitions
+        results = self.bulk.get_definitions(search_ids)
+        remaining_ids = set(search_ids) - set(active_ids)
+        if remaining_ids:
+            self.conn.find_matching_definitions.assert_called_once_with({'_id': {'$in': list(remaining_ids)}})
+        else:
+            self.assertFalse(self.conn.find_matching_definitions.called)
+        for _id in active_ids:
+            if _id in search_ids:
+                self.assertIn(active_definition(_id), results)
+            else:
+                self.assertNotIn(active_definition(_id), results)
+        for _id in db_ids:
+            if _id in search_ids and _id not in active_ids:
+                self.assertIn(db_definition(_id), results)
+            else:
+                self.assertNotIn(db_definition(_id), results)
+
     def test_no_bulk_find_structures_derived_from(self):
         ids = [Mock(name='id')]
         self.conn.find_structures_derived_from.return_value = [MagicMock(name='result')]
@@ -0,0 +1,121 @@
+"""
+Tests of the structure cache used by the split modulestore's MongoConnection.
+"""
+import unittest
+from bson.objectid import ObjectId
+from mock import MagicMock, Mock, patch
+
+from xmodule.modulestore.split_mongo import BlockKey
+from xmodule.modulestore.split_mongo.mongo_connection import (
+    MongoConnection, StructureCache, shared_structure_cache
+)
+
+
+class TestStructureCache(unittest.TestCase):
+    """
+    Tests of StructureCache
+    """
+    def make_structure(self, num_blocks=1):
+        """
+        Return a decoded structure with `num_blocks` blocks
+        """
+        return {
+            '_id': ObjectId(),
+            'root': BlockKey('course', 'course'),
+            'blocks': {
+                BlockKey('html', 'block{}'.format(index)): {
+                    'block_type': 'html',
+                    'fields': {'display_name': 'Block {}'.format(index)},
+                }
+                for index in range(num_blocks)
+            },
+        }
+
+    def test_get_returns_cached_structure(self):
+        cache = StructureCache(1024 * 1024)
+        structure = self.make_structure()
+        cache.set(structure['_id'], structure)
+
+        # hits don't decode or copy the structure
+        with patch('xmodule.modulestore.split_mongo.mongo_connection.cPickle.loads') as mock_loads:
+            self.assertIs(cache.get(structure['_id']), structure)
+        self.assertFalse(mock_loads.called)
+
+    def test_miss(self):
+        cache = StructureCache(1024 * 1024)
+        self.assertIsNone(cache.get(ObjectId()))
+
+    def test_bounded_by_bytes(self):
+        structures = [self.make_structure(50) for __ in range(3)]
+        entry_size = len(StructureCache._serialize(structures[0]))
+        cache = StructureCache(entry_size * 2 + entry_size // 2)
+
+        for structure in structures[:2]:
+            cache.set(structure['_id'], structure)
+        # use the first structure, so the second one is the least recently used
+        cache.get(structures[0]['_id'])
+        cache.set(structures[2]['_id'], structures[2])
+
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        self.assertIsNotNone(cache.get(structures[0]['_id']))
+        self.assertIsNone(cache.get(structures[1]['_id']))
+        self.assertIsNotNone(cache.get(structures[2]['_id']))
+
+    def test_oversized_structure_not_cached(self):
+        structure = self.make_structure(50)
+        cache = StructureCache(10)
+        cache.set(structure['_id'], structure)
+        self.assertIsNone(cache.get(structure['_id']))
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_cache_subsystem(self):
+        subsystem = {}
+        cache_subsystem = Mock(get=subsystem.get, set=subsystem.__setitem__, delete=subsystem.pop)
+        structure = self.make_structure()
+        StructureCache(1024 * 1024, cache_subsystem).set(structure['_id'], structure)
+
+        # a cache in another process finds the structure in the cache subsystem
+        other_cache = StructureCache(1024 * 1024, cache_subsystem)
+        self.assertEqual(structure, other_cache.get(structure['_id']))
+
+        other_cache.delete(structure['_id'])
+        self.assertEqual(subsystem, {})
+
+    def test_shared_cache_keyed_on_settings(self):
+        cache_subsystem = Mock()
+        shared = shared_structure_cache(1024, cache_subsystem)
+        self.assertIs(shared_structure_cache(1024, cache_subsystem), shared)
+
+        other_size = shared_structure_cache(2048, cache_subsystem)
+        self.assertIsNot(other_size, shared)
+        self.assertEqual(other_size.max_bytes, 2048)
+        self.assertIsNone(shared_structure_cache(1024).cache_subsystem)
+
+
+class TestMongoConnectionStructureCache(unittest.TestCase):
+    """
+    Tests that MongoConnection reads structures through its structure cache
+    """
+    def setUp(self):
+        super(TestMongoConnectionStructureCache, self).setUp()
+        self.connection = MongoConnection.__new__(MongoConnection)
+        self.connection.structures = MagicMock(name='structures')
+        self.connection.structure_cache = StructureCache(1024 * 1024)
+        self.structure_id = ObjectId()
+        self.connection.structures.find_one.side_effect = lambda query: {
+            '_id': self.structure_id,
+            'root': ['course', 'course'],
+            'blocks': [{'block_type': 'course', 'block_id': 'course', 'fields': {'children': []}}],
+        }
+
+    def test_get_structure_reads_once(self):
+        first = self.connection.get_structure(self.structure_id)
+        second = self.connection.get_structure(self.structure_id)
+        self.assertEqual(first, second)
+        self.assertEqual(self.connection.structures.find_one.call_count, 1)
+
+    def test_upsert_invalidates(self):
+        structure = self.connection.get_structure(self.structure_id)
+        self.connection.upsert_structure(structure)
+        self.connection.get_structure(self.structure_id)
+        self.assertEqual(self.connection.structures.find_one.call_count, 2)
@@ -0,0 +1,69 @@
+"""
+Tests of the conversion of split modulestore structures to and from their mongo format.
+"""
+import unittest
+
+import contracts
+from bson.objectid import ObjectId
+from contracts import ContractNotRespected
+
+from xmodule.modulestore.split_mongo import BlockKey
+from xmodule.modulestore.split_mongo.mongo_connection import structure_from_mongo, structure_to_mongo
+
+
+class TestStructureValidation(unittest.TestCase):
+    """
+    Structures are only validated while contracts are enabled
+    """
+    def setUp(self):
+        super(TestStructureValidation, self).setUp()
+        if contracts.all_disabled():
+            self.addCleanup(contracts.disable_all)
+        else:
+            self.addCleanup(contracts.enable_all)
+
+    def mongo_structure(self):
+        """
+        Return a structure as stored in mongo, whose children are tuples rather than lists
+        """
+        return {
+            '_id': ObjectId(),
+            'root': ['course', 'course'],
+            'blocks': [
+                {'block_type': 'course', 'block_id': 'course', 'fields': {'children': [('html', 'intro')]}},
+                {'block_type': 'html', 'block_id': 'intro', 'fields': {}},
+            ],
+        }
+
+    def structure(self):
+        """
+        Return a decoded structure whose root isn't a BlockKey
+        """
+        return {
+            '_id': ObjectId(),
+            'root': ('course', 'course'),
+            'blocks': {BlockKey('course', 'course'): {'block_type': 'course', 'fields': {}}},
+        }
+
+    def test_from_mongo_validated_with_contracts_enabled(self):
+        contracts.enable_all()
+        with self.assertRaises(ContractNotRespected):
+            structure_from_mongo(self.mongo_structure())
+
+    def test_from_mongo_not_validated_with_contracts_disabled(self):
+        contracts.disable_all()
+        structure = structure_from_mongo(self.mongo_structure())
+        self.assertEqual(
+            structure['blocks'][BlockKey('course', 'course')]['fields']['children'],
+            [BlockKey('html', 'intro')]
+        )
+
+    def test_to_mongo_validated_with_contracts_enabled(self):
+        contracts.enable_all()
+        with self.assertRaises(ContractNotRespected):
+            structure_to_mongo(self.structure())
+
+    def test_to_mongo_not_validated_with_contracts_disabled(self):
+        contracts.disable_all()
+        structure = structure_to_mongo(self.structure())
+        self.assertEqual(structure['blocks'], [{'block_type': 'course', 'block_id': 'course', 'fields': {}}])
@@ -9,12 +9,16 @@ from xmodule.contentstore.content import StaticContent
 from xmodule.exceptions import NotFoundError
 from xmodule.modulestore import EdxJSONEncoder, ModuleStoreEnum
 from xmodule.modulestore.inheritance import own_metadata
+from fs.memoryfs import MemoryFS
 from fs.osfs import OSFS
+from fs import path as fspath
 from json import dumps
 import json
 import os
 from path import path
 import shutil
+import tarfile
+import time
 from xmodule.modulestore.draft_and_published import DIRECT_ONLY_CATEGORIES
 from opaque_keys.edx.locator import CourseLocator
 
@@ -25,6 +29,9 @@ EXPORT_VERSION_KEY = "export_format"
 
 DEFAULT_CONTENT_FIELDS = ['metadata', 'data']
 
+# the size of the chunks in which assets are read into a streamed export
+TAR_CHUNK_SIZE = 256 * 1024
+
 
 def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
     """
@@ -36,10 +43,50 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
     `root_dir`: The directory to write the exported xml to
     `course_dir`: The name of the directory inside `root_dir` to write the course content to
     """
+    fsm = OSFS(root_dir)
+    export_fs = fsm.makeopendir(course_dir)
+    course = _export_course_xml(modulestore, course_key, export_fs)
+
+    # export the static assets
+    if contentstore:
+        contentstore.export_all_for_course(
+            course_key,
+            root_dir + '/' + course_dir + '/static/',
+            root_dir + '/' + course_dir + '/policies/assets.json',
+        )
+
+        # If we are using the default course image, export it to the
+        # legacy location to support backwards compatibility.
+        course_image = _default_course_image(contentstore, course)
+        if course_image is not None:
+            output_dir = root_dir + '/' + course_dir + '/static/images/'
+            if not os.path.isdir(output_dir):
+                os.makedirs(output_dir)
+            with OSFS(output_dir).open('course_image.jpg', 'wb') as course_image_file:
+                course_image_file.write(course_image.data)
+
+
+def export_to_tar_stream(modulestore, contentstore, course_key, course_dir):
+    """
+    Export the course like `export_to_xml`, but as a gzipped tar archive of
+    `course_dir`, without writing anything to disk.
+
+    The modules are exported to memory (raising any `SerializationError`)
+    before this returns. Returns an iterator over chunks of the archive; the
+    assets are streamed from `contentstore` into the archive as it's iterated.
+    """
+    export_fs = MemoryFS()
+    course = _export_course_xml(modulestore, course_key, export_fs)
+    return _stream_tar(contentstore, course, export_fs, course_dir)
 
+
+def _export_course_xml(modulestore, course_key, export_fs):
+    """
+    Export all modules of the course from `modulestore` as xml to the filesystem `export_fs`, and
+    return the course.
+    """
     course = modulestore.get_course(course_key, depth=None)  # None means infinite
-    fsm = OSFS(root_dir)
-    export_fs = course.runtime.export_fs = fsm.makeopendir(course_dir)
+    course.runtime.export_fs = export_fs
 
     root = lxml.etree.Element('unknown')
 
@@ -54,33 +101,7 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
     with export_fs.open('course.xml', 'w') as course_xml:
         lxml.etree.ElementTree(root).write(course_xml)
 
-    # export the static assets
     policies_dir = export_fs.makeopendir('policies')
-    if contentstore:
-        contentstore.export_all_for_course(
-            course_key,
-            root_dir + '/' + course_dir + '/static/',
-            root_dir + '/' + course_dir + '/policies/assets.json',
-        )
-
-        # If we are using the default course image, export it to the
-        # legacy location to support backwards compatibility.
-        if course.course_image == course.fields['course_image'].default:
-            try:
-                course_image = contentstore.find(
-                    StaticContent.compute_location(
-                        course.id,
-                        course.course_image
-                    ),
-                )
-            except NotFoundError:
-                pass
-            else:
-                output_dir = root_dir + '/' + course_dir + '/static/images/'
-                if not os.path.isdir(output_dir):
-                    os.makedirs(output_dir)
-                with OSFS(output_dir).open('course_image.jpg', 'wb') as course_image_file:
-                    course_image_file.write(course_image.data)
 
     # export the static tabs
     export_extra_content(export_fs, modulestore, xml_centric_course_key, 'static_tab', 'tabs', '.html')
@@ -138,6 +159,120 @@ def export_to_xml(modulestore, contentstore, course_key, root_dir, course_dir):
                         node = lxml.etree.Element('unknown')
                         draft_vertical.add_xml_to_node(node)
 
+    return course
+
+
+def _default_course_image(contentstore, course):
+    """
+    Returns the content of the course image, if the course uses the default one and it exists.
+    """
+    if course.course_image != course.fields['course_image'].default:
+        return None
+    try:
+        return contentstore.find(StaticContent.compute_location(course.id, course.course_image))
+    except NotFoundError:
+        return None
+
+
+class _TarOutput(object):
+    """
+    The file that a streamed tar archive is written to, buffering what's
+    written until it's drained.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+    def drain(self):
+        """
+        Returns what's been written since the last drain.
+        """
+        data = ''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _stream_tar(contentstore, course, export_fs, course_dir):
+    """
+    Yields the chunks of a gzipped tar archive of `course_dir`, holding the
+    contents of `export_fs` and the assets of `course` in `contentstore`.
+    """
+    output = _TarOutput()
+    tar_file = tarfile.open(mode='w|gz', fileobj=output, bufsize=TAR_CHUNK_SIZE, encoding='utf-8')
+
+    for dirpath, filenames in export_fs.walk():
+        arc_dir = course_dir + dirpath.rstrip('/')
+        directory = tarfile.TarInfo(arc_dir)
+        directory.type = tarfile.DIRTYPE
+        directory.mode = 0755
+        directory.mtime = time.time()
+        tar_file.addfile(directory)
+        for filename in filenames:
+            data = export_fs.getcontents(fspath.pathjoin(dirpath, filename))
+            for chunk in _add_tar_member(tar_file, output, arc_dir + '/' + filename, len(data), [data]):
+                yield chunk
+
+    if contentstore:
+        assets, __ = contentstore.get_all_content_for_course(course.id)
+        for asset in assets:
+            content = contentstore.find(asset['asset_key'], as_stream=True)
+            static_dir = course_dir + '/static'
+            if content.import_path:
+                static_dir = fspath.pathjoin(static_dir, os.path.dirname(content.import_path))
+            try:
+                for chunk in _add_tar_member(
+                        tar_file, output, fspath.pathjoin(static_dir, content.name), content.length,
+                        content.stream_data(chunk_size=TAR_CHUNK_SIZE)
+                ):
+                    yield chunk
+            finally:
+                content.close()
+
+        policy = dumps(contentstore.assets_export_policy(assets))
+        for chunk in _add_tar_member(
+                tar_file, output, course_dir + '/policies/assets.json', len(policy), [policy]
+        ):
+            yield chunk
+
+        course_image = _default_course_image(contentstore, course)
+        if course_image is not None:
+            for chunk in _add_tar_member(
+                    tar_file, output, course_dir + '/static/images/course_image.jpg', len(course_image.data),
+                    [course_image.data]
+            ):
+                yield chunk
+
+    tar_file.close()
+    yield output.drain()
+
+
+def _add_tar_member(tar_file, output, name, size, chunks):
+    """
+    Adds a file `name` of `size` bytes to the streamed `tar_file`, with the
+    data in `chunks`. Like `TarFile.addfile`, but yields what's been written
+    to `output` as it goes, rather than buffering the whole file.
+    """
+    tarinfo = tarfile.TarInfo(name)
+    tarinfo.size = size
+    tarinfo.mtime = time.time()
+    tar_file.addfile(tarinfo)
+
+    written = 0
+    for chunk in chunks:
+        tar_file.fileobj.write(chunk)
+        written += len(chunk)
+        yield output.drain()
+    if written != size:
+        raise IOError(u"{} changed size while being exported".format(name))
+
+    blocks, remainder = divmod(size, tarfile.BLOCKSIZE)
+    if remainder > 0:
+        tar_file.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+        blocks += 1
+    tar_file.offset += blocks * tarfile.BLOCKSIZE
+
 
 def adapt_references(subtree, destination_course_key, export_fs):
     """
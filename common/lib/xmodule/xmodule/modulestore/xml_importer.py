@@ -20,9 +20,11 @@ Modulestore virtual   |          XML physical (draft, published)
              (a, a)   |  (a, a) | (x, a) | (x, x) | (x, y) | (a, x)
              (a, b)   |  (a, b) | (x, b) | (x, x) | (x, y) | (a, x)
 """
+import hashlib
 import logging
 import os
 import mimetypes
+from multiprocessing.pool import ThreadPool
 from path import path
 import json
 import re
@@ -32,7 +34,7 @@ from xblock.runtime import KvsFieldData, DictKeyValueStore
 from xmodule.x_module import XModuleDescriptor
 from opaque_keys.edx.keys import UsageKey
 from xblock.fields import Scope, Reference, ReferenceList, ReferenceValueDict
-from xmodule.contentstore.content import StaticContent
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from .inheritance import own_metadata
 from xmodule.errortracker import make_error_tracker
 from .store_utilities import rewrite_nonportable_content_links
@@ -45,11 +47,25 @@ from xmodule.modulestore import ModuleStoreEnum
 
 log = logging.getLogger(__name__)
 
+# the number of threads importing static files
+STATIC_IMPORT_WORKERS = 4
+# the size of the chunks in which static files are read
+STATIC_IMPORT_CHUNK_SIZE = 1024 * 1024
+
 
 def import_static_content(
         course_data_path, static_content_store,
-        target_course_id, subpath='static', verbose=False):
-
+        target_course_id, subpath='static', verbose=False, workers=STATIC_IMPORT_WORKERS):
+    """
+    Imports the files under `course_data_path`/`subpath` as assets of
+    `target_course_id` into `static_content_store`, and returns a dict mapping
+    the path of each file (relative to `subpath`) to its asset key.
+
+    Files are streamed into the store, and imported (along with their
+    thumbnails) by a pool of `workers` threads. Files identical to an asset
+    the course already has (same content hash and attributes) aren't
+    uploaded again.
+    """
     remap_dict = {}
 
     # now import all static assets
@@ -68,6 +84,12 @@ def import_static_content(
     mimetypes.add_type('application/octet-stream', '.srt')
     mimetypes_list = mimetypes.types_map.values()
 
+    existing_assets = {
+        asset['asset_key'].name: asset
+        for asset in static_content_store.get_all_content_for_course(target_course_id)[0]
+    }
+
+    pending_imports = []
     for dirname, _, filenames in os.walk(static_dir):
         for filename in filenames:
 
@@ -78,20 +100,6 @@ def import_static_content(
                     log.debug('skipping static content %s...', content_path)
                 continue
 
-            if verbose:
-                log.debug('importing static content %s...', content_path)
-
-            try:
-                with open(content_path, 'rb') as f:
-                    data = f.read()
-            except IOError:
-                if filename.startswith('._'):
-                    # OS X "companion files". See
-                    # http://www.diigo.com/annotated/0c936fda5da4aa1159c189cea227e174
-                    continue
-                # Not a 'hidden file', then re-raise exception
-                raise
-
             # strip away leading path from the name
             fullname_with_subpath = content_path.replace(static_dir, '')
             if fullname_with_subpath.startswith('/'):
@@ -106,13 +114,102 @@ def import_static_content(
             # Check extracted contentType in list of all valid mimetypes
             if not mime_type or mime_type not in mimetypes_list:
                 mime_type = mimetypes.guess_type(filename)[0]   # Assign guessed mimetype
-            content = StaticContent(
-                asset_key, displayname, mime_type, data,
-                import_path=fullname_with_subpath, locked=locked
+
+            pending_imports.append(_StaticContentImport(
+                content_path, asset_key, displayname, mime_type, fullname_with_subpath, locked,
+                existing_assets.get(asset_key.name),
+            ))
+
+    def import_content(pending_import):
+        """
+        Imports one file, returning whether it's been imported.
+        """
+        if verbose:
+            log.debug('importing static content %s...', pending_import.content_path)
+        try:
+            return pending_import.run(static_content_store)
+        except IOError:
+            if os.path.basename(pending_import.content_path).startswith('._'):
+                # OS X "companion files". See
+                # http://www.diigo.com/annotated/0c936fda5da4aa1159c189cea227e174
+                return False
+            # Not a 'hidden file', then re-raise exception
+            raise
+
+    if workers > 1 and len(pending_imports) > 1:
+        pool = ThreadPool(min(workers, len(pending_imports)))
+        try:
+            imported = pool.map(import_content, pending_imports)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        imported = [import_content(pending_import) for pending_import in pending_imports]
+
+    for pending_import, was_imported in zip(pending_imports, imported):
+        if was_imported:
+            # store the remapping information which will be needed
+            # to subsitute in the module data
+            remap_dict[pending_import.import_path] = pending_import.asset_key
+
+    return remap_dict
+
+
+class _StaticContentImport(object):
+    """
+    The import of one static file as an asset.
+    """
+    def __init__(self, content_path, asset_key, displayname, mime_type, import_path, locked, existing_asset):
+        self.content_path = content_path
+        self.asset_key = asset_key
+        self.displayname = displayname
+        self.mime_type = mime_type
+        self.import_path = import_path
+        self.locked = locked
+        # the attributes of the asset already stored under asset_key, if any
+        self.existing_asset = existing_asset
+
+    def is_duplicate(self):
+        """
+        Returns whether the course already has this file, with the same attributes.
+        """
+        existing = self.existing_asset
+        if existing is None or existing.get('md5') is None:
+            return False
+        if (
+                existing.get('displayname') != self.displayname or
+                existing.get('contentType') != self.mime_type or
+                existing.get('import_path') != self.import_path or
+                existing.get('locked', False) != self.locked
+        ):
+            return False
+
+        md5 = hashlib.md5()
+        with open(self.content_path, 'rb') as content_file:
+            for chunk in iter(lambda: content_file.read(STATIC_IMPORT_CHUNK_SIZE), ''):
+                md5.update(chunk)
+        return md5.hexdigest() == existing['md5']
+
+    def run(self, static_content_store):
+        """
+        Streams the file into `static_content_store`, unless it's a duplicate,
+        and returns whether the asset is now there.
+        """
+        if self.is_duplicate():
+            log.debug('static content %s is unchanged, not importing it', self.content_path)
+            return True
+
+        with open(self.content_path, 'rb') as content_file:
+            content = StaticContentStream(
+                self.asset_key, self.displayname, self.mime_type, content_file,
+                import_path=self.import_path, locked=self.locked,
+                length=os.path.getsize(self.content_path),
             )
 
             # first let's save a thumbnail so we can get back a thumbnail location
-            thumbnail_content, thumbnail_location = static_content_store.generate_thumbnail(content)
+            thumbnail_content, thumbnail_location = static_content_store.generate_thumbnail(
+                content, tempfile_path=self.content_path
+            )
 
             if thumbnail_content is not None:
                 content.thumbnail_location = thumbnail_location
@@ -122,14 +219,9 @@ def import_static_content(
                 static_content_store.save(content)
             except Exception as err:
                 log.exception(u'Error importing {0}, error={1}'.format(
-                    fullname_with_subpath, err
+                    self.import_path, err
                 ))
-
-            # store the remapping information which will be needed
-            # to subsitute in the module data
-            remap_dict[fullname_with_subpath] = asset_key
-
-    return remap_dict
+        return True
 
 
 def import_from_xml(
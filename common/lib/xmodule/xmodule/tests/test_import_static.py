@@ -1,23 +1,40 @@
 """
 Tests that check that we ignore the appropriate files when importing courses.
 """
+import hashlib
 import unittest
 from mock import Mock
+from xmodule.contentstore.content import StaticContent
 from xmodule.modulestore.xml_importer import import_static_content
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
 from xmodule.tests import DATA_DIR
 
 
+def mock_content_store(existing_assets=()):
+    """
+    Returns a mock content store holding `existing_assets`, which records the
+    data of the content saved to it in `saved_data`.
+    """
+    content_store = Mock()
+    content_store.generate_thumbnail.return_value = ("content", "location")
+    content_store.get_all_content_for_course.return_value = (list(existing_assets), len(existing_assets))
+    content_store.saved_data = {}
+
+    def save(content):
+        """Reads the streamed data of the saved content."""
+        content_store.saved_data[content.name] = "".join(content.stream_data())
+    content_store.save.side_effect = save
+    return content_store
+
+
 class IgnoredFilesTestCase(unittest.TestCase):
     "Tests for ignored files"
     def test_ignore_tilde_static_files(self):
         course_dir = DATA_DIR / "tilde"
         course_id = SlashSeparatedCourseKey("edX", "tilde", "Fall_2012")
-        content_store = Mock()
-        content_store.generate_thumbnail.return_value = ("content", "location")
+        content_store = mock_content_store()
         import_static_content(course_dir, content_store, course_id)
-        saved_static_content = [call[0][0] for call in content_store.save.call_args_list]
-        name_val = {sc.name: sc.data for sc in saved_static_content}
+        name_val = content_store.saved_data
         self.assertIn("example.txt", name_val)
         self.assertNotIn("example.txt~", name_val)
         self.assertIn("GREEN", name_val["example.txt"])
@@ -28,14 +45,59 @@ class IgnoredFilesTestCase(unittest.TestCase):
         """
         course_dir = DATA_DIR / "dot-underscore"
         course_id = SlashSeparatedCourseKey("edX", "dot-underscore", "2014_Fall")
-        content_store = Mock()
-        content_store.generate_thumbnail.return_value = ("content", "location")
+        content_store = mock_content_store()
         import_static_content(course_dir, content_store, course_id)
-        saved_static_content = [call[0][0] for call in content_store.save.call_args_list]
-        name_val = {sc.name: sc.data for sc in saved_static_content}
+        name_val = content_store.saved_data
         self.assertIn("example.txt", name_val)
         self.assertIn(".example.txt", name_val)
         self.assertNotIn("._example.txt", name_val)
         self.assertNotIn(".DS_Store", name_val)
         self.assertIn("GREEN", name_val["example.txt"])
         self.assertIn("BLUE", name_val[".example.txt"])
+
+
+class DuplicateFilesTestCase(unittest.TestCase):
+    "Tests for files that the course already has"
+    def setUp(self):
+        self.course_dir = DATA_DIR / "tilde"
+        self.course_id = SlashSeparatedCourseKey("edX", "tilde", "Fall_2012")
+        self.asset_key = StaticContent.compute_location(self.course_id, "example.txt")
+        with open(self.course_dir / "static" / "example.txt", "rb") as example:
+            self.md5 = hashlib.md5(example.read()).hexdigest()
+
+    def existing_asset(self, **attrs):
+        """
+        Returns the attributes of an existing example.txt asset of the course.
+        """
+        asset = {
+            'asset_key': self.asset_key,
+            'displayname': "example.txt",
+            'contentType': "text/plain",
+            'import_path': "example.txt",
+            'locked': False,
+            'md5': self.md5,
+        }
+        asset.update(attrs)
+        return asset
+
+    def test_duplicate_not_saved(self):
+        content_store = mock_content_store([self.existing_asset()])
+        remap_dict = import_static_content(self.course_dir, content_store, self.course_id)
+        self.assertNotIn("example.txt", content_store.saved_data)
+        self.assertEqual(remap_dict["example.txt"], self.asset_key)
+
+    def test_changed_content_saved(self):
+        content_store = mock_content_store([self.existing_asset(md5="0" * 32)])
+        import_static_content(self.course_dir, content_store, self.course_id)
+        self.assertIn("GREEN", content_store.saved_data["example.txt"])
+
+    def test_changed_attributes_saved(self):
+        content_store = mock_content_store([self.existing_asset(locked=True)])
+        import_static_content(self.course_dir, content_store, self.course_id)
+        self.assertIn("example.txt", content_store.saved_data)
+
+    def test_serial_import(self):
+        content_store = mock_content_store()
+        remap_dict = import_static_content(self.course_dir, content_store, self.course_id, workers=1)
+        self.assertEqual(remap_dict, {"example.txt": self.asset_key})
+        self.assertIn("GREEN", content_store.saved_data["example.txt"])
@@ -0,0 +1,255 @@
+"""
+Course-level grade computation for many students at once.
+
+`courseware.grades.grade` grades one student at a time: it walks the course
+tree, and instantiates modules and queries StudentModule for every student.
+For grade reports, `CourseGradeEngine` instead walks the course structure once,
+reads the StudentModule scores of a whole block of students in bulk, and
+computes the per-section totals for the block with array operations before
+handing each student's totals to the course grader.
+"""
+# Compute grades using real division, with no integer truncation
+from __future__ import division
+
+import logging
+from itertools import islice
+
+import numpy
+from django.conf import settings
+from django.test.client import RequestFactory
+from dogapi import dog_stats_api
+
+from courseware import courses, grades
+from courseware.grading_structure import grading_structure
+from courseware.model_data import FieldDataCache
+from courseware.module_render import get_module_for_descriptor
+from student.models import anonymous_ids_for_users
+from submissions import api as sub_api  # installed from the edx-submissions repository
+from xmodule.graders import Score
+
+log = logging.getLogger("edx.courseware")
+
+
+class CourseGradeEngine(object):
+    """
+    Grades blocks of students in a single course.
+
+    The scorable structure of the course (graded sections, their problems,
+    weights and graded flags) is read once from its grading structure.
+    Scores of a block of students are then laid out as (students x problems)
+    arrays, from which the graded total of every section is computed for the
+    whole block at once.
+
+    Courses with sections whose scores depend on per-student module
+    instantiation (problems that always recalculate their grades, or blocks
+    with dynamic children) can't be graded this way; for those `bulk_capable`
+    is False and `iterate_grades_for` grades students one at a time.
+    """
+    def __init__(self, course):
+        self.course = course
+        self.request = RequestFactory().get('/')
+
+        # Ordered list of (section_format, section_name, section_location, problem column indices)
+        self.sections = []
+        self.problems = []
+        self.bulk_capable = not settings.GENERATE_PROFILE_SCORES
+
+        for section_format, sections in grading_structure(course)['graded_sections'].iteritems():
+            for section in sections:
+                columns = []
+                for problem in section['problems']:
+                    if problem['always_recalculate_grades']:
+                        self.bulk_capable = False
+                    columns.append(len(self.problems))
+                    self.problems.append(problem)
+                if section['has_dynamic_children']:
+                    self.bulk_capable = False
+                self.sections.append((
+                    section_format,
+                    section['display_name'],
+                    section['location'],
+                    numpy.array(columns, dtype=int),
+                ))
+
+        self.problem_columns = dict(
+            (problem['location'], column) for column, problem in enumerate(self.problems)
+        )
+        self.problem_urls = dict(
+            (problem['url'], column) for column, problem in enumerate(self.problems)
+        )
+        self.weights = numpy.array(
+            [problem['weight'] if problem['weight'] is not None else numpy.nan for problem in self.problems],
+            dtype=float,
+        )
+        self.graded = numpy.array([bool(problem['graded']) for problem in self.problems], dtype=bool)
+
+        # Max scores of problems that students have no stored max_grade for,
+        # computed the first time a student needs them.
+        self.default_max_scores = {}
+
+    def _default_max_score(self, student, column):
+        """
+        Returns the max score of the problem in `column`, instantiating it as
+        `student` the first time it's needed. Returns None if the problem can't
+        be instantiated or has no max score.
+        """
+        if column not in self.default_max_scores:
+            descriptor = self.course.runtime.get_block(self.problems[column]['location'])
+            self.request.user = student
+            self.request.session = {}
+            with grades.manual_transaction():
+                field_data_cache = FieldDataCache([descriptor], self.course.id, student)
+            problem = get_module_for_descriptor(student, self.request, descriptor, field_data_cache, self.course.id)
+            self.default_max_scores[column] = problem.max_score() if problem is not None else None
+        return self.default_max_scores[column]
+
+    def grade_block(self, students):
+        """
+        Grades every student in `students`, returning a list of gradesets in
+        the same format as `courseware.grades.grade`.
+        """
+        num_students = len(students)
+        num_problems = len(self.problems)
+
+        earned = numpy.zeros((num_students, num_problems), dtype=float)
+        possible = numpy.zeros((num_students, num_problems), dtype=float)
+        has_max = numpy.zeros((num_students, num_problems), dtype=bool)
+        has_state = numpy.zeros((num_students, num_problems), dtype=bool)
+        from_submissions = numpy.zeros((num_students, num_problems), dtype=bool)
+
+        with grades.manual_transaction():
+            student_module_scores = grades.get_student_module_scores(self.course.id, students)
+
+        for row, student in enumerate(students):
+            for usage_key, (grade, max_grade) in student_module_scores.get(student.id, {}).iteritems():
+                column = self.problem_columns.get(usage_key)
+                if column is None:
+                    continue
+                has_state[row, column] = True
+                if max_grade is not None:
+                    has_max[row, column] = True
+                    earned[row, column] = grade if grade is not None else 0
+                    possible[row, column] = max_grade
+
+        # Scores registered with the submissions API take precedence, unweighted
+        anonymous_ids = anonymous_ids_for_users(students, self.course.id)
+        for row, student in enumerate(students):
+            submissions_scores = sub_api.get_scores(
+                self.course.id.to_deprecated_string(), anonymous_ids[student.id]
+            )
+            for location_url, (sub_earned, sub_possible) in submissions_scores.iteritems():
+                column = self.problem_urls.get(location_url)
+                if column is not None:
+                    from_submissions[row, column] = True
+                    earned[row, column] = sub_earned
+                    possible[row, column] = sub_possible
+
+        # A section is only scored for students who have touched it; every
+        # other student gets 0% for it.
+        touched = numpy.zeros((num_students, len(self.sections)), dtype=bool)
+        for index, (_, _, _, columns) in enumerate(self.sections):
+            if len(columns):
+                touched[:, index] = numpy.any(has_state[:, columns] | from_submissions[:, columns], axis=1)
+
+        # Students in a touched section without a stored max score for a
+        # problem get that problem's max score, with nothing earned.
+        needs_default = ~has_max & ~from_submissions
+        unscorable = numpy.zeros((num_students, num_problems), dtype=bool)
+        for index, (_, _, _, columns) in enumerate(self.sections):
+            for column in columns:
+                rows = numpy.nonzero(needs_default[:, column] & touched[:, index])[0]
+                if not len(rows):
+                    continue
+                max_score = self._default_max_score(students[rows[0]], column)
+                if max_score is None:
+                    unscorable[rows, column] = True
+                else:
+                    possible[rows, column] = max_score
+
+        # Re-weight problems, as `courseware.grades.get_score` does
+        reweight = ~numpy.isnan(self.weights) & ~from_submissions & (possible != 0)
+        weights = numpy.where(numpy.isnan(self.weights), 0, self.weights)
+        earned = numpy.where(reweight, earned * weights / numpy.where(possible != 0, possible, 1), earned)
+        possible = numpy.where(reweight, weights, possible)
+
+        counted = self.graded & (possible > 0) & ~unscorable
+        graded_earned = numpy.where(counted, earned, 0)
+        graded_possible = numpy.where(counted, possible, 0)
+
+        section_earned = numpy.zeros((num_students, len(self.sections)), dtype=float)
+        section_possible = numpy.zeros((num_students, len(self.sections)), dtype=float)
+        for index, (_, _, _, columns) in enumerate(self.sections):
+            if len(columns):
+                section_earned[:, index] = graded_earned[:, columns].sum(axis=1)
+                section_possible[:, index] = graded_possible[:, columns].sum(axis=1)
+
+        gradesets = []
+        for row in xrange(num_students):
+            totaled_scores = {}
+            for index, (section_format, section_name, section_location, _) in enumerate(self.sections):
+                format_scores = totaled_scores.setdefault(section_format, [])
+                if touched[row, index]:
+                    graded_total = Score(
+                        float(section_earned[row, index]), float(section_possible[row, index]), True, section_name
+                    )
+                else:
+                    graded_total = Score(0.0, 1.0, True, section_name)
+
+                if graded_total.possible > 0:
+                    format_scores.append(graded_total)
+                else:
+                    log.info("Unable to grade a section with a total possible score of zero. " +
+                             str(section_location))
+
+            gradesets.append(self._summarize(totaled_scores))
+        return gradesets
+
+    def _summarize(self, totaled_scores):
+        """
+        Runs the course grader over `totaled_scores`, and adds the rounded
+        percentage and letter grade, as `courseware.grades.grade` does.
+        """
+        grade_summary = self.course.grader.grade(totaled_scores, generate_random_scores=False)
+        grade_summary['percent'] = round(grade_summary['percent'] * 100 + 0.05) / 100
+        grade_summary['grade'] = grades.grade_for_percentage(self.course.grade_cutoffs, grade_summary['percent'])
+        grade_summary['totaled_scores'] = totaled_scores
+        return grade_summary
+
+
+def iterate_grades_for(course_id, students, block_size=200):
+    """
+    Given a course_id and an iterable of students (User), yield a tuple of
+    (student, gradeset, err_msg) for every student, like
+    `courseware.grades.iterate_grades_for`, but grading blocks of `block_size`
+    students at a time with a `CourseGradeEngine`.
+
+    If the course can't be graded in bulk, this falls back to grading
+    students one at a time. If a block fails to grade, its students are
+    graded one at a time so that errors are reported per student.
+    """
+    course = courses.get_course_by_id(course_id)
+    engine = CourseGradeEngine(course)
+    if not engine.bulk_capable:
+        log.info(u"Course %s can't be graded in bulk, grading students one at a time", course_id)
+        for result in grades.iterate_grades_for(course_id, students):
+            yield result
+        return
+
+    students = iter(students)
+    while True:
+        block = list(islice(students, block_size))
+        if not block:
+            break
+        with dog_stats_api.timer('lms.grades.iterate_bulk_grades_for', tags=['action:{}'.format(course_id)]):
+            try:
+                gradesets = engine.grade_block(block)
+            except Exception:  # pylint: disable=broad-except
+                log.exception(u"Cannot grade block of %d students in course %s in bulk", len(block), course_id)
+                gradesets = None
+
+        if gradesets is None:
+            for result in grades.iterate_grades_for(course_id, block):
+                yield result
+        else:
+            for student, gradeset in zip(block, gradesets):
+                yield student, gradeset, ""
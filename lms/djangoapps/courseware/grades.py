@@ -6,6 +6,7 @@ import random
 import logging
 
 from contextlib import contextmanager
+from itertools import islice
 from django.conf import settings
 from django.db import transaction
 from django.test.client import RequestFactory
@@ -13,20 +14,25 @@ from django.test.client import RequestFactory
 from dogapi import dog_stats_api
 
 from courseware import courses
-from courseware.model_data import FieldDataCache
+from courseware.model_data import FieldDataCache, chunks
 from student.models import anonymous_id_for_user
 from xmodule import graders
 from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
-from .models import StudentModule
+from .grading_structure import grading_structure
+from .models import StudentModule, StudentSubsectionGrade, SubsectionStructureProblem
 from .module_render import get_module_for_descriptor
 from submissions import api as sub_api  # installed from the edx-submissions repository
 from opaque_keys import InvalidKeyError
 
 log = logging.getLogger("edx.courseware")
 
+# Number of students whose StudentModule scores are fetched together when
+# grading many students in a row.
+STUDENT_MODULE_PREFETCH_BATCH_SIZE = 100
+
 
 def yield_dynamic_descriptor_descendents(descriptor, module_creator):
     """
@@ -140,17 +146,93 @@ def answer_distributions(course_key):
 
     return answer_counts
 
+
+def persistent_grades_enabled():
+    """
+    Returns whether per-subsection grades should be persisted and reused.
+
+    Persistence is always off when profile scores are being randomly
+    generated, since those must never be stored.
+    """
+    return (
+        settings.FEATURES.get('ENABLE_PERSISTENT_SUBSECTION_GRADES', False) and
+        not settings.GENERATE_PROFILE_SCORES
+    )
+
+
+def get_persisted_subsection_grades(student, course_key):
+    """
+    Returns a dict of subsection location -> StudentSubsectionGrade for every
+    persisted subsection grade of `student` in the course, fetched in a single
+    query. Returns None if persisted grades are disabled or the student is
+    anonymous.
+    """
+    if not persistent_grades_enabled() or not student.is_authenticated():
+        return None
+    with manual_transaction():
+        return {
+            subsection_grade.usage_key.map_into_course(course_key): subsection_grade
+            for subsection_grade in StudentSubsectionGrade.objects.filter(student=student, course_id=course_key)
+        }
+
+
+def _fresh_persisted_scores(persisted_grades, section):
+    """
+    Returns the list of persisted per-problem score dicts for the graded
+    `section` of the course's grading structure, or None if nothing is
+    persisted for it or the persisted scores were computed against a
+    different version of the section's structure.
+    """
+    subsection_grade = persisted_grades.get(section['location'])
+    if subsection_grade is None or subsection_grade.structure_hash != section['structure_hash']:
+        return None
+    return subsection_grade.get_scores()
+
+
+def _problem_score_entry(descriptor, correct, total):
+    """
+    Returns the dict stored in `StudentSubsectionGrade.scores` for one problem.
+    Problems that could not be scored are stored with None scores so that
+    later score updates for them are still applied to the subsection.
+    """
+    return {
+        'usage_key': descriptor.location.to_deprecated_string(),
+        'earned': correct,
+        'possible': total,
+        'graded': descriptor.graded,
+        'display_name': descriptor.display_name_with_default,
+    }
+
+
+def persist_subsection_grade(student, course_key, section, problem_scores):
+    """
+    Stores the freshly computed per-problem scores for a graded `section` of
+    the course's grading structure, replacing any previously persisted ones.
+    """
+    subsection_grade, _ = StudentSubsectionGrade.objects.get_or_create(
+        student=student,
+        course_id=course_key,
+        usage_key=section['location'],
+    )
+    subsection_grade.structure_hash = section['structure_hash']
+    subsection_grade.set_scores(problem_scores)
+    subsection_grade.save()
+    SubsectionStructureProblem.add_problems(
+        section['structure_hash'], [score['usage_key'] for score in problem_scores]
+    )
+
+
 @transaction.commit_manually
-def grade(student, request, course, keep_raw_scores=False):
+def grade(student, request, course, keep_raw_scores=False, student_module_scores=None):
     """
     Wraps "_grade" with the manual_transaction context manager just in case
     there are unanticipated errors.
     """
     with manual_transaction():
-        return _grade(student, request, course, keep_raw_scores)
+        return _grade(student, request, course, keep_raw_scores, student_module_scores)
 
 
-def _grade(student, request, course, keep_raw_scores):
+def _grade(student, request, course, keep_raw_scores, student_module_scores=None):
     """
     Unwrapped version of "grade"
 
@@ -169,9 +251,13 @@ def _grade(student, request, course, keep_raw_scores):
     - keep_raw_scores : if True, then value for key 'raw_scores' contains scores
       for every graded module
 
+    student_module_scores is an optional dict of the student's StudentModule
+    scores, as returned by `get_student_module_scores`. If it isn't given, it
+    is fetched here in a single query.
+
     More information on the format is in the docstring for CourseGrader.
     """
-    grading_context = course.grading_context
+    structure = grading_structure(course)
     raw_scores = []
 
     # Dict of item_ids -> (earned, possible) point tuples. This *only* grabs
@@ -181,20 +267,25 @@ def _grade(student, request, course, keep_raw_scores):
         course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id)
     )
 
+    persisted_grades = get_persisted_subsection_grades(student, course.id)
+
+    if student_module_scores is None:
+        with manual_transaction():
+            student_module_scores = get_student_module_scores(course.id, [student]).get(student.id, {})
+
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
-    for section_format, sections in grading_context['graded_sections'].iteritems():
+    for section_format, sections in structure['graded_sections'].iteritems():
         format_scores = []
         for section in sections:
-            section_descriptor = section['section_descriptor']
-            section_name = section_descriptor.display_name_with_default
+            section_name = section['display_name']
 
             # some problems have state that is updated independently of interaction
             # with the LMS, so they need to always be scored. (E.g. foldit.,
             # combinedopenended)
             should_grade_section = any(
-                descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']
+                problem['always_recalculate_grades'] for problem in section['problems']
             )
 
             # If there are no problems that always have to be regraded, check to
@@ -202,65 +293,91 @@ def _grade(student, request, course, keep_raw_scores):
             # API. If scores exist, we have to calculate grades for this section.
             if not should_grade_section:
                 should_grade_section = any(
-                    descriptor.location.to_deprecated_string() in submissions_scores
-                    for descriptor in section['xmoduledescriptors']
+                    problem['url'] in submissions_scores for problem in section['problems']
                 )
 
-            if not should_grade_section:
-                with manual_transaction():
-                    should_grade_section = StudentModule.objects.filter(
-                        student=student,
-                        module_state_key__in=[
-                            descriptor.location for descriptor in section['xmoduledescriptors']
-                        ]
-                    ).exists()
-
-            # If we haven't seen a single problem in the section, we don't have
-            # to grade it at all! We can assume 0%
-            if should_grade_section:
-                scores = []
-
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
-                    with manual_transaction():
-                        field_data_cache = FieldDataCache([descriptor], course.id, student)
-                    return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
-
-                    (correct, total) = get_score(
-                        course.id, student, module_descriptor, create_module, scores_cache=submissions_scores
+            # Sections whose scores come from outside the StudentModule table
+            # are always recomputed; everything else may be read back from the
+            # persisted subsection grades.
+            can_persist = persisted_grades is not None and not should_grade_section
+            persisted_scores = None
+            if can_persist:
+                persisted_scores = _fresh_persisted_scores(persisted_grades, section)
+
+            if persisted_scores is not None:
+                scores = [
+                    Score(
+                        score['earned'],
+                        score['possible'],
+                        score['graded'] and score['possible'] > 0,
+                        score['display_name'],
                     )
-                    if correct is None and total is None:
-                        continue
-
-                    if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
-                        if total > 1:
-                            correct = random.randrange(max(total - 2, 1), total + 1)
-                        else:
-                            correct = total
-
-                    graded = module_descriptor.graded
-                    if not total > 0:
-                        #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
-                        graded = False
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
-
+                    for score in persisted_scores if score['possible'] is not None
+                ]
                 _, graded_total = graders.aggregate_scores(scores, section_name)
                 if keep_raw_scores:
                     raw_scores += scores
             else:
-                graded_total = Score(0.0, 1.0, True, section_name)
+                if not should_grade_section:
+                    should_grade_section = any(
+                        problem['location'] in student_module_scores for problem in section['problems']
+                    )
+
+                # If we haven't seen a single problem in the section, we don't have
+                # to grade it at all! We can assume 0%
+                if should_grade_section:
+                    section_descriptor = course.runtime.get_block(section['location'])
+                    scores = []
+                    problem_scores = []
+
+                    def create_module(descriptor):
+                        '''creates an XModule instance given a descriptor'''
+                        # TODO: We need the request to pass into here. If we could forego that, our arguments
+                        # would be simpler
+                        with manual_transaction():
+                            field_data_cache = FieldDataCache([descriptor], course.id, student)
+                        return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
+
+                    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+
+                        (correct, total) = get_score(
+                            course.id, student, module_descriptor, create_module, scores_cache=submissions_scores,
+                            student_module_scores=student_module_scores
+                        )
+                        if module_descriptor.has_score:
+                            problem_scores.append(_problem_score_entry(module_descriptor, correct, total))
+                        if correct is None and total is None:
+                            continue
+
+                        if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
+                            if total > 1:
+                                correct = random.randrange(max(total - 2, 1), total + 1)
+                            else:
+                                correct = total
+
+                        graded = module_descriptor.graded
+                        if not total > 0:
+                            #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
+                            graded = False
+
+                        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+                    if can_persist:
+                        with manual_transaction():
+                            persist_subsection_grade(student, course.id, section, problem_scores)
+
+                    _, graded_total = graders.aggregate_scores(scores, section_name)
+                    if keep_raw_scores:
+                        raw_scores += scores
+                else:
+                    graded_total = Score(0.0, 1.0, True, section_name)
 
             #Add the graded total to totaled_scores
             if graded_total.possible > 0:
                 format_scores.append(graded_total)
             else:
                 log.info("Unable to grade a section with a total possible score of zero. " +
-                              str(section_descriptor.location))
+                              str(section['location']))
 
         totaled_scores[section_format] = format_scores
 
@@ -348,6 +465,17 @@ def _progress_summary(student, request, course):
 
     submissions_scores = sub_api.get_scores(course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id))
 
+    student_module_scores = get_student_module_scores(course.id, [student]).get(student.id, {})
+
+    persisted_grades = get_persisted_subsection_grades(student, course.id)
+    graded_sections = {}
+    if persisted_grades is not None:
+        graded_sections = {
+            section['location']: section
+            for sections in grading_structure(course)['graded_sections'].itervalues()
+            for section in sections
+        }
+
     chapters = []
     # Don't include chapters that aren't displayable (e.g. due to error)
     for chapter_module in course_module.get_display_items():
@@ -366,17 +494,38 @@ def _progress_summary(student, request, course):
                 graded = section_module.graded
                 scores = []
 
-                module_creator = section_module.xmodule_runtime.get_module
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_module, module_creator):
-                    course_id = course.id
-                    (correct, total) = get_score(
-                        course_id, student, module_descriptor, module_creator, scores_cache=submissions_scores
-                    )
-                    if correct is None and total is None:
-                        continue
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+                # Only graded sections without externally scored problems are persisted
+                section = graded_sections.get(section_module.location)
+                can_persist = section is not None and not any(
+                    problem['always_recalculate_grades'] or problem['url'] in submissions_scores
+                    for problem in section['problems']
+                )
+                persisted_scores = _fresh_persisted_scores(persisted_grades, section) if can_persist else None
+
+                if persisted_scores is not None:
+                    scores = [
+                        Score(score['earned'], score['possible'], graded, score['display_name'])
+                        for score in persisted_scores if score['possible'] is not None
+                    ]
+                else:
+                    problem_scores = []
+                    module_creator = section_module.xmodule_runtime.get_module
+
+                    for module_descriptor in yield_dynamic_descriptor_descendents(section_module, module_creator):
+                        course_id = course.id
+                        (correct, total) = get_score(
+                            course_id, student, module_descriptor, module_creator, scores_cache=submissions_scores,
+                            student_module_scores=student_module_scores
+                        )
+                        if module_descriptor.has_score:
+                            problem_scores.append(_problem_score_entry(module_descriptor, correct, total))
+                        if correct is None and total is None:
+                            continue
+
+                        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+                    if can_persist:
+                        persist_subsection_grade(student, course.id, section, problem_scores)
 
                 scores.reverse()
                 section_total, _ = graders.aggregate_scores(
@@ -403,7 +552,30 @@ def _progress_summary(student, request, course):
     return chapters
 
 
-def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None):
+def get_student_module_scores(course_key, students, chunk_size=500):
+    """
+    Fetch the StudentModule scores of every student in `students` for the course
+    with as few queries as possible: one query per `chunk_size` students,
+    regardless of the number of problems in the course.
+
+    Returns a dict mapping student id to a dict of
+    {usage_key: (grade, max_grade)}, with an entry for every StudentModule the
+    student has in the course. Anonymous students are skipped.
+    """
+    student_ids = [student.id for student in students if student.is_authenticated()]
+    scores = dict((student_id, {}) for student_id in student_ids)
+    for student_ids_chunk in chunks(student_ids, chunk_size):
+        student_modules = StudentModule.objects.filter(
+            course_id=course_key,
+            student__in=student_ids_chunk,
+        ).only('student', 'module_state_key', 'grade', 'max_grade')
+        for student_module in student_modules:
+            usage_key = student_module.module_state_key.map_into_course(course_key)
+            scores[student_module.student_id][usage_key] = (student_module.grade, student_module.max_grade)
+    return scores
+
+
+def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None, student_module_scores=None):
     """
     Return the score for a user on a problem, as a tuple (correct, total).
     e.g. (5,7) if you got 5 out of 7 points.
@@ -417,6 +589,10 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
            Can return None if user doesn't have access, or if something else went wrong.
     scores_cache: A dict of location names to (earned, possible) point tuples.
            If an entry is found in this cache, it takes precedence.
+    student_module_scores: A dict of usage keys to (grade, max_grade) tuples for
+           every StudentModule of the user in the course, as returned by
+           `get_student_module_scores`. If given, it is used instead of
+           querying the StudentModule table.
     """
     scores_cache = scores_cache or {}
 
@@ -443,18 +619,22 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
         # These are not problems, and do not have a score
         return (None, None)
 
-    try:
-        student_module = StudentModule.objects.get(
-            student=user,
-            course_id=course_id,
-            module_state_key=problem_descriptor.location
-        )
-    except StudentModule.DoesNotExist:
-        student_module = None
+    if student_module_scores is not None:
+        student_module_score = student_module_scores.get(problem_descriptor.location)
+    else:
+        try:
+            student_module = StudentModule.objects.get(
+                student=user,
+                course_id=course_id,
+                module_state_key=problem_descriptor.location
+            )
+            student_module_score = (student_module.grade, student_module.max_grade)
+        except StudentModule.DoesNotExist:
+            student_module_score = None
 
-    if student_module is not None and student_module.max_grade is not None:
-        correct = student_module.grade if student_module.grade is not None else 0
-        total = student_module.max_grade
+    if student_module_score is not None and student_module_score[1] is not None:
+        correct = student_module_score[0] if student_module_score[0] is not None else 0
+        total = student_module_score[1]
     else:
         # If the problem was not in the cache, or hasn't been graded yet,
         # we need to instantiate the problem.
@@ -475,7 +655,7 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
     weight = problem_descriptor.weight
     if weight is not None:
         if total == 0:
-            log.exception("Cannot reweight a problem with zero total points. Problem: " + str(student_module))
+            log.exception("Cannot reweight a problem with zero total points. Problem: " + str(problem_descriptor.location))
             return (correct, total)
         correct = correct * weight / total
         total = weight
@@ -521,25 +701,37 @@ def iterate_grades_for(course_id, students):
     # grading that student.
     request = RequestFactory().get('/')
 
-    for student in students:
-        with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course_id)]):
-            try:
-                request.user = student
-                # Grading calls problem rendering, which calls masquerading,
-                # which checks session vars -- thus the empty session dict below.
-                # It's not pretty, but untangling that is currently beyond the
-                # scope of this feature.
-                request.session = {}
-                gradeset = grade(student, request, course)
-                yield student, gradeset, ""
-            except Exception as exc:  # pylint: disable=broad-except
-                # Keep marching on even if this student couldn't be graded for
-                # some reason, but log it for future reference.
-                log.exception(
-                    'Cannot grade student %s (%s) in course %s because of exception: %s',
-                    student.username,
-                    student.id,
-                    course_id,
-                    exc.message
-                )
-                yield student, {}, exc.message
+    students = iter(students)
+    while True:
+        # Fetch the StudentModule scores for a whole batch of students at once,
+        # rather than querying per student and problem while grading.
+        student_batch = list(islice(students, STUDENT_MODULE_PREFETCH_BATCH_SIZE))
+        if not student_batch:
+            break
+        with manual_transaction():
+            batch_scores = get_student_module_scores(course_id, student_batch)
+
+        for student in student_batch:
+            with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course_id)]):
+                try:
+                    request.user = student
+                    # Grading calls problem rendering, which calls masquerading,
+                    # which checks session vars -- thus the empty session dict below.
+                    # It's not pretty, but untangling that is currently beyond the
+                    # scope of this feature.
+                    request.session = {}
+                    gradeset = grade(
+                        student, request, course, student_module_scores=batch_scores.get(student.id, {})
+                    )
+                    yield student, gradeset, ""
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Keep marching on even if this student couldn't be graded for
+                    # some reason, but log it for future reference.
+                    log.exception(
+                        'Cannot grade student %s (%s) in course %s because of exception: %s',
+                        student.username,
+                        student.id,
+                        course_id,
+                        exc.message
+                    )
+                    yield student, {}, exc.message
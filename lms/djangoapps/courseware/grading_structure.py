@@ -0,0 +1,213 @@
+"""
+The graded structure of a course, as plain data.
+
+`CourseDescriptor.grading_context` walks the whole course tree, and is
+recomputed every time a course descriptor is freshly loaded, i.e. on most
+grade computations. `grading_structure` extracts what grading needs from it
+(the graded sections, the scorable problems in each, and their weights and
+formats) into serializable data. When the CACHE_GRADING_STRUCTURE feature is
+enabled, that data is cached across requests, keyed by the version of the
+course's content, so that grading doesn't walk the course tree.
+
+The structure returned looks like::
+
+    {
+        'graded_sections': {
+            <section format>: [
+                {
+                    'location': <section usage key>,
+                    'display_name': u'...',
+                    'has_dynamic_children': <whether any block in the section has dynamic children>,
+                    'structure_hash': <see `section_structure_hash`>,
+                    'problems': [
+                        {
+                            'location': <problem usage key>,
+                            'url': <problem usage key, as a deprecated string>,
+                            'display_name': u'...',
+                            'weight': <weight, or None>,
+                            'content_hash': <see `problem_content_hash`>,
+                            'graded': <graded flag>,
+                            'always_recalculate_grades': <whether it must always be rescored>,
+                        },
+                        ...
+                    ],
+                },
+                ...
+            ],
+        },
+    }
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from opaque_keys.edx.keys import UsageKey
+from xblock.fields import Scope
+
+log = logging.getLogger("edx.courseware")
+
+GRADING_STRUCTURE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def course_content_version(course):
+    """
+    Returns a string identifying the version of the content of `course`, or
+    None if its modulestore doesn't version content (e.g. XML courses).
+
+    Split courses are identified by the version of their structure. Mongo
+    courses are identified by the time their subtree was last edited, which
+    the modulestore updates on every edit, or at the end of the bulk
+    operation that made it.
+    """
+    version_guid = getattr(course.id, 'version_guid', None)
+    if version_guid is None:
+        # The mixed modulestore strips versions from the keys it returns
+        course_entry = getattr(course.runtime, 'course_entry', None)
+        if course_entry is not None:
+            version_guid = course_entry.get('structure', {}).get('_id')
+    if version_guid is not None:
+        return unicode(version_guid)
+
+    get_subtree_edited_on = getattr(course.runtime, 'get_subtree_edited_on', None)
+    if get_subtree_edited_on is None:
+        return None
+    try:
+        edited_on = get_subtree_edited_on(course)
+    except AttributeError:
+        # blocks created before edit info was recorded
+        return None
+    return edited_on.isoformat() if edited_on is not None else None
+
+
+def grading_structure_cache_key(course_id, version):
+    """
+    Returns the key under which the grading structure of `version` of the course is cached.
+    """
+    return u"courseware.grading_structure.{}.{}".format(course_id, version)
+
+
+def problem_content_hash(descriptor):
+    """
+    Returns a hash of the content fields of the problem `descriptor`, which
+    determine its unweighted maximum score (e.g. the responses of a capa
+    problem).
+    """
+    content = json.dumps(descriptor.get_explicitly_set_fields_by_scope(Scope.content), sort_keys=True)
+    return hashlib.sha1(content).hexdigest()
+
+
+def section_structure_hash(problems):
+    """
+    Returns a hash of the scorable structure of a graded section: the
+    locations, display names, weights, graded flags and content of every
+    problem that can contribute to its score. Any content change that can
+    affect the section's grade, or the scores persisted for it, changes the
+    hash.
+    """
+    structure = u"|".join(
+        u"{}:{}:{}:{}:{}".format(
+            problem['url'], problem['display_name'], problem['weight'], problem['graded'], problem['content_hash']
+        )
+        for problem in problems
+    )
+    return hashlib.sha1(structure.encode('utf-8')).hexdigest()
+
+
+def _has_dynamic_children(descriptor):
+    """
+    Returns whether any descriptor in the subtree of `descriptor` has
+    children that depend on the student.
+    """
+    stack = [descriptor]
+    while stack:
+        next_descriptor = stack.pop()
+        if next_descriptor.has_dynamic_children():
+            return True
+        stack.extend(next_descriptor.get_children())
+    return False
+
+
+def build_grading_structure(course):
+    """
+    Returns the serializable grading structure of `course`, computed from its
+    `grading_context`. Usage keys are serialized as strings.
+    """
+    graded_sections = {}
+    for section_format, sections in course.grading_context['graded_sections'].iteritems():
+        section_structures = graded_sections.setdefault(section_format, [])
+        for section in sections:
+            section_descriptor = section['section_descriptor']
+            problems = [
+                {
+                    'location': unicode(descriptor.location),
+                    'url': descriptor.location.to_deprecated_string(),
+                    'display_name': descriptor.display_name_with_default,
+                    'weight': descriptor.weight,
+                    'content_hash': problem_content_hash(descriptor),
+                    'graded': descriptor.graded,
+                    'always_recalculate_grades': bool(descriptor.always_recalculate_grades),
+                }
+                for descriptor in section['xmoduledescriptors']
+            ]
+            section_structures.append({
+                'location': unicode(section_descriptor.location),
+                'display_name': section_descriptor.display_name_with_default,
+                'has_dynamic_children': _has_dynamic_children(section_descriptor),
+                'structure_hash': section_structure_hash(problems),
+                'problems': problems,
+            })
+    return {'graded_sections': graded_sections}
+
+
+def _load_usage_keys(course, structure):
+    """
+    Returns a copy of the serialized `structure` of `course` with its
+    locations parsed back into usage keys of the course.
+    """
+    def usage_key(serialized):
+        """Parses a serialized usage key, in the version of the course that was loaded."""
+        return UsageKey.from_string(serialized).map_into_course(course.id)
+
+    graded_sections = {}
+    for section_format, sections in structure['graded_sections'].iteritems():
+        graded_sections[section_format] = [
+            dict(
+                section,
+                location=usage_key(section['location']),
+                problems=[
+                    dict(problem, location=usage_key(problem['location']))
+                    for problem in section['problems']
+                ],
+            )
+            for section in sections
+        ]
+    return {'graded_sections': graded_sections}
+
+
+def grading_structure(course):
+    """
+    Returns the grading structure of `course` (see the module docstring),
+    which is computed once per course descriptor, and, if the
+    CACHE_GRADING_STRUCTURE feature is enabled, once per version of the
+    course's content.
+    """
+    if getattr(course, '_grading_structure', None) is not None:
+        return course._grading_structure  # pylint: disable=protected-access
+
+    structure = None
+    cache_key = None
+    if settings.FEATURES.get('CACHE_GRADING_STRUCTURE', False):
+        version = course_content_version(course)
+        if version is not None:
+            cache_key = grading_structure_cache_key(course.id, version)
+            structure = cache.get(cache_key)
+
+    if structure is None:
+        structure = build_grading_structure(course)
+        if cache_key is not None:
+            cache.set(cache_key, structure, GRADING_STRUCTURE_CACHE_TIMEOUT)
+
+    course._grading_structure = _load_usage_keys(course, structure)  # pylint: disable=protected-access
+    return course._grading_structure  # pylint: disable=protected-access
@@ -60,12 +60,18 @@ class FieldDataCache(object):
         select_for_update: True if rows should be locked until end of transaction
         '''
         self.cache = {}
+        # Maps id(StudentModule) to (StudentModule, state string, decoded state)
+        self._user_states = {}
+        # The ids of the StudentModules whose decoded state has unserialized changes
+        self._dirty_user_states = set()
         self.descriptors = descriptors
         self.select_for_update = select_for_update
 
         assert isinstance(course_id, CourseKey)
         self.course_id = course_id
         self.user = user
+        # The ModuleSystemContexts of the module systems built on this cache (see courseware.module_render)
+        self.module_system_contexts = {}
 
         if user.is_authenticated():
             for scope, fields in self._fields_to_cache().items():
@@ -272,6 +278,42 @@ class FieldDataCache(object):
         self.cache[cache_key] = field_object
         return field_object
 
+    def user_state(self, student_module):
+        """
+        Returns the decoded state of `student_module`, as a dict of field
+        names to values. The state is decoded once, and then shared by all the
+        fields of the module, until its `state` is replaced. Callers that
+        modify the dict must call `mark_user_state_dirty`.
+        """
+        entry = self._user_states.get(id(student_module))
+        if entry is not None and entry[0] is student_module and entry[1] is student_module.state:
+            return entry[2]
+
+        state = json.loads(student_module.state)
+        self._user_states[id(student_module)] = (student_module, student_module.state, state)
+        self._dirty_user_states.discard(id(student_module))
+        return state
+
+    def mark_user_state_dirty(self, student_module):
+        """
+        Records that the decoded state of `student_module` was modified, and
+        needs to be serialized by `serialize_user_state` before it's saved.
+        """
+        self._dirty_user_states.add(id(student_module))
+
+    def serialize_user_state(self, student_module):
+        """
+        Serializes the modified decoded state of `student_module` into its
+        `state`, so that it can be saved.
+        """
+        if id(student_module) not in self._dirty_user_states:
+            return
+
+        __, __, state = self._user_states[id(student_module)]
+        student_module.state = json.dumps(state)
+        self._user_states[id(student_module)] = (student_module, student_module.state, state)
+        self._dirty_user_states.discard(id(student_module))
+
 
 class DjangoKeyValueStore(KeyValueStore):
     """
@@ -310,7 +352,9 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            # Values are handed out without copying: mutable values are only
+            # written back to the StudentModule when the field is set
+            return self._field_data_cache.user_state(field_object)[key.field_name]
         else:
             return json.loads(field_object.value)
 
@@ -345,15 +389,17 @@ class DjangoKeyValueStore(KeyValueStore):
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
             if field.scope == Scope.user_state:
-                state = json.loads(field_object.state)
-                state[field.field_name] = kv_dict[field]
-                field_object.state = json.dumps(state)
+                self._field_data_cache.user_state(field_object)[field.field_name] = kv_dict[field]
+                self._field_data_cache.mark_user_state_dirty(field_object)
             else:
             # The remaining scopes save fields on different rows, so
             # we don't have to worry about conflicts
                 field_object.value = json.dumps(kv_dict[field])
 
         for field_object in field_objects:
+            if isinstance(field_object, StudentModule):
+                # Serialize the user state once, however many of its fields were set
+                self._field_data_cache.serialize_user_state(field_object)
             try:
                 # Save the field object that we made above
                 field_object.save()
@@ -373,9 +419,10 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
+            state = self._field_data_cache.user_state(field_object)
             del state[key.field_name]
-            field_object.state = json.dumps(state)
+            self._field_data_cache.mark_user_state_dirty(field_object)
+            self._field_data_cache.serialize_user_state(field_object)
             field_object.save()
         else:
             field_object.delete()
@@ -389,6 +436,6 @@ class DjangoKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in self._field_data_cache.user_state(field_object)
         else:
             return True
@@ -12,10 +12,12 @@ file and check it in at the same time as your model changes. To do that,
 ASSUMPTIONS: modules have unique IDs, even across different module_types
 
 """
+import json
+
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from xmodule_django.models import CourseKeyField, LocationKeyField
@@ -129,6 +131,148 @@ class StudentModuleHistory(models.Model):
             history_entry.save()
 
 
+class StudentSubsectionGrade(models.Model):
+    """
+    Persisted per-problem scores for one graded subsection of a course, for a
+    single student.
+
+    Rows are written by `courseware.grades` the first time a subsection is
+    scored and are then kept up to date incrementally as scores are published,
+    so that later grade computations only need to rescore subsections whose
+    inputs have changed.
+    """
+    class Meta:
+        unique_together = (('student', 'course_id', 'usage_key'),)
+
+    student = models.ForeignKey(User, db_index=True)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+
+    # The location of the subsection (sequential) these scores belong to
+    usage_key = LocationKeyField(max_length=255, db_index=True)
+
+    # Hash of the scorable structure of the subsection at the time the scores
+    # were computed. A mismatch means the course content has changed.
+    structure_hash = models.CharField(max_length=40)
+
+    # JSON list of per-problem scores, each of the form
+    # {"usage_key": ..., "earned": ..., "possible": ..., "graded": ..., "display_name": ...}
+    scores = models.TextField(default='[]')
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    @classmethod
+    def update_problem_score(cls, student_id, course_id, problem_key, earned, possible, weight=None):
+        """
+        Update the persisted score of the problem at `problem_key` for the given
+        student, in every persisted subsection that contains it. Only the
+        subsection rows whose structure is recorded as containing the problem
+        in `SubsectionStructureProblem` are loaded.
+
+        `earned` and `possible` are raw (unweighted) points, as stored on the
+        StudentModule; the problem `weight` is applied here the same way
+        `courseware.grades.get_score` applies it.
+
+        Returns the number of subsection rows that were updated.
+        """
+        earned = earned if earned is not None else 0
+        if weight is not None and possible:
+            earned = float(earned) * weight / possible
+            possible = weight
+
+        problem_key = problem_key.to_deprecated_string()
+        subsection_grades = cls.objects.filter(
+            student_id=student_id,
+            course_id=course_id,
+            structure_hash__in=SubsectionStructureProblem.objects.filter(
+                problem_key=problem_key
+            ).values('structure_hash'),
+        )
+        updated = 0
+        for subsection_grade in subsection_grades:
+            scores = subsection_grade.get_scores()
+            changed = False
+            for score in scores:
+                if score['usage_key'] == problem_key:
+                    score['earned'] = earned
+                    score['possible'] = possible
+                    changed = True
+            if changed:
+                subsection_grade.set_scores(scores)
+                subsection_grade.save()
+                updated += 1
+        return updated
+
+    def get_scores(self):
+        """
+        Return the decoded list of per-problem score dicts.
+        """
+        return json.loads(self.scores) if self.scores else []
+
+    def set_scores(self, scores):
+        """
+        Encode and store the list of per-problem score dicts.
+        """
+        self.scores = json.dumps(scores)
+
+    @receiver(post_delete, sender=StudentModule)
+    def invalidate_for_deleted_state(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Discards all persisted subsection grades for a student in a course
+        when any of their StudentModule rows is deleted (e.g. a problem
+        state reset), since the affected scores can no longer be updated
+        incrementally.
+        """
+        StudentSubsectionGrade.objects.filter(
+            student_id=instance.student_id,
+            course_id=instance.course_id,
+        ).delete()
+
+    def __repr__(self):
+        return 'StudentSubsectionGrade<%r>' % ({
+            'course_id': self.course_id,
+            'student': self.student_id,
+            'usage_key': self.usage_key,
+            'structure_hash': self.structure_hash,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
+
+class SubsectionStructureProblem(models.Model):
+    """
+    Maps the structure hash of a graded subsection to the problems whose
+    scores are persisted for it, so that a published score only has to load
+    the `StudentSubsectionGrade` rows that actually contain the problem.
+
+    Rows are shared by every student whose subsection grade was computed
+    against the same structure, and are only ever added to.
+    """
+    class Meta:
+        unique_together = (('structure_hash', 'problem_key'),)
+
+    structure_hash = models.CharField(max_length=40, db_index=True)
+
+    # Deprecated string form of the problem's usage key, as stored in
+    # `StudentSubsectionGrade.scores`
+    problem_key = models.CharField(max_length=255, db_index=True)
+
+    @classmethod
+    def add_problems(cls, structure_hash, problem_keys):
+        """
+        Records that the subsection with `structure_hash` contains the
+        problems in `problem_keys` (deprecated usage key strings).
+        """
+        missing = set(problem_keys) - set(
+            cls.objects.filter(structure_hash=structure_hash).values_list('problem_key', flat=True)
+        )
+        # Only the first grade computed against a structure has anything to
+        # add; get_or_create tolerates a concurrent process adding it too
+        for problem_key in missing:
+            cls.objects.get_or_create(structure_hash=structure_hash, problem_key=problem_key)
+
+
 class XModuleUserStateSummaryField(models.Model):
     """
     Stores data set in the Scope.user_state_summary scope by an xmodule field
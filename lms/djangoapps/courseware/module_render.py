@@ -6,6 +6,7 @@ import static_replace
 import xblock.reference.plugins
 
 from functools import partial
+from lazy import lazy
 from requests.auth import HTTPBasicAuth
 from dogapi import dog_stats_api
 from opaque_keys import InvalidKeyError
@@ -21,6 +22,7 @@ from capa.xqueue_interface import XQueueInterface
 from courseware.access import has_access, get_user_role
 from courseware.masquerade import setup_masquerade
 from courseware.model_data import FieldDataCache, DjangoKeyValueStore
+from courseware.models import StudentSubsectionGrade
 from lms.lib.xblock.field_data import LmsFieldData
 from lms.lib.xblock.runtime import LmsModuleSystem, unquote_slashes, quote_slashes
 from edxmako.shortcuts import render_to_string
@@ -40,9 +42,7 @@ from xmodule.modulestore.django import modulestore, ModuleI18nService
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
 from xmodule_modifiers import (
-    replace_course_urls,
-    replace_jump_to_id_urls,
-    replace_static_urls,
+    rewrite_urls,
     add_staff_markup,
     wrap_xblock,
     request_token
@@ -243,6 +243,96 @@ def get_module_for_descriptor(user, request, descriptor, field_data_cache, cours
     )
 
 
+class ModuleSystemContext(object):
+    """
+    The parts of the module systems for a user in a course that are the same
+    for every block rendered in a request, computed the first time they're needed.
+
+    `uses` counts the module systems built with this context.
+    """
+    def __init__(self, user, course_id, request_token):
+        self.user = user
+        self.course_id = course_id
+        self.request_token = request_token
+        self.uses = 0
+        self._anonymous_student_ids = {}
+
+    @lazy
+    def jump_to_id_base_url(self):
+        """
+        The url of jump_to_id for the course, with an empty module_id
+        """
+        return reverse('jump_to_id', kwargs={'course_id': self.course_id.to_deprecated_string(), 'module_id': ''})
+
+    @lazy
+    def user_is_staff(self):
+        """
+        Whether the user has staff access to the course
+        """
+        return has_access(self.user, u'staff', self.course_id)
+
+    @lazy
+    def user_is_instructor(self):
+        """
+        Whether the user has instructor access to the course
+        """
+        return has_access(self.user, u'instructor', self.course_id)
+
+    @lazy
+    def user_is_admin(self):
+        """
+        Whether the user is global staff
+        """
+        return has_access(self.user, u'staff', 'global')
+
+    def anonymous_student_id(self, course_specific):
+        """
+        The anonymous id of the user, either specific to the course or the same for all courses
+        """
+        if course_specific not in self._anonymous_student_ids:
+            self._anonymous_student_ids[course_specific] = anonymous_id_for_user(
+                self.user, self.course_id if course_specific else None
+            )
+        return self._anonymous_student_ids[course_specific]
+
+    @lazy
+    def wrap_xblock_wrapper(self):
+        """
+        The block wrapper which wraps the output display in a single div
+        """
+        return partial(
+            wrap_xblock,
+            'LmsRuntime',
+            extra_data={'course-id': self.course_id.to_deprecated_string()},
+            usage_id_serializer=lambda usage_id: quote_slashes(usage_id.to_deprecated_string()),
+            request_token=self.request_token,
+        )
+
+    @lazy
+    def staff_markup_wrapper(self):
+        """
+        The block wrapper which adds the staff debug info
+        """
+        return partial(add_staff_markup, self.user, self.user_is_instructor)
+
+
+def get_module_system_context(user, field_data_cache, course_id, request_token):
+    """
+    Returns the ModuleSystemContext for user in course_id for the request with request_token.
+
+    Contexts are kept on the field_data_cache, which holds the state of the user in the course
+    for the request.
+    """
+    contexts = getattr(field_data_cache, 'module_system_contexts', None)
+    if not isinstance(contexts, dict):
+        return ModuleSystemContext(user, course_id, request_token)
+
+    key = (user.id, course_id, request_token)
+    if key not in contexts:
+        contexts[key] = ModuleSystemContext(user, course_id, request_token)
+    return contexts[key]
+
+
 def get_module_system_for_user(user, field_data_cache,
                                # Arguments preceding this comment have user binding, those following don't
                                descriptor, course_id, track_function, xqueue_callback_url_prefix,
@@ -268,6 +358,8 @@ def get_module_system_for_user(user, field_data_cache,
         (LmsModuleSystem, KvsFieldData):  (module system, student_data) bound to, primarily, the user and descriptor
     """
     student_data = KvsFieldData(DjangoKeyValueStore(field_data_cache))
+    context = get_module_system_context(user, field_data_cache, course_id, request_token)
+    context.uses += 1
 
     def make_xqueue_callback(dispatch='score_update'):
         # Fully qualified callback URL for external queueing system
@@ -360,6 +452,18 @@ def get_module_system_for_user(user, field_data_cache,
         # Save all changes to the underlying KeyValueStore
         student_module.save()
 
+        # Keep any persisted subsection grades containing this problem current,
+        # so that the next grade computation doesn't have to rescore them.
+        if settings.FEATURES.get('ENABLE_PERSISTENT_SUBSECTION_GRADES'):
+            StudentSubsectionGrade.update_problem_score(
+                user_id,
+                course_id,
+                descriptor.location,
+                student_module.grade,
+                student_module.max_grade,
+                weight=descriptor.weight,
+            )
+
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
 
@@ -440,45 +544,28 @@ def get_module_system_for_user(user, field_data_cache,
     # Wrap the output display in a single div to allow for the XModule
     # javascript to be bound correctly
     if wrap_xmodule_display is True:
-        block_wrappers.append(partial(
-            wrap_xblock,
-            'LmsRuntime',
-            extra_data={'course-id': course_id.to_deprecated_string()},
-            usage_id_serializer=lambda usage_id: quote_slashes(usage_id.to_deprecated_string()),
-            request_token=request_token,
-        ))
+        block_wrappers.append(context.wrap_xblock_wrapper)
 
     # TODO (cpennington): When modules are shared between courses, the static
     # prefix is going to have to be specific to the module, not the directory
     # that the xml was loaded from
 
-    # Rewrite urls beginning in /static to point to course-specific content
-    block_wrappers.append(partial(
-        replace_static_urls,
+    # Rewrite urls beginning in /static to point to course-specific content,
+    # allow URLs of the form '/course/' refer to the root of multicourse directory
+    # hierarchy of this course, and rewrite intra-courseware links (/jump_to_id/<id>).
+    # The /jump_to_id/ format is an improvement over the /course/... format for
+    # studio authored courses, because it is agnostic to course-hierarchy.
+    url_rewriter = static_replace.get_url_rewriter(
         getattr(descriptor, 'data_dir', None),
-        course_id=course_id,
-        static_asset_path=static_asset_path or descriptor.static_asset_path
-    ))
-
-    # Allow URLs of the form '/course/' refer to the root of multicourse directory
-    #   hierarchy of this course
-    block_wrappers.append(partial(replace_course_urls, course_id))
-
-    # this will rewrite intra-courseware links (/jump_to_id/<id>). This format
-    # is an improvement over the /course/... format for studio authored courses,
-    # because it is agnostic to course-hierarchy.
-    # NOTE: module_id is empty string here. The 'module_id' will get assigned in the replacement
-    # function, we just need to specify something to get the reverse() to work.
-    block_wrappers.append(partial(
-        replace_jump_to_id_urls,
         course_id,
-        reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''}),
-    ))
+        static_asset_path=static_asset_path or descriptor.static_asset_path,
+        jump_to_id_base_url=context.jump_to_id_base_url
+    )
+    block_wrappers.append(partial(rewrite_urls, url_rewriter))
 
     if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF'):
-        if has_access(user, 'staff', descriptor, course_id):
-            has_instructor_access = has_access(user, 'instructor', descriptor, course_id)
-            block_wrappers.append(partial(add_staff_markup, user, has_instructor_access))
+        if context.user_is_staff:
+            block_wrappers.append(context.staff_markup_wrapper)
 
     # These modules store data using the anonymous_student_id as a key.
     # To prevent loss of data, we will continue to provide old modules with
@@ -489,10 +576,7 @@ def get_module_system_for_user(user, field_data_cache,
     is_pure_xblock = isinstance(descriptor, XBlock) and not isinstance(descriptor, XModuleDescriptor)
     module_class = getattr(descriptor, 'module_class', None)
     is_lti_module = not is_pure_xblock and issubclass(module_class, LTIModule)
-    if is_pure_xblock or is_lti_module:
-        anonymous_student_id = anonymous_id_for_user(user, course_id)
-    else:
-        anonymous_student_id = anonymous_id_for_user(user, None)
+    anonymous_student_id = context.anonymous_student_id(course_specific=is_pure_xblock or is_lti_module)
 
     system = LmsModuleSystem(
         track_function=track_function,
@@ -508,12 +592,7 @@ def get_module_system_for_user(user, field_data_cache,
         # TODO (cpennington): This should be removed when all html from
         # a module is coming through get_html and is therefore covered
         # by the replace_static_urls code below
-        replace_urls=partial(
-            static_replace.replace_static_urls,
-            data_directory=getattr(descriptor, 'data_dir', None),
-            course_id=course_id,
-            static_asset_path=static_asset_path or descriptor.static_asset_path,
-        ),
+        replace_urls=url_rewriter.replace_static_urls,
         replace_course_urls=partial(
             static_replace.replace_course_urls,
             course_key=course_id
@@ -521,7 +600,7 @@ def get_module_system_for_user(user, field_data_cache,
         replace_jump_to_id_urls=partial(
             static_replace.replace_jump_to_id_urls,
             course_id=course_id,
-            jump_to_id_base_url=reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''})
+            jump_to_id_base_url=context.jump_to_id_base_url
         ),
         node_path=settings.NODE_PATH,
         publish=publish,
@@ -561,11 +640,11 @@ def get_module_system_for_user(user, field_data_cache,
             make_psychometrics_data_update_handler(course_id, user, descriptor.location)
         )
 
-    system.set(u'user_is_staff', has_access(user, u'staff', descriptor.location, course_id))
-    system.set(u'user_is_admin', has_access(user, u'staff', 'global'))
+    system.set(u'user_is_staff', context.user_is_staff)
+    system.set(u'user_is_admin', context.user_is_admin)
 
     # make an ErrorDescriptor -- assuming that the descriptor's system is ok
-    if has_access(user, u'staff', descriptor.location, course_id):
+    if context.user_is_staff:
         system.error_descriptor_class = ErrorDescriptor
     else:
         system.error_descriptor_class = NonStaffErrorDescriptor
@@ -175,6 +175,47 @@ class TestStudentModuleStorage(OtherUserFailureTestMixin, TestCase):
                 self.kvs.set_many(kv_dict)
         self.assertEquals(len(exception_context.exception.saved_field_names), 0)
 
+    def test_state_decoded_once(self):
+        "Test that the state of a StudentModule is decoded once for all of its fields"
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as mock_loads:
+            self.assertEquals('a_value', self.kvs.get(user_state_key('a_field')))
+            self.assertEquals('b_value', self.kvs.get(user_state_key('b_field')))
+            self.assertTrue(self.kvs.has(user_state_key('a_field')))
+            self.assertFalse(self.kvs.has(user_state_key('not_a_field')))
+        self.assertEquals(1, mock_loads.call_count)
+
+    def test_set_many_serializes_once(self):
+        "Test that set_many serializes the state of a StudentModule once, however many fields are set"
+        kv_dict = self.construct_kv_dict()
+        with patch('courseware.model_data.json.dumps', wraps=json.dumps) as mock_dumps:
+            self.kvs.set_many(kv_dict)
+        self.assertEquals(1, mock_dumps.call_count)
+        self.assertEquals(
+            {'a_field': 'a_value', 'b_field': 'b_value', 'field_a': 'new value', 'field_b': 'newer value'},
+            json.loads(StudentModule.objects.all()[0].state)
+        )
+
+    def test_replaced_state_decoded_again(self):
+        "Test that replacing the state of a cached StudentModule is seen by the kvs"
+        self.assertEquals('a_value', self.kvs.get(user_state_key('a_field')))
+        student_module = self.field_data_cache.find(user_state_key('a_field'))
+        student_module.state = json.dumps({'a_field': 'replaced_value'})
+        self.assertEquals('replaced_value', self.kvs.get(user_state_key('a_field')))
+        self.assertFalse(self.kvs.has(user_state_key('b_field')))
+
+    def test_mutable_value_not_decoded_or_copied(self):
+        "Test that mutable values are read from the decoded state without decoding or copying them again"
+        self.kvs.set(user_state_key('list_field'), [1, 2])
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as mock_loads:
+            value = self.kvs.get(user_state_key('list_field'))
+            self.assertIs(value, self.kvs.get(user_state_key('list_field')))
+        self.assertEquals(0, mock_loads.call_count)
+
+        # Changes made in place are stored once the field is set
+        value.append(3)
+        self.kvs.set(user_state_key('list_field'), value)
+        self.assertEquals([1, 2, 3], json.loads(StudentModule.objects.all()[0].state)['list_field'])
+
 
 class TestMissingStudentModule(TestCase):
     def setUp(self):
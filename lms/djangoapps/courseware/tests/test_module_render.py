@@ -842,6 +842,34 @@ class TestAnonymousStudentId(ModuleStoreTestCase, LoginEnrollmentTestCase):
         )
 
 
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestModuleSystemContext(ModuleStoreTestCase):
+    """
+    Test that the module systems of the blocks rendered in a request share a ModuleSystemContext
+    """
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.request.session = {}
+        self.course = CourseFactory.create()
+        self.vertical = ItemFactory.create(category='vertical', parent_location=self.course.location)
+        for __ in range(3):
+            ItemFactory.create(category='html', parent_location=self.vertical.location)
+
+    def test_context_shared_by_children(self):
+        vertical = modulestore().get_item(self.vertical.location)
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(self.course.id, self.user, vertical)
+        module = render.get_module_for_descriptor(self.user, self.request, vertical, field_data_cache, self.course.id)
+        module.render(STUDENT_VIEW)
+
+        # the vertical and its 3 children were rendered with the same context
+        contexts = field_data_cache.module_system_contexts.values()
+        self.assertEqual(len(contexts), 1)
+        self.assertEqual(contexts[0].uses, 4)
+        self.assertEqual(module.xmodule_runtime.anonymous_student_id, anonymous_id_for_user(self.user, None))
+
+
 @override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
 @patch('track.views.tracker')
 class TestModuleTrackingContext(ModuleStoreTestCase):
@@ -11,13 +11,14 @@ from mock import patch
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test.client import RequestFactory
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 
 # Need access to internal func to put users in the right group
-from courseware import grades
-from courseware.models import StudentModule
+from courseware import grade_engine, grades
+from courseware.models import StudentModule, StudentSubsectionGrade
 
 #import factories and parent testcase modules
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
@@ -476,6 +477,48 @@ class TestCourseGrader(TestSubmittingProblems):
         self.check_grade_percent(0.67)
         self.assertEqual(self.get_grade_summary()['grade'], 'B')
 
+    def test_student_module_scores_prefetched(self):
+        """
+        Check that grading doesn't query StudentModule once per problem.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        with patch.object(StudentModule.objects, 'get') as mock_get:
+            self.check_grade_percent(0.33)
+            self.assertFalse(mock_get.called)
+
+    def test_get_student_module_scores(self):
+        """
+        Check the bulk StudentModule score map.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        other_user = UserFactory.create()
+        scores = grades.get_student_module_scores(self.course.id, [self.student_user, other_user])
+        self.assertEqual(scores[other_user.id], {})
+        self.assertEqual(scores[self.student_user.id][self.problem_location('p1')], (1.0, 1.0))
+        self.assertNotIn(self.problem_location('p2'), scores[self.student_user.id])
+
+    def test_grade_engine_matches_grade(self):
+        """
+        Check that grading students in bulk gives the same grades as grading
+        them one at a time.
+        """
+        self.dropping_setup()
+        self.dropping_homework_stage1()
+        other_user = UserFactory.create()
+        students = [self.student_user, other_user]
+
+        engine = grade_engine.CourseGradeEngine(self.course)
+        self.assertTrue(engine.bulk_capable)
+        bulk_gradesets = engine.grade_block(students)
+
+        for student, bulk_gradeset in zip(students, bulk_gradesets):
+            gradeset = grades.grade(student, self.factory.get('/'), self.course)
+            self.assertEqual(bulk_gradeset['percent'], gradeset['percent'])
+            self.assertEqual(bulk_gradeset['grade'], gradeset['grade'])
+            self.assertEqual(bulk_gradeset['section_breakdown'], gradeset['section_breakdown'])
+
     def test_submissions_api_overrides_scores(self):
         """
         Check that answering incorrectly is graded properly.
@@ -595,6 +638,137 @@ class TestCourseGrader(TestSubmittingProblems):
         self.assertEqual(self.score_for_hw('homework3'), [1.0, 1.0])
 
 
+@patch.dict(settings.FEATURES, {'ENABLE_PERSISTENT_SUBSECTION_GRADES': True})
+class TestPersistedSubsectionGrades(TestCourseGrader):
+    """
+    Runs the course grader suite with persisted subsection grades enabled, and
+    checks that the persisted scores are kept up to date.
+    """
+
+    def persisted_scores(self, section):
+        """
+        Returns the persisted (earned, possible) pairs for the given section.
+        """
+        subsection_grade = StudentSubsectionGrade.objects.get(
+            student=self.student_user,
+            course_id=self.course.id,
+            usage_key=section.location,
+        )
+        return [(score['earned'], score['possible']) for score in subsection_grade.get_scores()]
+
+    def test_scores_persisted_on_grade(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+        self.assertEqual(
+            sorted(self.persisted_scores(self.homework)),
+            [(0.0, 1.0), (0.0, 1.0), (1.0, 1.0)]
+        )
+
+    def test_scores_updated_incrementally(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        # Later submissions are applied to the persisted scores directly, and
+        # grading reads them back without rescoring the section.
+        self.submit_question_answer('p2', {'2_1': 'Correct'})
+        self.assertEqual(
+            sorted(self.persisted_scores(self.homework)),
+            [(0.0, 1.0), (1.0, 1.0), (1.0, 1.0)]
+        )
+        with patch('courseware.grades.get_score') as mock_get_score:
+            self.check_grade_percent(0.67)
+            self.assertFalse(mock_get_score.called)
+
+    def test_score_update_loads_only_containing_subsection(self):
+        self.dropping_setup()
+        self.submit_question_answer(self.hw1_names[0], {'2_1': 'Correct'})
+        self.check_grade_percent(0.25)
+
+        # Publishing a score only decodes the persisted subsection holding the problem
+        with patch.object(
+            StudentSubsectionGrade, 'get_scores', autospec=True, side_effect=StudentSubsectionGrade.get_scores
+        ) as mock_get_scores:
+            self.submit_question_answer(self.hw2_names[0], {'2_1': 'Correct'})
+            self.assertEqual(mock_get_scores.call_count, 1)
+        self.assertEqual(sorted(self.persisted_scores(self.homework2)), [(0.0, 1.0), (1.0, 1.0)])
+        self.assertEqual(sorted(self.persisted_scores(self.homework3)), [(0.0, 1.0), (0.0, 1.0)])
+        self.check_grade_percent(0.5)
+
+    def test_changed_problem_content_rescored(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        # Adding a response to an unattempted problem changes its maximum score
+        problem = self.store.get_item(self.problem_location('p2'))
+        problem.data = OptionResponseXMLFactory().build_xml(
+            question_text='The correct answer is Correct',
+            num_inputs=2,
+            weight=2,
+            options=['Correct', 'Incorrect'],
+            correct_option='Correct'
+        )
+        self.store.update_item(problem, self.student_user.id)
+        self.store.publish(problem.location, self.student_user.id)
+        self.refresh_course()
+        self.check_grade_percent(0.25)
+        self.assertEqual(
+            sorted(self.persisted_scores(self.homework)),
+            [(0.0, 1.0), (0.0, 2.0), (1.0, 1.0)]
+        )
+
+    def test_deleted_state_discards_persisted_scores(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        StudentModule.objects.filter(student=self.student_user, course_id=self.course.id).delete()
+        self.assertFalse(
+            StudentSubsectionGrade.objects.filter(student=self.student_user, course_id=self.course.id).exists()
+        )
+        self.check_grade_percent(0)
+
+
+@patch.dict(settings.FEATURES, {'CACHE_GRADING_STRUCTURE': True})
+class TestCachedGradingStructure(TestCourseGrader):
+    """
+    Runs the course grader suite with grading structures cached across
+    requests, and checks that they're reused until the course changes.
+    """
+    def setUp(self):
+        super(TestCachedGradingStructure, self).setUp()
+        cache.clear()
+
+    def test_structure_reused_across_course_loads(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        self.refresh_course()
+        with patch('courseware.grading_structure.build_grading_structure') as mock_build:
+            self.check_grade_percent(0.33)
+            self.assertFalse(mock_build.called)
+
+        # Changing the course changes its version, so the structure is rebuilt
+        self.add_dropdown_to_section(self.homework.location, 'p4', 1)
+        self.check_grade_percent(0.25)
+
+    def test_structure_rebuilt_after_bulk_operation(self):
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+
+        # Studio saves and publishes blocks inside bulk operations, during
+        # which the edit info of their ancestors isn't updated
+        with self.store.bulk_operations(self.course.id):
+            problem = self.add_dropdown_to_section(self.homework.location, 'p4', 1)
+            self.store.publish(problem.location, self.student_user.id)
+        self.refresh_course()
+        self.check_grade_percent(0.25)
+
+
 class ProblemWithUploadedFilesTest(TestSubmittingProblems):
     """Tests of problems with uploaded files."""
 
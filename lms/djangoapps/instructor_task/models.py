@@ -193,9 +193,10 @@ class InstructorTask(models.Model):
 class ReportStore(object):
     """
     Simple abstraction layer that can fetch and store CSV files for reports
-    download. Should probably refactor later to create a ReportFile object that
-    can simply be appended to for the sake of memory efficiency, rather than
-    passing in the whole dataset. Doing that for now just because it's simpler.
+    download. Reports can either be stored from a complete list of rows with
+    `store_rows()`, or streamed row by row through the `ReportRowsWriter`
+    returned by `rows_writer()`, which keeps memory use bounded regardless of
+    the size of the report.
     """
     @classmethod
     def from_config(cls):
@@ -304,12 +305,66 @@ class S3ReportStore(ReportStore):
         Even though we store it in gzip format, browsers will transparently
         download and decompress it. Filenames should end in `.csv`, not `.gz`.
         """
+        with self.rows_writer(course_id, filename) as writer:
+            writer.writerows(rows)
+
+    def rows_writer(self, course_id, filename):
+        """
+        Return a `ReportRowsWriter` that streams rows into a gzip'd csv file
+        named `filename` for `course_id`, uploading it to S3 in parts as it
+        grows. The file only becomes visible once the writer is closed without
+        error.
+        """
+        return S3ReportRowsWriter(self.key_for(course_id, filename))
+
+    def partial_key_for(self, course_id, report_name, part_name):
+        """
+        Return the S3 key for one part of a report that is being generated in
+        pieces. Parts live outside of the course's directory, so they are never
+        listed by `links_for()`.
+        """
+        hashed_course_id = hashlib.sha1(course_id.to_deprecated_string())
+
+        key = Key(self.bucket)
+        key.key = "{}/partials/{}/{}/{}".format(
+            self.root_path,
+            hashed_course_id.hexdigest(),
+            report_name,
+            part_name
+        )
+
+        return key
+
+    def store_partial_rows(self, course_id, report_name, part_name, rows):
+        """
+        Store `rows` as the part `part_name` of the report `report_name`, to be
+        combined later by `partial_rows()`.
+        """
         output_buffer = StringIO()
         gzip_file = GzipFile(fileobj=output_buffer, mode="wb")
         csv.writer(gzip_file).writerows(rows)
         gzip_file.close()
 
-        self.store(course_id, filename, output_buffer)
+        self.partial_key_for(course_id, report_name, part_name).set_contents_from_string(output_buffer.getvalue())
+
+    def partial_rows(self, course_id, report_name):
+        """
+        Yield the rows of every stored part of `report_name`, ordered by part
+        name.
+        """
+        report_dir = self.partial_key_for(course_id, report_name, '')
+        for key in sorted(self.bucket.list(prefix=report_dir.key), key=lambda key: key.key):
+            gzip_file = GzipFile(fileobj=StringIO(key.get_contents_as_string()), mode="rb")
+            for row in csv.reader(gzip_file):
+                yield row
+
+    def delete_partials(self, course_id, report_name):
+        """
+        Delete every stored part of `report_name`.
+        """
+        report_dir = self.partial_key_for(course_id, report_name, '')
+        for key in self.bucket.list(prefix=report_dir.key):
+            key.delete()
 
     def links_for(self, course_id):
         """
@@ -383,9 +438,71 @@ class LocalFSReportStore(ReportStore):
         Given a course_id, filename, and rows (each row is an iterable of strings),
         write this data out.
         """
-        output_buffer = StringIO()
-        csv.writer(output_buffer).writerows(rows)
-        self.store(course_id, filename, output_buffer)
+        with self.rows_writer(course_id, filename) as writer:
+            writer.writerows(rows)
+
+    def rows_writer(self, course_id, filename):
+        """
+        Return a `ReportRowsWriter` that streams rows into a temporary file,
+        which is moved into place as `filename` for `course_id` once the writer
+        is closed without error.
+        """
+        full_path = self.path_to(course_id, filename)
+        temp_dir = os.path.join(self.root_path, "tmp")
+        if not os.path.exists(temp_dir):
+            os.makedirs(temp_dir)
+        return LocalFSReportRowsWriter(full_path, os.path.join(temp_dir, str(uuid4())))
+
+    def partial_path_to(self, course_id, report_name, part_name):
+        """
+        Return the full path to one part of a report that is being generated in
+        pieces. Parts live outside of the course's directory, so they are never
+        listed by `links_for()`.
+        """
+        return os.path.join(
+            self.root_path,
+            "partials",
+            urllib.quote(course_id.to_deprecated_string(), safe=''),
+            report_name,
+            part_name
+        )
+
+    def store_partial_rows(self, course_id, report_name, part_name, rows):
+        """
+        Store `rows` as the part `part_name` of the report `report_name`, to be
+        combined later by `partial_rows()`.
+        """
+        full_path = self.partial_path_to(course_id, report_name, part_name)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        with open(full_path, "wb") as f:
+            csv.writer(f).writerows(rows)
+
+    def partial_rows(self, course_id, report_name):
+        """
+        Yield the rows of every stored part of `report_name`, ordered by part
+        name.
+        """
+        report_dir = self.partial_path_to(course_id, report_name, '')
+        if not os.path.exists(report_dir):
+            return
+        for part_name in sorted(os.listdir(report_dir)):
+            with open(os.path.join(report_dir, part_name), "rb") as f:
+                for row in csv.reader(f):
+                    yield row
+
+    def delete_partials(self, course_id, report_name):
+        """
+        Delete every stored part of `report_name`.
+        """
+        report_dir = self.partial_path_to(course_id, report_name, '')
+        if not os.path.exists(report_dir):
+            return
+        for part_name in os.listdir(report_dir):
+            os.remove(os.path.join(report_dir, part_name))
+        os.rmdir(report_dir)
 
     def links_for(self, course_id):
         """
@@ -405,3 +522,120 @@ class LocalFSReportStore(ReportStore):
             ],
             reverse=True
         )
+
+
+class ReportRowsWriter(object):
+    """
+    Writes the rows of a CSV report as they are produced, so that the whole
+    report never needs to be held in memory.
+
+    Use it as a context manager: the report is committed when the block exits
+    normally, and discarded if it raises, so only complete reports ever become
+    visible in the `ReportStore`.
+    """
+    def writerow(self, row):
+        """Write a single row to the report."""
+        raise NotImplementedError
+
+    def writerows(self, rows):
+        """Write every row in `rows` to the report."""
+        for row in rows:
+            self.writerow(row)
+
+    def commit(self):
+        """Finish writing the report and make it visible."""
+        raise NotImplementedError
+
+    def abort(self):
+        """Discard everything written to the report."""
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
+
+
+class S3ReportRowsWriter(ReportRowsWriter):
+    """
+    Streams rows into a gzip'd csv file on S3. Compressed output is buffered
+    until it reaches `PART_SIZE`, then sent as one part of a multipart upload;
+    reports smaller than a single part are uploaded with a plain PUT.
+    """
+    # S3 requires every part of a multipart upload but the last to be at least 5MB
+    PART_SIZE = 5 * 1024 * 1024
+
+    HEADERS = {
+        "Content-Encoding": "gzip",
+        "Content-Type": "text/csv",
+    }
+
+    def __init__(self, key):
+        self.key = key
+        self.buffer = StringIO()
+        self.gzip_file = GzipFile(fileobj=self.buffer, mode="wb")
+        self.csv_writer = csv.writer(self.gzip_file)
+        self.multipart_upload = None
+        self.num_parts = 0
+
+    def writerow(self, row):
+        self.csv_writer.writerow(row)
+        if self.buffer.tell() >= self.PART_SIZE:
+            self._upload_part()
+
+    def _upload_part(self):
+        """Upload the buffered compressed output as the next part."""
+        if self.multipart_upload is None:
+            self.multipart_upload = self.key.bucket.initiate_multipart_upload(self.key.key, headers=self.HEADERS)
+        self.num_parts += 1
+        self.buffer.seek(0)
+        self.multipart_upload.upload_part_from_file(self.buffer, self.num_parts)
+        self.buffer.seek(0)
+        self.buffer.truncate()
+
+    def commit(self):
+        self.gzip_file.close()
+        if self.multipart_upload is None:
+            data = self.buffer.getvalue()
+            headers = dict(self.HEADERS)
+            headers["Content-Length"] = len(data)
+            self.key.set_contents_from_string(data, headers=headers)
+        else:
+            if self.buffer.tell():
+                self._upload_part()
+            self.multipart_upload.complete_upload()
+
+    def abort(self):
+        if self.multipart_upload is not None:
+            self.multipart_upload.cancel_upload()
+
+
+class LocalFSReportRowsWriter(ReportRowsWriter):
+    """
+    Streams rows into a temporary file, which is renamed to its final path on
+    commit.
+    """
+    def __init__(self, full_path, temp_path):
+        self.full_path = full_path
+        self.temp_path = temp_path
+        self.temp_file = open(temp_path, "wb")
+        self.csv_writer = csv.writer(self.temp_file)
+
+    def writerow(self, row):
+        self.csv_writer.writerow(row)
+
+    def commit(self):
+        self.temp_file.close()
+        directory = os.path.dirname(self.full_path)
+        if not os.path.exists(directory):
+            os.mkdir(directory)
+        os.rename(self.temp_path, self.full_path)
+
+    def abort(self):
+        self.temp_file.close()
+        os.remove(self.temp_path)
@@ -6,10 +6,11 @@ import json
 from uuid import uuid4
 import math
 import psutil
+import traceback
 from contextlib import contextmanager
 
 from celery.utils.log import get_task_logger
-from celery.states import SUCCESS, READY_STATES, RETRY
+from celery.states import SUCCESS, FAILURE, READY_STATES, RETRY
 from dogapi import dog_stats_api
 
 from django.db import transaction, DatabaseError
@@ -442,10 +443,14 @@ def check_subtask_is_valid(entry_id, current_task_id, new_subtask_status):
         raise DuplicateTaskException(msg)
 
 
-def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count=0):
+def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count=0, on_complete=None):
     """
     Update the status of the subtask in the parent InstructorTask object tracking its progress.
 
+    If this is the last subtask to complete, `on_complete` (if given) is called
+    with the InstructorTask before it is marked as completed; see
+    `_update_subtask_status`.
+
     Because select_for_update is used to lock the InstructorTask object while it is being updated,
     multiple subtasks updating at the same time may time out while waiting for the lock.
     The actual update operation is surrounded by a try/except/else that permits the update to be
@@ -455,7 +460,7 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
     the attempting of retries has concluded.
     """
     try:
-        _update_subtask_status(entry_id, current_task_id, new_subtask_status)
+        _update_subtask_status(entry_id, current_task_id, new_subtask_status, on_complete)
     except DatabaseError:
         # If we fail, try again recursively.
         retry_count += 1
@@ -463,7 +468,7 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
             TASK_LOG.info("Retrying to update status for subtask %s of instructor task %d with status %s:  retry %d",
                           current_task_id, entry_id, new_subtask_status, retry_count)
             dog_stats_api.increment('instructor_task.subtask.retry_after_failed_update')
-            update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count)
+            update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_count, on_complete)
         else:
             TASK_LOG.info("Failed to update status after %d retries for subtask %s of instructor task %d with status %s",
                           retry_count, current_task_id, entry_id, new_subtask_status)
@@ -477,7 +482,7 @@ def update_subtask_status(entry_id, current_task_id, new_subtask_status, retry_c
 
 
 @transaction.commit_manually
-def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
+def _update_subtask_status(entry_id, current_task_id, new_subtask_status, on_complete=None):
     """
     Update the status of the subtask in the parent InstructorTask object tracking its progress.
 
@@ -503,6 +508,11 @@ def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
     information for each subtask.  At the moment, the value for each subtask (keyed by its task_id)
     is the value of the SubtaskStatus.to_dict(), but could be expanded in future to store information
     about failure messages, progress made, etc.
+
+    When this is the last subtask to complete, `on_complete` (if given) is called with the locked
+    InstructorTask, to finish the work of the task before its status is changed.  If it raises,
+    the InstructorTask's "status" is changed to FAILURE instead, and the error is stored in its
+    "task_output".
     """
     TASK_LOG.info("Preparing to update status for subtask %s for instructor task %d with status %s",
                   current_task_id, entry_id, new_subtask_status)
@@ -553,10 +563,17 @@ def _update_subtask_status(entry_id, current_task_id, new_subtask_status):
         # At present, we mark the task as having succeeded.  In future, we should see
         # if there was a catastrophic failure that occurred, and figure out how to
         # report that here.
-        if num_remaining <= 0:
-            entry.task_state = SUCCESS
         entry.subtasks = json.dumps(subtask_dict)
         entry.task_output = InstructorTask.create_output_for_success(task_progress)
+        if num_remaining <= 0:
+            entry.task_state = SUCCESS
+            if on_complete is not None:
+                try:
+                    on_complete(entry)
+                except Exception as exc:  # pylint: disable=broad-except
+                    TASK_LOG.exception("Completing instructor task %d failed", entry_id)
+                    entry.task_state = FAILURE
+                    entry.task_output = InstructorTask.create_output_for_failure(exc, traceback.format_exc())
 
         TASK_LOG.debug("about to save....")
         entry.save()
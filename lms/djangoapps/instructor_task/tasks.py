@@ -31,6 +31,9 @@ from instructor_task.tasks_helper import (
     reset_attempts_module_state,
     delete_problem_module_state,
     push_grades_to_s3,
+    perform_delegate_grade_report_batches,
+    generate_grade_report_batch,
+    grade_report_batch_info,
 )
 from bulk_email.tasks import perform_delegate_email_batches
 
@@ -137,5 +140,28 @@ def calculate_grades_csv(entry_id, xmodule_instance_args):
     Grade a course and push the results to an S3 bucket for download.
     """
     action_name = ugettext_noop('graded')
-    task_fn = partial(push_grades_to_s3, xmodule_instance_args)
+    if settings.FEATURES.get('ENABLE_GRADE_REPORT_SUBTASKS'):
+        task_fn = partial(perform_delegate_grade_report_batches, _create_grade_report_subtask)
+    else:
+        task_fn = partial(push_grades_to_s3, xmodule_instance_args)
     return run_main_task(entry_id, task_fn, action_name)
+
+
+def _create_grade_report_subtask(entry_id, report_filename, err_filename, to_list, initial_subtask_status):
+    """Creates a subtask to grade a batch of students for a grade report."""
+    student_ids = [item['pk'] for item in to_list]
+    report_info = grade_report_batch_info(report_filename, err_filename, student_ids)
+    return calculate_grades_csv_batch.subtask(
+        (entry_id, student_ids, report_info, initial_subtask_status.to_dict()),
+        task_id=initial_subtask_status.task_id,
+        routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+    )
+
+
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
+def calculate_grades_csv_batch(entry_id, student_ids, report_info, subtask_status_dict):
+    """
+    Grade a batch of the students in a course, as one of the subtasks of a
+    `calculate_grades_csv` task, and store their rows as part of the report.
+    """
+    return generate_grade_report_batch(entry_id, student_ids, report_info, subtask_status_dict)
@@ -6,11 +6,13 @@ running state of a course.
 import json
 import urllib
 from datetime import datetime
+from functools import partial
 from time import time
 
 from celery import Task, current_task
 from celery.utils.log import get_task_logger
 from celery.states import SUCCESS, FAILURE
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction, reset_queries
 from dogapi import dog_stats_api
@@ -19,11 +21,18 @@ from pytz import UTC
 from xmodule.modulestore.django import modulestore
 from track.views import task_track
 
+from courseware import grade_engine
 from courseware.grades import iterate_grades_for
 from courseware.models import StudentModule
 from courseware.model_data import FieldDataCache
 from courseware.module_render import get_module_for_descriptor_internal
 from instructor_task.models import ReportStore, InstructorTask, PROGRESS
+from instructor_task.subtasks import (
+    SubtaskStatus,
+    check_subtask_is_valid,
+    queue_subtasks_for_query,
+    update_subtask_status,
+)
 from student.models import CourseEnrollment
 
 # define different loggers for use within tasks and on client side
@@ -477,18 +486,70 @@ def delete_problem_module_state(xmodule_instance_args, _module_descriptor, stude
     return UPDATE_STATUS_SUCCEEDED
 
 
+def _iterate_grade_report_rows(course_id, students):
+    """
+    Grades `students` in the course, yielding a `(header, row, err_row)` tuple
+    for every student. For students that were graded, `header` is the list of
+    section labels and `row` is the student's CSV row; for students that
+    couldn't be graded, both are None and `err_row` is set instead.
+    """
+    if settings.FEATURES.get('ENABLE_BULK_GRADE_REPORTS'):
+        gradesets = grade_engine.iterate_grades_for(course_id, students)
+    else:
+        gradesets = iterate_grades_for(course_id, students)
+
+    header = None
+    for student, gradeset, err_msg in gradesets:
+        if gradeset:
+            # We were able to successfully grade this student for this course.
+            if not header:
+                # Encode the header row in utf-8 encoding in case there are unicode characters
+                header = [section['label'].encode('utf-8') for section in gradeset[u'section_breakdown']]
+
+            percents = {
+                section['label']: section.get('percent', 0.0)
+                for section in gradeset[u'section_breakdown']
+                if 'label' in section
+            }
+
+            # Not everybody has the same gradable items. If the item is not
+            # found in the user's gradeset, just assume it's a 0. The aggregated
+            # grades for their sections and overall course will be calculated
+            # without regard for the item they didn't have access to, so it's
+            # possible for a student to have a 0.0 show up in their row but
+            # still have 100% for the course.
+            row_percents = [percents.get(label, 0.0) for label in header]
+            row = [student.id, student.email.encode('utf-8'), student.username, gradeset['percent']] + row_percents
+            yield header, row, None
+        else:
+            # An empty gradeset means we failed to grade a student.
+            yield None, None, [student.id, student.username, err_msg]
+
+
+def _grade_report_filenames(course_id, start_time):
+    """
+    Returns the names of the grade report file and its error file for a report
+    started at `start_time`.
+    """
+    timestamp_str = start_time.strftime("%Y-%m-%d-%H%M")
+    course_id_prefix = urllib.quote(course_id.to_deprecated_string().replace("/", "_"))
+    report_name = u"{}_grade_report_{}".format(course_id_prefix, timestamp_str)
+    return u"{}.csv".format(report_name), u"{}_err.csv".format(report_name)
+
+
+GRADE_REPORT_HEADER = ["id", "email", "username", "grade"]
+GRADE_REPORT_ERR_HEADER = ["id", "username", "error_msg"]
+
+
 def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
     """
     For a given `course_id`, generate a grades CSV file for all students that
     are enrolled, and store using a `ReportStore`. Once created, the files can
     be accessed by instantiating another `ReportStore` (via
-    `ReportStore.from_config()`) and calling `link_for()` on it. Writes are
-    buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
-    that are visible in ReportStore will be complete ones.
-
-    As we start to add more CSV downloads, it will probably be worthwhile to
-    make a more general CSVDoc class instead of building out the rows like we
-    do here.
+    `ReportStore.from_config()`) and calling `link_for()` on it. Rows are
+    streamed to the `ReportStore` as students are graded, so memory use doesn't
+    grow with enrollment; files only become visible in the ReportStore once
+    they are complete.
     """
     start_time = datetime.now(UTC)
     status_interval = 100
@@ -516,66 +577,204 @@ def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input,
 
         return progress
 
-    # Loop over all our students and build our CSV lists in memory
-    header = None
-    rows = []
-    err_rows = [["id", "username", "error_msg"]]
-    for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
-        # Periodically update task status (this is a cache write)
-        if num_attempted % status_interval == 0:
-            update_task_progress()
-        num_attempted += 1
+    report_filename, err_filename = _grade_report_filenames(course_id, start_time)
+    report_store = ReportStore.from_config()
 
-        if gradeset:
-            # We were able to successfully grade this student for this course.
-            num_succeeded += 1
-            if not header:
-                # Encode the header row in utf-8 encoding in case there are unicode characters
-                header = [section['label'].encode('utf-8') for section in gradeset[u'section_breakdown']]
-                rows.append(["id", "email", "username", "grade"] + header)
+    # Loop over all our students and stream their rows into our CSV files.
+    # The error file is only created once the first student fails to grade.
+    err_writer = None
+    try:
+        with report_store.rows_writer(course_id, report_filename) as writer:
+            for header, row, err_row in _iterate_grade_report_rows(course_id, enrolled_students):
+                # Periodically update task status (this is a cache write)
+                if num_attempted % status_interval == 0:
+                    update_task_progress()
+                num_attempted += 1
+
+                if row is not None:
+                    num_succeeded += 1
+                    if num_succeeded == 1:
+                        writer.writerow(GRADE_REPORT_HEADER + header)
+                    writer.writerow(row)
+                else:
+                    num_failed += 1
+                    if err_writer is None:
+                        err_writer = report_store.rows_writer(course_id, err_filename)
+                        err_writer.writerow(GRADE_REPORT_ERR_HEADER)
+                    err_writer.writerow(err_row)
+
+            # By this point, every row has been written; all that's left is to
+            # finish uploading our CSV files.
+            curr_step = "Uploading CSVs"
+            update_task_progress()
+    except Exception:
+        if err_writer is not None:
+            err_writer.abort()
+        raise
 
-            percents = {
-                section['label']: section.get('percent', 0.0)
-                for section in gradeset[u'section_breakdown']
-                if 'label' in section
-            }
+    if err_writer is not None:
+        err_writer.commit()
 
-            # Not everybody has the same gradable items. If the item is not
-            # found in the user's gradeset, just assume it's a 0. The aggregated
-            # grades for their sections and overall course will be calculated
-            # without regard for the item they didn't have access to, so it's
-            # possible for a student to have a 0.0 show up in their row but
-            # still have 100% for the course.
-            row_percents = [percents.get(label, 0.0) for label in header]
-            rows.append([student.id, student.email.encode('utf-8'), student.username, gradeset['percent']] + row_percents)
-        else:
-            # An empty gradeset means we failed to grade a student.
-            num_failed += 1
-            err_rows.append([student.id, student.username, err_msg])
+    # One last update before we close out...
+    return update_task_progress()
 
-    # By this point, we've got the rows we're going to stuff into our CSV files.
-    curr_step = "Uploading CSVs"
-    update_task_progress()
 
-    # Generate parts of the file name
-    timestamp_str = start_time.strftime("%Y-%m-%d-%H%M")
-    course_id_prefix = urllib.quote(course_id.to_deprecated_string().replace("/", "_"))
+def perform_delegate_grade_report_batches(create_subtask_fcn, entry_id, course_id, _task_input, action_name):
+    """
+    Generates a grade report by splitting the enrolled students of the course
+    into batches of no more than settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK, and
+    queueing a subtask for each batch.
+
+    `create_subtask_fcn` is called as `create_subtask_fcn(entry_id,
+    report_filename, err_filename, to_list, initial_subtask_status)` and should
+    return a celery subtask that calls `generate_grade_report_batch()` for the
+    students in `to_list`, with the `report_info` returned by
+    `grade_report_batch_info()`.
+
+    Each subtask grades its students and stores its rows as a part of the
+    report in the `ReportStore`. The parts are merged into the final report
+    files by whichever subtask completes last, before the InstructorTask is
+    marked as completed.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
 
-    # Perform the actual upload
-    report_store = ReportStore.from_config()
-    report_store.store_rows(
-        course_id,
-        u"{}_grade_report_{}.csv".format(course_id_prefix, timestamp_str),
-        rows
+    # If subtasks have already been defined, the task was requeued: don't
+    # queue a second set of subtasks.
+    if len(entry.subtasks) > 0 and len(entry.task_output) > 0:
+        TASK_LOG.warning(u"Task %s has already been processed for grade report! InstructorTask = %s", entry.task_id, entry)
+        return json.loads(entry.task_output)
+
+    report_filename, err_filename = _grade_report_filenames(course_id, datetime.now(UTC))
+    return queue_subtasks_for_query(
+        entry,
+        action_name,
+        partial(create_subtask_fcn, entry_id, report_filename, err_filename),
+        CourseEnrollment.users_enrolled_in(course_id).order_by('id'),
+        [],
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK,
     )
 
-    # If there are any error rows (don't count the header), write them out as well
-    if len(err_rows) > 1:
-        report_store.store_rows(
+
+def grade_report_batch_info(report_filename, err_filename, student_ids):
+    """
+    Returns the `report_info` of the grade report subtask that grades the
+    students with `student_ids`. Batches are queued in order of student id, so
+    naming the stored parts after their first student keeps the merged report
+    in that order.
+    """
+    return {
+        'report_filename': report_filename,
+        'err_filename': err_filename,
+        'part_name': u"part-{:010d}".format(min(student_ids)),
+    }
+
+
+def generate_grade_report_batch(entry_id, student_ids, report_info, subtask_status_dict):
+    """
+    Grades the students with ids `student_ids` in the course of the
+    InstructorTask `entry_id`, and stores their rows as one part of the grade
+    report described by `report_info`.
+
+    The subtask's progress is recorded in the parent InstructorTask; when it is
+    the last subtask to finish, the stored parts are merged into the final
+    report files before the InstructorTask is marked as completed. If the merge
+    fails, the InstructorTask is marked as failed instead.
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    course_id = InstructorTask.objects.get(pk=entry_id).course_id
+    report_store = ReportStore.from_config()
+    report_filename = report_info['report_filename']
+    err_filename = report_info['err_filename']
+    part_name = report_info['part_name']
+    merged = []
+
+    def merge_report(_entry):
+        """Merges the stored parts into the final report files."""
+        merged.append(True)
+        _merge_grade_report(course_id, report_store, report_filename, err_filename)
+
+    def update_status():
+        """Records the subtask's status, merging the report if it is the last subtask to finish."""
+        update_subtask_status(entry_id, current_task_id, subtask_status, on_complete=merge_report)
+        # The parts are only deleted once the status update that merged them is committed
+        if merged:
+            report_store.delete_partials(course_id, report_filename)
+            report_store.delete_partials(course_id, err_filename)
+
+    try:
+        students = User.objects.filter(id__in=student_ids).order_by('id')
+        rows = []
+        err_rows = []
+        header = None
+        for row_header, row, err_row in _iterate_grade_report_rows(course_id, students):
+            if row is not None:
+                header = header or row_header
+                rows.append(row)
+            else:
+                err_rows.append(err_row)
+
+        if rows:
+            report_store.store_partial_rows(course_id, report_filename, part_name, [GRADE_REPORT_HEADER + header] + rows)
+        if err_rows:
+            report_store.store_partial_rows(course_id, err_filename, part_name, err_rows)
+    except Exception as exc:
+        TASK_LOG.exception(u"Grade report subtask %s for instructor task %s: failed unexpectedly!", current_task_id, entry_id)
+        _store_failed_grade_report_batch(course_id, report_store, report_info, student_ids, exc)
+        subtask_status.increment(failed=len(student_ids), state=FAILURE)
+        # A failed subtask can still be the last one to finish, in which case
+        # it merges whatever parts the other subtasks stored.
+        update_status()
+        raise
+
+    subtask_status.increment(succeeded=len(rows), failed=len(err_rows), state=SUCCESS)
+    update_status()
+    return subtask_status.to_dict()
+
+
+def _store_failed_grade_report_batch(course_id, report_store, report_info, student_ids, exc):
+    """
+    Replaces the stored parts of a batch that failed with an error row for
+    every one of its students, so that the merged report agrees with the
+    batch being counted as failed.
+    """
+    part_name = report_info['part_name']
+    err_msg = u"Grade report batch failed: {}".format(exc)
+    try:
+        report_store.store_partial_rows(course_id, report_info['report_filename'], part_name, [])
+        report_store.store_partial_rows(
             course_id,
-            u"{}_grade_report_{}_err.csv".format(course_id_prefix, timestamp_str),
-            err_rows
+            report_info['err_filename'],
+            part_name,
+            [
+                [student.id, student.username.encode('utf-8'), err_msg.encode('utf-8')]
+                for student in User.objects.filter(id__in=student_ids).order_by('id')
+            ]
         )
+    except Exception:  # pylint: disable=broad-except
+        TASK_LOG.exception(u"Could not store the error rows of a failed grade report batch")
 
-    # One last update before we close out...
-    return update_task_progress()
+
+def _merge_grade_report(course_id, report_store, report_filename, err_filename):
+    """
+    Merges the stored parts of the grade report into the final report files.
+    """
+    with report_store.rows_writer(course_id, report_filename) as writer:
+        wrote_header = False
+        for row in report_store.partial_rows(course_id, report_filename):
+            # Every part starts with its own copy of the header row
+            if row[:len(GRADE_REPORT_HEADER)] == GRADE_REPORT_HEADER:
+                if wrote_header:
+                    continue
+                wrote_header = True
+            writer.writerow(row)
+
+    err_rows = report_store.partial_rows(course_id, err_filename)
+    first_err_row = next(err_rows, None)
+    if first_err_row is not None:
+        with report_store.rows_writer(course_id, err_filename) as writer:
+            writer.writerow(GRADE_REPORT_ERR_HEADER)
+            writer.writerow(first_err_row)
+            writer.writerows(err_rows)
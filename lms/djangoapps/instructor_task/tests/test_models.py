@@ -0,0 +1,92 @@
+"""
+Tests for the streaming writers of `ReportStore`s.
+"""
+import csv
+import os
+import shutil
+from cStringIO import StringIO
+from gzip import GzipFile
+from tempfile import mkdtemp
+
+from mock import Mock
+from django.test import TestCase
+
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
+
+from instructor_task.models import LocalFSReportStore, S3ReportRowsWriter
+
+
+class LocalFSReportRowsWriterTest(TestCase):
+    """
+    Test streaming rows into a `LocalFSReportStore`.
+    """
+    def setUp(self):
+        self.root_path = mkdtemp()
+        self.report_store = LocalFSReportStore(self.root_path)
+        self.course_id = SlashSeparatedCourseKey("edX", "report", "2014")
+
+    def tearDown(self):
+        shutil.rmtree(self.root_path)
+
+    def test_commit(self):
+        with self.report_store.rows_writer(self.course_id, 'report.csv') as writer:
+            writer.writerow(['a', 'b'])
+            writer.writerows([['1', '2'], ['3', '4']])
+            # Nothing is visible until the writer is closed
+            self.assertEqual(self.report_store.links_for(self.course_id), [])
+
+        with open(self.report_store.path_to(self.course_id, 'report.csv')) as report_file:
+            self.assertEqual(list(csv.reader(report_file)), [['a', 'b'], ['1', '2'], ['3', '4']])
+
+    def test_abort(self):
+        with self.assertRaises(ValueError):
+            with self.report_store.rows_writer(self.course_id, 'report.csv') as writer:
+                writer.writerow(['a', 'b'])
+                raise ValueError()
+
+        self.assertEqual(self.report_store.links_for(self.course_id), [])
+        self.assertEqual(os.listdir(os.path.join(self.root_path, 'tmp')), [])
+
+
+class S3ReportRowsWriterTest(TestCase):
+    """
+    Test streaming rows to S3.
+    """
+    def setUp(self):
+        self.key = Mock()
+        self.multipart_upload = self.key.bucket.initiate_multipart_upload.return_value
+        self.parts = []
+        self.multipart_upload.upload_part_from_file.side_effect = lambda fp, num: self.parts.append(fp.read())
+
+    def test_small_report_uses_single_upload(self):
+        with S3ReportRowsWriter(self.key) as writer:
+            writer.writerow(['a', 'b'])
+
+        self.assertFalse(self.key.bucket.initiate_multipart_upload.called)
+        data = self.key.set_contents_from_string.call_args[0][0]
+        self.assertEqual(GzipFile(fileobj=StringIO(data)).read(), 'a,b\r\n')
+
+    def test_large_report_uses_multipart_upload(self):
+        writer = S3ReportRowsWriter(self.key)
+        writer.PART_SIZE = 64
+        with writer:
+            for i in xrange(20000):
+                writer.writerow([str(i), os.urandom(16).encode('hex')])
+
+        self.assertFalse(self.key.set_contents_from_string.called)
+        self.assertTrue(self.multipart_upload.complete_upload.called)
+        self.assertGreater(len(self.parts), 1)
+        rows = list(csv.reader(GzipFile(fileobj=StringIO(''.join(self.parts)))))
+        self.assertEqual(len(rows), 20000)
+
+    def test_abort_cancels_multipart_upload(self):
+        writer = S3ReportRowsWriter(self.key)
+        writer.PART_SIZE = 64
+        with self.assertRaises(ValueError):
+            with writer:
+                for i in xrange(20000):
+                    writer.writerow([str(i), os.urandom(16).encode('hex')])
+                raise ValueError()
+
+        self.assertTrue(self.multipart_upload.cancel_upload.called)
+        self.assertFalse(self.multipart_upload.complete_upload.called)
@@ -4,10 +4,14 @@ Unit tests for LMS instructor-initiated background tasks helper functions.
 Tests that CSV grade report generation works with unicode emails.
 
 """
+import json
 import os
 import shutil
+from contextlib import contextmanager
+from uuid import uuid4
 
 import ddt
+from celery.states import SUCCESS, FAILURE
 from mock import Mock, patch
 
 from django.conf import settings
@@ -17,7 +21,15 @@ from xmodule.modulestore.tests.factories import CourseFactory
 
 from student.tests.factories import CourseEnrollmentFactory, UserFactory
 
-from instructor_task.tasks_helper import push_grades_to_s3
+from instructor_task import tasks_helper
+from instructor_task.models import LocalFSReportStore, ReportStore
+from instructor_task.tasks_helper import (
+    push_grades_to_s3,
+    perform_delegate_grade_report_batches,
+    generate_grade_report_batch,
+    grade_report_batch_info,
+)
+from instructor_task.tests.factories import InstructorTaskFactory
 
 
 TEST_COURSE_ORG = 'edx'
@@ -58,3 +70,201 @@ class TestInstructorGradeReport(TestCase):
             result = push_grades_to_s3(None, None, self.course.id, None, 'graded')
         #This assertion simply confirms that the generation completed with no errors
         self.assertEquals(result['succeeded'], result['attempted'])
+
+    @patch.dict(settings.GRADES_DOWNLOAD, {'STORAGE_TYPE': 'localfs'})
+    def test_grade_report_subtasks(self):
+        """
+        Test that a grade report split into subtasks is merged into a single
+        report once every subtask has run.
+        """
+        for i in range(5):
+            self.create_student('student{0}'.format(i), 'student{0}@example.com'.format(i))
+
+        entry = InstructorTaskFactory.create(
+            course_id=self.course.id,
+            task_type='grade_course',
+            task_id=str(uuid4()),
+            task_output='',
+            subtasks='',
+        )
+
+        def run_subtask(entry_id, report_filename, err_filename, to_list, initial_subtask_status):
+            """Returns a fake subtask that runs the batch synchronously when queued."""
+            student_ids = [item['pk'] for item in to_list]
+            subtask = Mock()
+            subtask.apply_async.side_effect = lambda: generate_grade_report_batch(
+                entry_id,
+                student_ids,
+                grade_report_batch_info(report_filename, err_filename, student_ids),
+                initial_subtask_status.to_dict(),
+            )
+            return subtask
+
+        with patch('instructor_task.tasks_helper.check_subtask_is_valid'):
+            with patch.object(settings, 'GRADES_DOWNLOAD_STUDENTS_PER_TASK', 2):
+                perform_delegate_grade_report_batches(run_subtask, entry.id, self.course.id, {}, 'graded')
+
+        subtasks = json.loads(entry.__class__.objects.get(pk=entry.id).subtasks)
+        self.assertEqual(subtasks['total'], 3)
+        self.assertEqual(subtasks['succeeded'], 3)
+
+        report_store = ReportStore.from_config()
+        links = report_store.links_for(self.course.id)
+        self.assertEqual(len(links), 1)
+        with open(report_store.path_to(self.course.id, links[0][0])) as report_file:
+            rows = report_file.read().splitlines()
+        self.assertEqual(len(rows), 6)
+        self.assertTrue(rows[0].startswith('id,email,username,grade'))
+
+    def _run_grade_report_subtasks(self, entry, fail_batches=(), failure=None):
+        """
+        Runs the grade report of `entry` over subtasks of 2 students each,
+        synchronously. The subtasks whose batch numbers are in `fail_batches`
+        are run in the `failure` context, by default one in which grading
+        raises an error, and must raise an error.
+        """
+        batches = []
+
+        def run_subtask(entry_id, report_filename, err_filename, to_list, initial_subtask_status):
+            """Returns a fake subtask that runs the batch synchronously when queued."""
+            batch = len(batches)
+            batches.append(batch)
+            student_ids = [item['pk'] for item in to_list]
+            report_info = grade_report_batch_info(report_filename, err_filename, student_ids)
+
+            def apply_async():
+                """Runs the batch, failing it if it's one of `fail_batches`."""
+                args = (entry_id, student_ids, report_info, initial_subtask_status.to_dict())
+                if batch not in fail_batches:
+                    return generate_grade_report_batch(*args)
+                failure_context = failure() if failure else patch(
+                    'instructor_task.tasks_helper._iterate_grade_report_rows', side_effect=ValueError
+                )
+                with failure_context:
+                    with self.assertRaises(Exception):
+                        generate_grade_report_batch(*args)
+            subtask = Mock()
+            subtask.apply_async.side_effect = apply_async
+            return subtask
+
+        with patch('instructor_task.tasks_helper.check_subtask_is_valid'):
+            with patch.object(settings, 'GRADES_DOWNLOAD_STUDENTS_PER_TASK', 2):
+                perform_delegate_grade_report_batches(run_subtask, entry.id, self.course.id, {}, 'graded')
+
+    def _create_grade_report_entry(self):
+        """Enrolls 5 students, and returns the InstructorTask of a grade report of the course."""
+        for i in range(5):
+            self.create_student('student{0}'.format(i), 'student{0}@example.com'.format(i))
+        return InstructorTaskFactory.create(
+            course_id=self.course.id,
+            task_type='grade_course',
+            task_id=str(uuid4()),
+            task_output='',
+            subtasks='',
+        )
+
+    def _report_rows(self, report_store, errors=False):
+        """Returns the lines of the grade report file, or of its error file."""
+        links = [name for name, __ in report_store.links_for(self.course.id) if name.endswith('_err.csv') == errors]
+        self.assertEqual(len(links), 1)
+        with open(report_store.path_to(self.course.id, links[0])) as report_file:
+            return report_file.read().splitlines()
+
+    @patch.dict(settings.GRADES_DOWNLOAD, {'STORAGE_TYPE': 'localfs'})
+    def test_grade_report_subtask_fails_after_storing_rows(self):
+        """
+        Test that the students of a failed subtask are only reported in the
+        error file, even if the subtask had already stored their rows.
+        """
+        iterate_grade_report_rows = tasks_helper._iterate_grade_report_rows
+        store_partial_rows = LocalFSReportStore.store_partial_rows
+
+        @contextmanager
+        def fail_after_storing_rows():
+            """Grading also reports an error, and storing it fails."""
+            calls = []
+
+            def iterate(course_id, students):
+                """Grades the students, then reports an error for a missing one."""
+                for item in iterate_grade_report_rows(course_id, students):
+                    yield item
+                yield None, None, [0, 'missing', 'not graded']
+
+            def store(report_store, *args):
+                """Stores the first part, and fails to store the second."""
+                calls.append(args)
+                if len(calls) == 2:
+                    raise IOError
+                store_partial_rows(report_store, *args)
+
+            with patch('instructor_task.tasks_helper._iterate_grade_report_rows', side_effect=iterate):
+                with patch.object(LocalFSReportStore, 'store_partial_rows', autospec=True, side_effect=store):
+                    yield
+
+        entry = self._create_grade_report_entry()
+        self._run_grade_report_subtasks(entry, fail_batches=(0,), failure=fail_after_storing_rows)
+
+        subtasks = json.loads(entry.__class__.objects.get(pk=entry.id).subtasks)
+        self.assertEqual(subtasks['failed'], 1)
+        report_store = ReportStore.from_config()
+        self.assertEqual(len(self._report_rows(report_store, errors=True)), 1 + 2)
+        self.assertEqual(len(self._report_rows(report_store)), 1 + 3)
+
+    @patch.dict(settings.GRADES_DOWNLOAD, {'STORAGE_TYPE': 'localfs'})
+    def test_grade_report_last_subtask_fails(self):
+        """
+        Test that the report is still merged, from the parts that were stored,
+        when the last subtask to finish fails, and that the students of the
+        failed subtask are listed in the error file.
+        """
+        entry = self._create_grade_report_entry()
+        self._run_grade_report_subtasks(entry, fail_batches=(2,))
+
+        entry = entry.__class__.objects.get(pk=entry.id)
+        subtasks = json.loads(entry.subtasks)
+        self.assertEqual(subtasks['succeeded'], 2)
+        self.assertEqual(subtasks['failed'], 1)
+        self.assertEqual(entry.task_state, SUCCESS)
+
+        report_store = ReportStore.from_config()
+        self.assertEqual(len(self._report_rows(report_store)), 1 + 4)
+        self.assertEqual(len(self._report_rows(report_store, errors=True)), 1 + 1)
+
+    @patch.dict(settings.GRADES_DOWNLOAD, {'STORAGE_TYPE': 'localfs'})
+    def test_grade_report_merged_before_completion(self):
+        """
+        Test that the InstructorTask is only marked as completed once the
+        report has been merged.
+        """
+        entry = self._create_grade_report_entry()
+        merge_grade_report = tasks_helper._merge_grade_report
+        states = []
+
+        def merge(*args):
+            """Records the stored state of the InstructorTask when the merge runs."""
+            states.append(entry.__class__.objects.get(pk=entry.id).task_state)
+            merge_grade_report(*args)
+
+        with patch('instructor_task.tasks_helper._merge_grade_report', side_effect=merge):
+            self._run_grade_report_subtasks(entry)
+
+        self.assertEqual(len(states), 1)
+        self.assertNotEqual(states[0], SUCCESS)
+        self.assertEqual(entry.__class__.objects.get(pk=entry.id).task_state, SUCCESS)
+
+    @patch.dict(settings.GRADES_DOWNLOAD, {'STORAGE_TYPE': 'localfs'})
+    def test_grade_report_merge_fails(self):
+        """
+        Test that a failed merge is recorded as a failure of the InstructorTask.
+        """
+        entry = self._create_grade_report_entry()
+        with patch('instructor_task.models.LocalFSReportStore.rows_writer', side_effect=IOError("disk full")):
+            self._run_grade_report_subtasks(entry)
+
+        entry = entry.__class__.objects.get(pk=entry.id)
+        self.assertEqual(entry.task_state, FAILURE)
+        self.assertEqual(json.loads(entry.task_output)['exception'], 'IOError')
+
+        report_store = ReportStore.from_config()
+        self.assertEqual(report_store.links_for(self.course.id), [])
+        self.assertEqual(os.listdir(report_store.partial_path_to(self.course.id, '', '')), [])
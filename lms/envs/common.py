@@ -287,6 +287,35 @@ FEATURES = {
     # False to not redirect the user
     'ALWAYS_REDIRECT_HOMEPAGE_TO_DASHBOARD_FOR_AUTHENTICATED_USER': True,
 
+    # Persist per-subsection problem scores for each student and update them
+    # incrementally as scores are published, so that grading and the progress
+    # page only rescore subsections whose inputs have changed.
+    'ENABLE_PERSISTENT_SUBSECTION_GRADES': False,
+
+    # Compute grade reports for blocks of students at once, reading scores in
+    # bulk instead of grading students one at a time.
+    'ENABLE_BULK_GRADE_REPORTS': False,
+
+    # Split grade reports into subtasks that grade batches of students in
+    # parallel across workers, and merge their output when all are done.
+    'ENABLE_GRADE_REPORT_SUBTASKS': False,
+
+    # Remember which anonymous user ids are already stored, rather than
+    # checking for them in the database on every use.
+    'ENABLE_ANONYMOUS_USER_ID_REGISTRY': False,
+
+    # Cache the course and org roles of users across requests, rather than
+    # querying them on every request that checks for staff access.
+    'CACHE_COURSE_ACCESS_ROLES': False,
+
+    # Cache the enrollment states of users, on the request's user and across
+    # requests, rather than querying them for every enrollment check.
+    'CACHE_COURSE_ENROLLMENTS': False,
+
+    # Cache the grading structure of courses across requests, keyed by the
+    # version of their content, rather than walking the course tree to grade.
+    'CACHE_GRADING_STRUCTURE': False,
+
 }
 
 # Ignore static asset files on import which match this pattern
@@ -560,6 +589,19 @@ XBLOCK_SELECT_FUNCTION = prefer_xmodules
 
 MODULESTORE_BRANCH = 'published-only'
 CONTENTSTORE = None
+
+# Local disk cache of the course assets served by the contentserver middleware
+# that are too large for memcached, e.g.
+#     {
+#         'ROOT': '/edx/var/edxapp/contentserver',
+#         'MAX_BYTES': 10 * 1024 * 1024 * 1024,
+#         # Optionally, let the web server send the cached files with X-Sendfile,
+#         # or with X-Accel-Redirect and an internal location serving ROOT
+#         'SENDFILE_HEADER': 'X-Accel-Redirect',
+#         'SENDFILE_URL_PREFIX': '/contentserver/',
+#     }
+CONTENTSERVER_DISK_CACHE = None
+
 DOC_STORE_CONFIG = {
     'host': 'localhost',
     'db': 'xmodule',
@@ -1493,6 +1535,10 @@ GRADES_DOWNLOAD = {
     'ROOT_PATH': '/tmp/edx-s3/grades',
 }
 
+# Number of students graded by each subtask when grade reports are split into
+# subtasks (see the ENABLE_GRADE_REPORT_SUBTASKS feature flag)
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = 1000
+
 ######################## PROGRESS SUCCESS BUTTON ##############################
 # The following fields are available in the URL: {course_id} {student_id}
 PROGRESS_SUCCESS_BUTTON_URL = 'http://<domain>/<path>/{course_id}'